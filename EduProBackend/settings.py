@@ -118,6 +118,53 @@ else:
         }
     }
 
+if DEBUG:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': 'redis://localhost:6379/1',
+        }
+    }
+
+# Seconds a cached public catalog response is kept; writes invalidate it
+# earlier through the generation counters in api/catalog_cache.py
+CATALOG_CACHE_TTL = 300
+
+# PostgreSQL text search configuration of the course search index; 'simple'
+# does not stem, which keeps Arabic and English titles searchable alike
+COURSE_SEARCH_CONFIG = 'simple'
+
+# Seconds a student's course and module entitlements are cached; enrollment
+# changes drop the cached copy as soon as they commit
+ACCESS_CACHE_TTL = 60
+
+# Seconds a compiled assessment answer key is kept in the shared cache, and
+# how many key versions each process keeps in memory. Editing a question or
+# option starts a new version, so neither ever serves a stale key
+ANSWER_KEY_CACHE_TTL = 24 * 60 * 60
+ANSWER_KEY_LOCAL_SIZE = 256
+
+# Seconds the rendered question paper of an assessment is cached for the
+# exam start endpoint; question, option and assessment edits replace it
+QUESTION_PAPER_CACHE_TTL = 60 * 60
+
+# Autosaved answers are buffered in the cache per attempt and written to
+# the database once AUTOSAVE_FLUSH_SIZE questions are buffered or the
+# oldest change is AUTOSAVE_FLUSH_INTERVAL seconds old. The buffer must
+# outlive the longest exam, submit and expiry apply what is left of it.
+AUTOSAVE_FLUSH_SIZE = 20
+AUTOSAVE_FLUSH_INTERVAL = 60
+AUTOSAVE_BUFFER_TTL = 24 * 60 * 60
+# Seconds a request may hold the autosave buffer of an attempt; a request
+# that waits this long for it is answered 409 and resent by the client
+AUTOSAVE_LOCK_TIMEOUT = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -186,6 +233,16 @@ SIMPLE_JWT = {
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
 }
 
+# Authenticate requests from the user type, username, slug and profile id
+# carried in the access token instead of loading the user. Deactivating a
+# user then takes effect when their access token expires and the refresh
+# is refused, rather than on the next request
+JWT_STATELESS_AUTH = True
+
+# Seconds a teacher's username -> profile id resolution is cached for the
+# student login and refresh endpoints; renames and deletes drop it at once
+TEACHER_RESOLVER_TTL = 600
+
 
 JAZZMIN_SETTINGS = {
     "site_title": "EduPro",
@@ -218,15 +275,75 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'course.tasks.check_expired_enrollments',
         'schedule': crontab(hour=0, minute=0),  
     },
+    # backstop; each attempt start also queues a sweep for its deadline
      'check-expired-attempts': {
         'task': 'assessments.tasks.expire_old_attempts',
         'schedule': crontab(minute='*'),
     },
+    'reconcile-video-statuses': {
+        'task': 'course.tasks.reconcile_video_statuses_task',
+        'schedule': crontab(minute='*/5'),
+    },
 }
 
+# Rows expired per UPDATE by the expiry sweeps
+EXPIRY_SWEEP_BATCH_SIZE = 1000
+
+# Attempt deadlines within this many seconds of each other share one
+# expiry sweep queued for the end of the window (see assessments/deadlines.py)
+ATTEMPT_EXPIRY_ETA_GRANULARITY = 5
+
+# Lesson progress provisioning: rows per bulk insert, and the number of
+# students above which a new lesson's rows are created by a Celery task
+PROGRESS_PROVISION_BATCH_SIZE = 1000
+PROGRESS_PROVISION_ASYNC_THRESHOLD = 500
+
+# 'eager' keeps a StudentLessonProgress row for every lesson a student can
+# access; 'sparse' only stores completed lessons. Run
+# `manage.py convert_lesson_progress --to <mode>` after switching.
+LESSON_PROGRESS_MODE = 'eager'
+
+# VdoCipher playback OTPs are requested with VDOCIPHER_OTP_TTL seconds of
+# validity and cached per (user, video) for a shorter time
+VDOCIPHER_OTP_TTL = 300
+VDOCIPHER_OTP_CACHE_TTL = 240
+VDOCIPHER_MAX_CONCURRENCY = 8
+
+# Shared VdoCipher client: (connect, read) timeouts in seconds, retries on
+# 429/5xx, and the circuit breaker's failure threshold and cool-down
+VDOCIPHER_API_URL = 'https://dev.vdocipher.com/api'
+VDOCIPHER_TIMEOUT = (3.05, 15)
+VDOCIPHER_MAX_RETRIES = 3
+VDOCIPHER_CIRCUIT_THRESHOLD = 5
+VDOCIPHER_CIRCUIT_RESET_TIMEOUT = 30
+
+# Shared token VdoCipher sends back on webhook calls (?token=...), and the
+# number of processing lessons checked per batch by the reconciler
+VDOCIPHER_WEBHOOK_SECRET = config('VDOCIPHER_WEBHOOK_SECRET', default='')
+VIDEO_STATUS_RECONCILE_BATCH_SIZE = 50
+
 
 DATA_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50MB
-FILE_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50MB
+# uploaded files above this are spooled to a temp file instead of RAM, and
+# then moved (not copied) into storage
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440  # 2.5MB
+
+# Resumable video uploads: bytes read from the request per write, and the
+# largest file a teacher can declare
+VIDEO_UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # 4MB
+VIDEO_UPLOAD_MAX_SIZE = 10 * 1024 * 1024 * 1024  # 10GB
+# Seconds one PATCH may hold an upload; an abandoned lock frees itself then
+VIDEO_UPLOAD_LOCK_TIMEOUT = 60 * 60
+
+# Image renditions written by api.tasks.process_image_task: name -> the box
+# (width, height) each copy is fitted into
+IMAGE_RENDITIONS = {
+    'list': (400, 300),
+    'detail': (800, 600),
+    'retina': (1600, 1200),
+}
+IMAGE_RENDITION_FORMAT = 'WEBP'
+IMAGE_RENDITION_QUALITY = 80
 
 
 # Email Setting
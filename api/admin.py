@@ -1,5 +1,13 @@
 from django.contrib import admin
+from .models import ImageRendition
  
 # Register your models here.
 
 
+class ImageRenditionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'content_type', 'object_id', 'field_name', 'content_hash', 'updated_at')
+    list_filter = ('content_type', 'field_name')
+    search_fields = ('object_id', 'source_name')
+
+
+admin.site.register(ImageRendition, ImageRenditionAdmin)
@@ -0,0 +1,112 @@
+"""
+Read-through cache for the public catalog endpoints.
+
+Responses are cached under a key that embeds the generation of every scope
+they depend on (``courses``, ``course:<id>``, ``categories``, ``teachers``).
+Writes to courses, modules, ratings, categories and teacher profiles bump
+those generations once their transaction commits, so stale entries are
+never read again; they simply expire. A generation is the millisecond
+timestamp of the last bump. That doubles as ``Last-Modified``, and it
+feeds the ``ETag``. A conditional request is answered with a 304 from two
+cache reads, without touching the database.
+
+Counters that change through bulk UPDATEs without a write signal (such as
+``total_enrollments``) may lag by at most ``CATALOG_CACHE_TTL`` seconds.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from course.deferred import defer, pending
+from rest_framework import status
+from rest_framework.response import Response
+import hashlib
+import time
+
+GENERATION_PREFIX = 'catalog:gen:'
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def generations(scopes):
+    """``{scope: generation}``; scopes never bumped (or evicted) start at now."""
+    keys = {scope: f'{GENERATION_PREFIX}{scope}' for scope in scopes}
+    stored = cache.get_many(keys.values())
+    missing = {key: _now_ms() for key in keys.values() if key not in stored}
+    if missing:
+        for key, value in missing.items():
+            cache.add(key, value, timeout=None)
+        stored.update(cache.get_many(missing))
+    return {scope: stored[key] for scope, key in keys.items()}
+
+
+def _bump(items):
+    keys = [f'{GENERATION_PREFIX}{scope}' for scope in items]
+    current = cache.get_many(keys)
+    now = _now_ms()
+    cache.set_many({key: max(now, current.get(key, 0) + 1) for key in keys}, timeout=None)
+
+
+def bump(*scopes):
+    """Invalidate every cached response depending on ``scopes`` once the transaction commits."""
+    for scope in scopes:
+        defer('catalog-cache', scope, flush=_bump)
+
+
+def bump_pending(scope):
+    """Whether ``scope`` was changed in the current transaction and is yet to be bumped."""
+    return scope in pending('catalog-cache')
+
+
+class CachedResponseMixin:
+    """
+    For read-only views whose response does not depend on the user. Define
+    ``get_cache_scopes()`` to list what the response is built from.
+    """
+    cache_scopes = ('courses',)
+
+    def get_cache_scopes(self):
+        return self.cache_scopes
+
+    def _cache_key(self, request, versions):
+        parts = [
+            type(self).__name__,
+            request.get_host(),
+            request.get_full_path(),
+            getattr(request, 'accepted_media_type', ''),
+            *(f'{scope}={version}' for scope, version in sorted(versions.items())),
+        ]
+        return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+    def _not_modified(self, request, etag, last_modified):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return if_modified_since is not None and int(last_modified) <= if_modified_since
+
+    def get(self, request, *args, **kwargs):
+        versions = generations(self.get_cache_scopes())
+        key = self._cache_key(request, versions)
+        etag = quote_etag(key[:32])
+        last_modified = max(versions.values()) // 1000
+
+        if self._not_modified(request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            data = cache.get(f'catalog:response:{key}')
+            if data is not None:
+                response = Response(data)
+            else:
+                response = super().get(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(f'catalog:response:{key}', response.data, timeout=settings.CATALOG_CACHE_TTL)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        # shared caches may keep it, but must revalidate before reuse
+        response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+        return response
@@ -0,0 +1,173 @@
+"""
+Image renditions.
+
+Uploaded images are never resized in the request. When an image field
+changes, ``process_image_task`` runs after the transaction commits. It
+hashes the stored file and, only if the content differs from what was last
+processed, writes a WEBP copy for every size in ``IMAGE_RENDITIONS``. The
+paths are recorded on an ``ImageRendition`` row. The original upload is
+left untouched.
+"""
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+from .models import ImageRendition
+import hashlib
+import io
+import logging
+
+logger = logging.getLogger(__name__)
+
+# model label -> image fields that get renditions
+IMAGE_FIELDS = {
+    'course.Lesson': ('thumbnail',),
+    'course.Course': ('thumbnail',),
+    'course.CourseCategory': ('icon',),
+    'userAuth.User': ('avatar', 'logo'),
+    'assessments.Question': ('image',),
+}
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def file_hash(fieldfile):
+    """SHA-256 of a stored file, read in chunks."""
+    digest = hashlib.sha256()
+    with fieldfile.storage.open(fieldfile.name, 'rb') as source:
+        for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def render(image, size):
+    """A copy of ``image`` fitted inside ``size`` (never enlarged), encoded for storage."""
+    copy = image.copy()
+    copy.thumbnail(size, Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    copy.save(buffer, format=settings.IMAGE_RENDITION_FORMAT, quality=settings.IMAGE_RENDITION_QUALITY)
+    return buffer.getvalue()
+
+
+def _write_renditions(fieldfile, prefix):
+    extension = settings.IMAGE_RENDITION_FORMAT.lower()
+    with fieldfile.storage.open(fieldfile.name, 'rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    paths = {}
+    for name, size in settings.IMAGE_RENDITIONS.items():
+        path = f'{prefix}/{name}.{extension}'
+        # the prefix contains the content hash, so an existing file is already right
+        if not default_storage.exists(path):
+            path = default_storage.save(path, ContentFile(render(image, size)))
+        paths[name] = path
+    return paths
+
+
+def _delete_files(paths):
+    for path in paths:
+        try:
+            default_storage.delete(path)
+        except OSError as e:
+            logger.warning(f"Could not delete rendition {path}: {e}")
+
+
+def process_image(model_label, pk, field_name):
+    """
+    Brings the renditions of one image field up to date. Returns True when
+    new renditions were written, False when nothing had to be done.
+    """
+    model = apps.get_model(model_label)
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None:
+        return False
+
+    content_type = ContentType.objects.get_for_model(model)
+    record = ImageRendition.objects.filter(content_type=content_type, object_id=pk, field_name=field_name).first()
+    fieldfile = getattr(instance, field_name)
+
+    if not fieldfile:
+        if record is not None:
+            record.delete()
+            _delete_files(record.renditions.values())
+        return False
+
+    try:
+        content_hash = file_hash(fieldfile)
+    except OSError as e:
+        logger.warning(f"Could not read {model_label} {pk} {field_name}: {e}")
+        return False
+
+    if record is not None and record.content_hash == content_hash:
+        if record.source_name != fieldfile.name:
+            record.source_name = fieldfile.name
+            record.save(update_fields=['source_name', 'updated_at'])
+        return False
+
+    prefix = f'renditions/{content_type.app_label}/{content_type.model}/{pk}/{field_name}/{content_hash[:16]}'
+    try:
+        paths = _write_renditions(fieldfile, prefix)
+    except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+        logger.warning(f"Skipping renditions of {model_label} {pk} {field_name}: {e}")
+        return False
+
+    if record is None:
+        record = ImageRendition(content_type=content_type, object_id=pk, field_name=field_name)
+    stale = set(record.renditions.values()) - set(paths.values())
+    record.source_name = fieldfile.name
+    record.content_hash = content_hash
+    record.renditions = paths
+    record.save()
+    _delete_files(stale)
+
+    logger.info(f"Wrote {len(paths)} renditions for {model_label} {pk} {field_name}.")
+    return True
+
+
+def schedule_image_processing(instance, field_name):
+    """Queues ``process_image_task`` for when the current transaction commits."""
+    from .tasks import process_image_task
+
+    model_label = instance._meta.label
+    pk = str(instance.pk)
+    transaction.on_commit(lambda: process_image_task.delay(model_label, pk, field_name))
+
+
+def delete_renditions(model, pk):
+    """Drops every rendition of a deleted object; the files go once the delete commits."""
+    records = ImageRendition.objects.filter(content_type=ContentType.objects.get_for_model(model), object_id=pk)
+    paths = [path for renditions in records.values_list('renditions', flat=True) for path in renditions.values()]
+    records.delete()
+    if paths:
+        transaction.on_commit(lambda: _delete_files(paths))
+
+
+def rendition_urls(objects, field_name, request=None):
+    """
+    ``{pk: {rendition: url}}`` for ``objects`` with one query. Objects whose
+    image has not been processed yet are left out.
+    """
+    objects = list(objects)
+    if not objects:
+        return {}
+
+    content_type = ContentType.objects.get_for_model(objects[0])
+    records = ImageRendition.objects.filter(
+        content_type=content_type,
+        field_name=field_name,
+        object_id__in=[obj.pk for obj in objects],
+    ).values_list('object_id', 'renditions')
+
+    urls = {}
+    for object_id, renditions in records:
+        urls[object_id] = {
+            name: request.build_absolute_uri(default_storage.url(path)) if request else default_storage.url(path)
+            for name, path in renditions.items()
+        }
+    return urls
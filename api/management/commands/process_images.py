@@ -0,0 +1,20 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from api.images import IMAGE_FIELDS, process_image
+
+
+class Command(BaseCommand):
+    help = 'Writes missing or outdated image renditions. Images whose content is unchanged are skipped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(IMAGE_FIELDS), help='Only process this model.')
+
+    def handle(self, *args, **options):
+        labels = [options['model']] if options['model'] else list(IMAGE_FIELDS)
+
+        for label in labels:
+            model = apps.get_model(label)
+            for field in IMAGE_FIELDS[label]:
+                pks = model._default_manager.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).order_by('pk').values_list('pk', flat=True)
+                written = sum(process_image(label, str(pk), field) for pk in pks.iterator())
+                self.stdout.write(self.style.SUCCESS(f'{label}.{field}: {written} images processed.'))
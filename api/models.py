@@ -1,3 +1,32 @@
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
+import uuid
 
 # Create your models here.
+
+
+class ImageRendition(models.Model):
+    """
+    Resized copies of one image field of one object (a lesson thumbnail, a
+    user avatar, ...). ``content_hash`` is the SHA-256 of the source file the
+    renditions were made from, so unchanged images are never re-encoded.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, unique=True)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.UUIDField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    field_name = models.CharField(max_length=50)
+
+    source_name = models.CharField(max_length=255)
+    content_hash = models.CharField(max_length=64)
+    # {'list': 'renditions/...webp', 'detail': ..., 'retina': ...}
+    renditions = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.content_type.model} {self.object_id} {self.field_name}"
+
+    class Meta:
+        unique_together = ('content_type', 'object_id', 'field_name')
@@ -0,0 +1,128 @@
+"""
+Sparse ordering keys for modules, lessons, questions and options.
+
+Siblings are ``GAP`` apart, so an item is inserted or moved by writing its
+own row only: it takes the free key it asked for, or the midpoint between
+its new neighbours. Sibling rows are rewritten only when two neighbours
+have no key left between them. ``reorder`` applies a whole new order with
+one ``bulk_update``.
+"""
+
+from django.db import models
+import logging
+
+logger = logging.getLogger(__name__)
+
+GAP = 1024
+
+
+class OrderedMixin:
+    """
+    Mixed into models with an ``order`` field that is unique within
+    ``order_scope`` (the name of the parent foreign key). Call
+    ``place_in_order()`` from ``save()`` before writing the row.
+    """
+    order_scope = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remembered so a move needs no extra read of the old key
+        instance._loaded_order = instance.__dict__.get('order')
+        return instance
+
+    def order_siblings(self):
+        scope = f'{self.order_scope}_id'
+        return type(self)._default_manager.filter(**{scope: getattr(self, scope)}).exclude(pk=self.pk)
+
+    def place_in_order(self):
+        adding = self._state.adding
+        old_order = None if adding else getattr(self, '_loaded_order', None)
+        siblings = self.order_siblings()
+
+        if self.order is None:
+            if old_order is not None:
+                self.order = old_order
+            else:
+                last = siblings.aggregate(last=models.Max('order'))['last']
+                self.order = GAP if last is None else last + GAP
+            return
+
+        if old_order is not None and self.order == old_order:
+            return
+
+        holder = siblings.filter(order=self.order).values_list('pk', flat=True).first()
+        if holder is None:
+            return
+
+        # an occupied key means "in that item's place": before it when
+        # inserting or moving up, after it when moving down
+        before = old_order is None or self.order < old_order
+        key = _between(siblings, self.order, before)
+        if key is None:
+            keys = rebalance(siblings)
+            key = _between(siblings, keys[holder], before)
+        self.order = key
+
+    def remember_order(self):
+        self._loaded_order = self.order
+
+
+def _between(siblings, key, before):
+    """Midpoint between ``key`` and its neighbour, or None when they are adjacent."""
+    if before:
+        lower = siblings.filter(order__lt=key).aggregate(key=models.Max('order'))['key'] or 0
+        upper = key
+    else:
+        lower = key
+        upper = siblings.filter(order__gt=key).aggregate(key=models.Min('order'))['key']
+        if upper is None:
+            return key + GAP
+    if upper - lower < 2:
+        return None
+    return (lower + upper) // 2
+
+
+def rebalance(siblings):
+    """Spreads ``siblings`` ``GAP`` apart again, keeping their order. Returns ``{pk: key}``."""
+    items = list(siblings.order_by('order', 'pk').only('pk', 'order'))
+    changed = []
+    for position, item in enumerate(items, start=1):
+        if item.order != position * GAP:
+            item.order = position * GAP
+            changed.append(item)
+    if changed:
+        siblings.model._default_manager.bulk_update(changed, ['order'])
+        logger.info(f"Rebalanced {len(changed)} {siblings.model._meta.verbose_name_plural} ordering keys.")
+    return {item.pk: item.order for item in items}
+
+
+def apply_order(items, ids):
+    """
+    Sets ``order`` on the in-memory ``items`` (``{pk: instance}``, all
+    siblings of one parent) to follow ``ids``, which must list each of them
+    exactly once. Returns the instances whose key changed, unsaved.
+    """
+    if len(ids) != len(set(ids)) or set(ids) != set(items):
+        raise ValueError('ids must list every item exactly once.')
+
+    changed = []
+    for position, pk in enumerate(ids, start=1):
+        item = items[pk]
+        if item.order != position * GAP:
+            item.order = position * GAP
+            changed.append(item)
+    return changed
+
+
+def reorder(queryset, ids):
+    """
+    Gives the items of ``queryset`` the order of ``ids`` (see
+    ``apply_order``). Only rows whose key changes are written. Returns
+    ``{pk: key}``.
+    """
+    items = {item.pk: item for item in queryset.only('pk', 'order')}
+    changed = apply_order(items, ids)
+    if changed:
+        queryset.model._default_manager.bulk_update(changed, ['order'])
+    return {pk: items[pk].order for pk in ids}
@@ -0,0 +1,67 @@
+from django.db.models.manager import BaseManager
+from rest_framework import serializers
+from .images import rendition_urls
+
+
+class ReorderSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+
+    def validate_ids(self, value):
+        if len(value) != len(set(value)):
+            raise serializers.ValidationError("Each id may only appear once.")
+        return value
+
+
+def prefetch_renditions(context, objects, field_name):
+    """Loads the rendition urls of ``objects`` into ``context`` with one query."""
+    renditions = context.setdefault('renditions', {})
+    missing = [
+        obj for obj in objects
+        if getattr(obj, field_name) and (obj._meta.label, field_name, obj.pk) not in renditions
+    ]
+    urls = rendition_urls(missing, field_name, context.get('request'))
+    for obj in missing:
+        renditions[obj._meta.label, field_name, obj.pk] = urls.get(obj.pk)
+
+
+class RenditionsField(serializers.Field):
+    """
+    ``{'list': url, 'detail': url, 'retina': url}`` of an image field, or
+    None while there is no image or it has not been processed yet.
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, obj):
+        if not getattr(obj, self.image_field):
+            return None
+        key = (obj._meta.label, self.image_field, obj.pk)
+        if key not in self.context.get('renditions', {}):
+            prefetch_renditions(self.context, [obj], self.image_field)
+        return self.context['renditions'][key]
+
+
+def _prefetch_nested_renditions(serializer, objects, context):
+    for field in serializer.fields.values():
+        if isinstance(field, RenditionsField):
+            prefetch_renditions(context, objects, field.image_field)
+        elif isinstance(field, serializers.Serializer):
+            related = []
+            for obj in objects:
+                for attr in field.source_attrs:
+                    obj = getattr(obj, attr, None)
+                if obj is not None:
+                    related.append(obj)
+            _prefetch_nested_renditions(field, related, context)
+
+
+class RenditionsListSerializer(serializers.ListSerializer):
+    """Fetches the renditions of a whole list, nested objects included, before rendering it."""
+
+    def to_representation(self, data):
+        objects = list(data.all() if isinstance(data, BaseManager) else data)
+        _prefetch_nested_renditions(self.child, objects, self.context)
+        return super().to_representation(objects)
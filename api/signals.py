@@ -0,0 +1,88 @@
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_delete, post_init, post_save
+from course.models import Course, CourseCategory, CourseModule, Rating
+from userAuth.models import TeacherProfile, TeacherStudentProfile, User
+from .catalog_cache import bump
+from .images import IMAGE_FIELDS, delete_renditions, schedule_image_processing
+from .models import ImageRendition
+
+
+def _file_name(value):
+    return (getattr(value, 'name', value) or '') if value else ''
+
+
+def remember_image_names(sender, instance, **kwargs):
+    # read from __dict__ so deferred image fields are not loaded
+    instance._loaded_image_names = {
+        field: _file_name(instance.__dict__.get(field)) for field in IMAGE_FIELDS[sender._meta.label]
+    }
+
+
+def queue_changed_images(sender, instance, created, update_fields=None, **kwargs):
+    loaded = getattr(instance, '_loaded_image_names', {})
+    for field in IMAGE_FIELDS[sender._meta.label]:
+        if update_fields is not None and field not in update_fields:
+            continue
+        name = _file_name(getattr(instance, field))
+        previous = '' if created else loaded.get(field, '')
+        if name != previous:
+            schedule_image_processing(instance, field)
+        loaded[field] = name
+    instance._loaded_image_names = loaded
+
+
+def drop_renditions(sender, instance, **kwargs):
+    delete_renditions(sender, instance.pk)
+
+
+for label in IMAGE_FIELDS:
+    model = apps.get_model(label)
+    post_init.connect(remember_image_names, sender=model, dispatch_uid=f'image_names_{label}')
+    post_save.connect(queue_changed_images, sender=model, dispatch_uid=f'image_renditions_{label}')
+    post_delete.connect(drop_renditions, sender=model, dispatch_uid=f'image_renditions_delete_{label}')
+
+
+# public catalog cache generations
+
+def invalidate_course(sender, instance, created=False, **kwargs):
+    bump('courses', f'course:{instance.pk}')
+    # the storefront shows the teacher's course count
+    if created or kwargs.get('signal') is post_delete:
+        bump('teachers')
+
+
+def invalidate_course_parts(sender, instance, **kwargs):
+    bump('courses', f'course:{instance.course_id}')
+
+
+def invalidate_categories(sender, instance, **kwargs):
+    bump('courses', 'categories')
+
+
+def invalidate_renditions(sender, instance, **kwargs):
+    # renditions are written after the image was saved, into cached pages
+    model = ContentType.objects.get_for_id(instance.content_type_id).model_class()
+    if model is Course:
+        bump('courses', f'course:{instance.object_id}')
+    elif model is CourseCategory:
+        bump('courses', 'categories')
+
+
+def invalidate_teachers(sender, instance, created=False, **kwargs):
+    # a brand new teacher has nothing cached yet
+    if sender is not TeacherStudentProfile and created:
+        return
+    if sender is User and instance.user_type != User.userType.TEACHER:
+        return
+    bump('teachers')
+
+
+for signal in (post_save, post_delete):
+    signal.connect(invalidate_course, sender=Course, dispatch_uid=f'catalog_course_{signal is post_save}')
+    signal.connect(invalidate_course_parts, sender=CourseModule, dispatch_uid=f'catalog_module_{signal is post_save}')
+    signal.connect(invalidate_course_parts, sender=Rating, dispatch_uid=f'catalog_rating_{signal is post_save}')
+    signal.connect(invalidate_categories, sender=CourseCategory, dispatch_uid=f'catalog_category_{signal is post_save}')
+    signal.connect(invalidate_renditions, sender=ImageRendition, dispatch_uid=f'catalog_rendition_{signal is post_save}')
+    for model in (TeacherProfile, TeacherStudentProfile, User):
+        signal.connect(invalidate_teachers, sender=model, dispatch_uid=f'catalog_{model._meta.model_name}_{signal is post_save}')
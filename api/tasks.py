@@ -0,0 +1,8 @@
+from celery import shared_task
+from .images import process_image
+
+
+@shared_task
+def process_image_task(model_label, pk, field_name):
+    # re-encodes only when the stored file's content hash changed
+    return process_image(model_label, pk, field_name)
@@ -6,6 +6,19 @@ from django.utils import timezone
 from datetime import timedelta
 from django.core.exceptions import ValidationError
 from django.db.utils import IntegrityError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from unittest.mock import patch
+from PIL import Image
+from api.images import process_image, rendition_urls
+from api.models import ImageRendition
+import io
+import itertools
+import shutil
+import tempfile
 from userAuth.models import User, TeacherProfile, StudentProfile
 from course.models import Course, CourseModule, Lesson, CourseEnrollment, ModuleEnrollment
 from assessments.models import (
@@ -110,6 +123,61 @@ class BaseTestSetup(APITestCase):
             assessment=self.assessment
         )
 
+
+_phones = itertools.count(3000000100)
+
+
+class ExamSetupMixin:
+    """
+    A teacher, enrolled students, a course and a true/false exam for the
+    attempt, grading and autosave tests. Each class passes what it varies.
+    """
+
+    def make_course(self, prefix, students=1):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.teacher = User.objects.create(
+            username=f'{prefix}_teacher', email=f'{prefix}_teacher@example.com', phone=str(next(_phones)), user_type='teacher'
+        ).teacher_profile
+        self.students = [
+            User.objects.create(
+                username=f'{prefix}_student{i}', email=f'{prefix}_student{i}@example.com', phone=str(next(_phones)), user_type='student'
+            )
+            for i in range(students)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course = Course.objects.create(title=f"{prefix.title()} Course", teacher=self.teacher)
+            for student in self.students:
+                CourseEnrollment.objects.create(
+                    student=student.student_profile,
+                    course=self.course,
+                    access_type=CourseEnrollment.AccessType.FULL_ACCESS,
+                )
+
+    def add_exam(self, questions=2, mark=1, **assessment_kwargs):
+        assessment = Assessment.objects.create(
+            assessment_type=Assessment.AssessmentType.COURSE_EXAM,
+            teacher=self.teacher,
+            course=self.course,
+            **assessment_kwargs,
+        )
+        for i in range(questions):
+            question = Question.objects.create(
+                assessment=assessment, question_text=f"Q{i}", question_type=Question.QuestionType.TRUE_FALSE, mark=mark
+            )
+            QuestionOption.objects.create(question=question, option_text="True", is_correct=True)
+            QuestionOption.objects.create(question=question, option_text="False", is_correct=False)
+        return assessment
+
+    def make_exam(self, prefix, students=1, questions=2, mark=1, **assessment_kwargs):
+        self.make_course(prefix, students)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.add_exam(questions, mark, title=f"{prefix.title()} Exam", **assessment_kwargs)
+
+    def right_options(self, assessment):
+        return list(QuestionOption.objects.filter(question__assessment=assessment, is_correct=True).order_by('question__order'))
+
 # ---
 ## Model Tests
 
@@ -196,31 +264,22 @@ class TestQuestionModel(BaseTestSetup):
             mark=5,
             order=None
         )
-        self.assertEqual(new_question.order, 4)
+        self.assertEqual(list(self.assessment.questions.all())[-1], new_question)
 
     def test_save_method_reorders_existing_questions(self):
-        # Change order of question 3 to 1
-        self.question3.order = 1
+        # Move question 3 into question 1's place
+        self.question3.order = self.question1.order
         self.question3.save()
         
-        # Check if question 1 and 2 orders are shifted
-        self.question1.refresh_from_db()
-        self.question2.refresh_from_db()
-        self.assertEqual(self.question3.order, 1)
-        self.assertEqual(self.question1.order, 2)
-        self.assertEqual(self.question2.order, 3)
+        self.assertEqual(list(self.assessment.questions.all()), [self.question3, self.question1, self.question2])
         self.assertEqual(self.assessment.questions.count(), 3)
         
     def test_delete_question_reorders_questions(self):
-        # Delete question 1 (order 1)
+        # Delete question 1
         self.question1.delete()
         
-        # Check if other questions are reordered correctly
-        self.question2.refresh_from_db()
-        self.question3.refresh_from_db()
-        
-        self.assertEqual(self.question2.order, 1)
-        self.assertEqual(self.question3.order, 2)
+        # the remaining questions keep their relative order
+        self.assertEqual(list(self.assessment.questions.all()), [self.question2, self.question3])
         
         self.assertEqual(self.assessment.questions.count(), 2)
 
@@ -511,4 +570,520 @@ class TestStudentViews(BaseTestSetup):
             kwargs={'attempt_id': self.student_attempt.id}
         )
         response = self.client.get(detail_url)
-        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+class TestAttemptExpirySweep(ExamSetupMixin, TestCase):
+    def setUp(self):
+        self.make_course('sweep', students=3)
+        self.timed = self.add_exam(
+            0, title="Timed Exam", is_published=True, is_timed=True, time_limit=10, max_attempts=5,
+        )
+        self.untimed = self.add_exam(0, title="Untimed Exam", is_published=True, max_attempts=5)
+
+    def _attempt(self, student, assessment, minutes_ago):
+        attempt = StudentAssessmentAttempt.objects.create(student=student.student_profile, assessment=assessment)
+        started_at = timezone.now() - timedelta(minutes=minutes_ago)
+        StudentAssessmentAttempt.objects.filter(pk=attempt.pk).update(
+            started_at=started_at, deadline_at=assessment.deadline_for(started_at)
+        )
+        return attempt
+
+    def test_expires_timed_out_and_closed_attempts(self):
+        from assessments.tasks import expire_attempts
+
+        timed_out = self._attempt(self.students[0], self.timed, 15)
+        running = self._attempt(self.students[1], self.timed, 5)
+        closed = self._attempt(self.students[2], self.untimed, 120)
+        # moves the deadline of the attempt in progress
+        self.untimed.available_until = timezone.now() - timedelta(minutes=1)
+        self.untimed.save()
+
+        metrics = expire_attempts()
+        self.assertEqual(metrics['expired'], 2)
+
+        timed_out.refresh_from_db()
+        running.refresh_from_db()
+        closed.refresh_from_db()
+        self.assertEqual(timed_out.status, StudentAssessmentAttempt.AttemptStatus.EXPIRED)
+        # ended at its deadline, not when the sweep ran
+        self.assertAlmostEqual(timed_out.time_taken, 10 * 60, delta=5)
+        self.assertIsNotNone(timed_out.ended_at)
+        self.assertEqual(running.status, StudentAssessmentAttempt.AttemptStatus.IN_PROGRESS)
+        self.assertEqual(closed.status, StudentAssessmentAttempt.AttemptStatus.EXPIRED)
+
+    def test_sweep_cost_does_not_depend_on_rows_in_progress(self):
+        from assessments.tasks import expire_attempts
+
+        for student in self.students:
+            self._attempt(student, self.timed, 1)
+
+        # one empty candidate batch
+        with self.assertNumQueries(1):
+            metrics = expire_attempts()
+        self.assertEqual(metrics['scanned'], 0)
+
+
+class TestAttemptDeadlines(ExamSetupMixin, APITestCase):
+    def setUp(self):
+        self.assessment = self.make_exam(
+            'deadline',
+            is_published=True,
+            is_timed=True,
+            time_limit=30,
+            available_until=timezone.now() + timedelta(minutes=20),
+        )
+        self.questions = list(self.assessment.questions.all())
+        self.student_user = self.students[0]
+
+    @patch('assessments.tasks.expire_old_attempts.apply_async')
+    def test_start_stores_deadline_and_queues_one_sweep(self, mock_apply_async):
+        self.client.force_authenticate(user=self.student_user)
+        url = reverse('student-start-assessment', kwargs={
+            'assessment_id': self.assessment.id, 'teacher_username': 'deadline_teacher',
+        })
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+
+        attempt = StudentAssessmentAttempt.objects.get()
+        # the window closes before the time limit runs out
+        self.assertEqual(attempt.deadline_at, self.assessment.available_until)
+        mock_apply_async.assert_called_once()
+        self.assertGreaterEqual(mock_apply_async.call_args.kwargs['eta'], attempt.deadline_at)
+
+        # another start with a deadline in the same window queues nothing
+        from assessments.deadlines import schedule_expiry
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule_expiry(attempt.deadline_at)
+        mock_apply_async.assert_called_once()
+
+    def test_changing_the_time_limit_moves_deadlines(self):
+        attempt = StudentAssessmentAttempt.objects.create(student=self.student_user.student_profile, assessment=self.assessment)
+        self.assessment.time_limit = 5
+        self.assessment.save()
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.deadline_at, attempt.started_at + timedelta(minutes=5))
+
+    def test_expired_attempts_are_graded_with_autosaved_answers(self):
+        from assessments.autosave import autosave
+        from assessments.grading import answer_key
+        from assessments.tasks import expire_attempts
+
+        attempt = StudentAssessmentAttempt.objects.create(student=self.student_user.student_profile, assessment=self.assessment)
+        right = self.questions[0].options.get(is_correct=True)
+        autosave(attempt, [{'question_id': self.questions[0].id, 'selected_option': right.id}], answer_key(self.assessment.id))
+        StudentAssessmentAttempt.objects.filter(pk=attempt.pk).update(deadline_at=timezone.now() - timedelta(seconds=1))
+
+        metrics = expire_attempts()
+        self.assertEqual(metrics['expired'], 1)
+
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.status, StudentAssessmentAttempt.AttemptStatus.EXPIRED)
+        self.assertEqual(attempt.score, 1)
+        self.assertEqual(attempt.percentage, 50)
+        self.assertIsNotNone(attempt.graded_at)
+        # the unanswered question gets its row too
+        self.assertEqual(attempt.answers.count(), 2)
+
+
+class TestBatchGrading(ExamSetupMixin, APITestCase):
+    def setUp(self):
+        self.make_course('grading')
+        self.student_user = self.students[0]
+
+    def _exam(self, size):
+        assessment = self.add_exam(size, mark=2, title=f"Exam of {size}", is_published=True, max_attempts=5)
+        answers = []
+        for i, right in enumerate(self.right_options(assessment)):
+            # every other answer is right
+            selected = right if i % 2 == 0 else right.question.options.get(is_correct=False)
+            answers.append({'question_id': str(right.question_id), 'selected_option': str(selected.id)})
+        attempt = StudentAssessmentAttempt.objects.create(student=self.student_user.student_profile, assessment=assessment)
+        StudentAnswer.objects.bulk_create([StudentAnswer(attempt=attempt, question=q) for q in assessment.questions.all()])
+        return attempt, answers
+
+    def _submit(self, attempt, answers):
+        self.client.force_authenticate(user=self.student_user)
+        url = reverse('student-submit-attempt', kwargs={'attempt_id': attempt.id})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, {'answers': answers}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return len(queries)
+
+    def test_submit_grades_and_scores_in_one_pass(self):
+        attempt, answers = self._exam(4)
+        self._submit(attempt, answers)
+
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.status, StudentAssessmentAttempt.AttemptStatus.GRADED)
+        self.assertEqual(attempt.score, 4)
+        self.assertEqual(attempt.percentage, 50)
+        self.assertFalse(attempt.is_passed)
+        self.assertTrue(attempt.auto_graded)
+        self.assertIsNotNone(attempt.ended_at)
+        self.assertEqual(attempt.answers.filter(is_correct=True, auto_graded=True).count(), 2)
+
+    def test_query_count_does_not_grow_with_questions(self):
+        # the first request also caches the student's entitlements
+        self._submit(*self._exam(1))
+        small = self._submit(*self._exam(3))
+        large = self._submit(*self._exam(30))
+        self.assertEqual(small, large)
+
+    def test_option_of_another_question_is_rejected(self):
+        attempt, answers = self._exam(2)
+        answers[0]['selected_option'] = answers[1]['selected_option']
+        self.client.force_authenticate(user=self.student_user)
+        url = reverse('student-submit-attempt', kwargs={'attempt_id': attempt.id})
+        response = self.client.patch(url, {'answers': answers}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("does not belong", str(response.data))
+
+
+class TestAnswerKeyCache(ExamSetupMixin, TestCase):
+    def setUp(self):
+        from assessments.grading import _versioned_key
+
+        _versioned_key.cache_clear()
+        self.assessment = self.make_exam('key', students=0, questions=1, mark=3)
+        self.question = self.assessment.questions.get()
+        self.true = self.question.options.get(is_correct=True)
+        self.false = self.question.options.get(is_correct=False)
+
+    def test_key_is_built_once_per_version(self):
+        from assessments.grading import answer_key
+
+        key = answer_key(self.assessment.id)
+        self.assertEqual(key[self.question.id].correct, {self.true.id})
+        self.assertEqual(key[self.question.id].options, {self.true.id, self.false.id})
+        self.assertEqual(key[self.question.id].mark, 3)
+        with self.assertNumQueries(0):
+            self.assertIs(answer_key(self.assessment.id), key)
+
+    def test_editing_an_option_starts_a_new_version(self):
+        from assessments.grading import answer_key
+
+        answer_key(self.assessment.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.false.is_correct = True
+            self.false.save()
+            # read from the database until the edit commits
+            self.assertEqual(answer_key(self.assessment.id)[self.question.id].correct, {self.true.id, self.false.id})
+        self.assertEqual(answer_key(self.assessment.id)[self.question.id].correct, {self.true.id, self.false.id})
+
+    def test_publishing_builds_the_key(self):
+        from assessments.grading import answer_key
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assessment.is_published = True
+            self.assessment.save()
+        with self.assertNumQueries(0):
+            answer_key(self.assessment.id)
+
+
+class TestExamStart(ExamSetupMixin, APITestCase):
+    def setUp(self):
+        self.assessment = self.make_exam('start', students=3, questions=3, max_attempts=3, is_published=True)
+        self.url = reverse('student-start-assessment', kwargs={
+            'assessment_id': self.assessment.id, 'teacher_username': 'start_teacher',
+        })
+
+    def _start(self, student):
+        self.client.force_authenticate(user=student)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url)
+        return response, [query['sql'] for query in queries.captured_queries]
+
+    def test_start_renders_the_paper_once(self):
+        first, _ = self._start(self.students[0])
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED, first.data)
+        self.assertEqual(len(first.data['assessment']['questions']), 3)
+
+        second, queries = self._start(self.students[1])
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED, second.data)
+        self.assertEqual(second.data['assessment'], first.data['assessment'])
+        # assessment, entitlements, attempt limits and the insert in a savepoint
+        self.assertEqual(len(queries), 6)
+        self.assertFalse(any('assessments_question' in sql for sql in queries))
+        self.assertFalse(StudentAnswer.objects.exists())
+
+    def test_second_start_is_rejected(self):
+        response, _ = self._start(self.students[0])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response, _ = self._start(self.students[0])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("in progress", str(response.data))
+        self.assertEqual(StudentAssessmentAttempt.objects.filter(student=self.students[0].student_profile).count(), 1)
+
+    def test_editing_a_question_replaces_the_paper(self):
+        self._start(self.students[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            Question.objects.filter(assessment=self.assessment).first().delete()
+        response, _ = self._start(self.students[1])
+        self.assertEqual(len(response.data['assessment']['questions']), 2)
+
+    def test_submit_creates_the_answer_rows(self):
+        response, _ = self._start(self.students[0])
+        question = self.assessment.questions.first()
+        url = reverse('student-submit-attempt', kwargs={'attempt_id': response.data['attempt_id']})
+        response = self.client.patch(url, {'answers': [
+            {'question_id': str(question.id), 'selected_option': str(question.options.get(is_correct=True).id)},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+
+        attempt = StudentAssessmentAttempt.objects.get()
+        self.assertEqual(attempt.answers.count(), 3)
+        self.assertEqual(attempt.score, 1)
+        self.assertEqual(attempt.status, StudentAssessmentAttempt.AttemptStatus.GRADED)
+
+
+class TestAnswerAutosave(ExamSetupMixin, APITestCase):
+    def setUp(self):
+        assessment = self.make_exam('autosave', questions=3, is_published=True)
+        self.right = self.right_options(assessment)
+        self.student_user = self.students[0]
+        self.attempt = StudentAssessmentAttempt.objects.create(student=self.student_user.student_profile, assessment=assessment)
+        self.client.force_authenticate(user=self.student_user)
+        self.url = reverse('student-autosave-attempt', kwargs={'attempt_id': self.attempt.id})
+
+    def _answer(self, i):
+        return {'question_id': str(self.right[i].question_id), 'selected_option': str(self.right[i].id)}
+
+    def test_answers_are_buffered_until_due(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.url, {'answers': [self._answer(0)]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertFalse(response.data['flushed'])
+        self.assertFalse(any(query['sql'].startswith('INSERT') for query in queries.captured_queries))
+        self.assertFalse(StudentAnswer.objects.exists())
+
+    @override_settings(AUTOSAVE_FLUSH_SIZE=2)
+    def test_full_buffer_is_written_in_one_query(self):
+        self.client.patch(self.url, {'answers': [self._answer(0)]}, format='json')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.url, {'answers': [self._answer(1)]}, format='json')
+        self.assertTrue(response.data['flushed'])
+        self.assertEqual(len([query for query in queries.captured_queries if query['sql'].startswith('INSERT')]), 1)
+        self.assertEqual(StudentAnswer.objects.filter(attempt=self.attempt).count(), 2)
+
+        # a changed answer updates the row it was written to
+        wrong = QuestionOption.objects.get(question_id=self.right[0].question_id, is_correct=False)
+        self.client.patch(self.url, {'answers': [
+            {'question_id': str(wrong.question_id), 'selected_option': str(wrong.id)}, self._answer(2),
+        ]}, format='json')
+        self.assertEqual(StudentAnswer.objects.filter(attempt=self.attempt).count(), 3)
+        self.assertEqual(StudentAnswer.objects.get(question_id=wrong.question_id).selected_option, wrong)
+
+    @override_settings(AUTOSAVE_FLUSH_SIZE=2)
+    def test_submit_grades_written_and_buffered_answers(self):
+        self.client.patch(self.url, {'answers': [self._answer(0), self._answer(1)]}, format='json')
+        self.client.patch(self.url, {'answers': [self._answer(2)]}, format='json')
+        response = self.client.patch(reverse('student-submit-attempt', kwargs={'attempt_id': self.attempt.id}), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+
+        self.attempt.refresh_from_db()
+        self.assertEqual(self.attempt.status, StudentAssessmentAttempt.AttemptStatus.GRADED)
+        self.assertEqual(self.attempt.score, 3)
+
+    def test_invalid_question_is_rejected(self):
+        response = self.client.patch(self.url, {'answers': [{'question_id': str(self.attempt.id)}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_overlapping_saves_keep_every_answer(self):
+        import threading
+        import time
+        from django.core.cache import cache
+        from assessments.autosave import autosave, buffered_answers
+
+        class SlowCache:
+            # widens the window between reading and writing the buffer
+            def __getattr__(self, name):
+                return getattr(cache, name)
+
+            def get(self, *args, **kwargs):
+                value = cache.get(*args, **kwargs)
+                time.sleep(0.05)
+                return value
+
+        def save(i):
+            autosave(self.attempt, [{'question_id': self.right[i].question_id, 'selected_option': self.right[i].id}], {})
+
+        with patch('assessments.autosave.cache', SlowCache()):
+            threads = [threading.Thread(target=save, args=(i,)) for i in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(set(buffered_answers(self.attempt.pk)), {option.question_id for option in self.right})
+
+    @override_settings(AUTOSAVE_LOCK_TIMEOUT=0.05, AUTOSAVE_FLUSH_SIZE=1)
+    def test_locked_buffer_asks_for_a_resend(self):
+        from django.core.cache import cache
+        from assessments.autosave import buffered_answers
+
+        cache.add(f'autosave-lock:{self.attempt.pk}', 'held')
+        try:
+            response = self.client.patch(self.url, {'answers': [self._answer(0)]}, format='json')
+        finally:
+            cache.delete(f'autosave-lock:{self.attempt.pk}')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(StudentAnswer.objects.filter(attempt=self.attempt).exists())
+        self.assertEqual(buffered_answers(self.attempt.pk), {})
+
+    def test_submit_tolerates_rows_flushed_meanwhile(self):
+        from assessments.autosave import buffered_answers, write_answers
+        from assessments.grading import answer_key, grade_attempt
+
+        self.client.patch(self.url, {'answers': [self._answer(0), self._answer(1)]}, format='json')
+
+        def flush_then_grade(attempt, *args, **kwargs):
+            # a flush landing after submit read the buffer and the rows
+            write_answers(attempt, buffered_answers(attempt.pk), answer_key(attempt.assessment_id))
+            return grade_attempt(attempt, *args, **kwargs)
+
+        with patch('assessments.serializers.grade_attempt', side_effect=flush_then_grade):
+            response = self.client.patch(reverse('student-submit-attempt', kwargs={'attempt_id': self.attempt.id}), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+
+        self.attempt.refresh_from_db()
+        self.assertEqual(self.attempt.score, 2)
+        self.assertEqual(StudentAnswer.objects.filter(attempt=self.attempt).count(), 3)
+        self.assertEqual(StudentAnswer.objects.filter(attempt=self.attempt, is_correct=True).count(), 2)
+
+
+def make_image(size=(2000, 1000), color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='JPEG')
+    return SimpleUploadedFile('cover.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+class TestImageRenditions(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        teacher = User.objects.create(username='image_teacher', email='image_teacher@example.com', phone='3000000021', user_type='teacher')
+        self.teacher = teacher.teacher_profile
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    @patch('api.tasks.process_image_task.delay')
+    def test_only_changed_images_are_queued(self, mock_delay):
+        with self.captureOnCommitCallbacks(execute=True):
+            course = Course.objects.create(title="Image Course", teacher=self.teacher, thumbnail=make_image())
+        mock_delay.assert_called_once_with('course.Course', str(course.pk), 'thumbnail')
+
+        mock_delay.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            course.title = "Renamed"
+            course.save()
+            Course.objects.get(pk=course.pk).save()
+        mock_delay.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            course.thumbnail = make_image(color='blue')
+            course.save()
+        mock_delay.assert_called_once_with('course.Course', str(course.pk), 'thumbnail')
+
+    @patch('api.tasks.process_image_task.delay')
+    def test_writes_renditions_once_per_content(self, mock_delay):
+        course = Course.objects.create(title="Image Course", teacher=self.teacher, thumbnail=make_image())
+        original = default_storage.open(course.thumbnail.name).read()
+
+        self.assertTrue(process_image('course.Course', str(course.pk), 'thumbnail'))
+        record = ImageRendition.objects.get(object_id=course.pk, field_name='thumbnail')
+        self.assertEqual(set(record.renditions), {'list', 'detail', 'retina'})
+        with default_storage.open(record.renditions['list']) as rendition:
+            image = Image.open(rendition)
+            self.assertEqual(image.format, 'WEBP')
+            self.assertEqual(image.size, (400, 200))
+        # the upload itself is left as it was
+        self.assertEqual(default_storage.open(course.thumbnail.name).read(), original)
+
+        # object and rendition lookups; nothing is re-encoded or written
+        with self.assertNumQueries(2):
+            self.assertFalse(process_image('course.Course', str(course.pk), 'thumbnail'))
+
+        old_paths = list(record.renditions.values())
+        course.thumbnail = make_image(color='blue')
+        course.save()
+        self.assertTrue(process_image('course.Course', str(course.pk), 'thumbnail'))
+        record.refresh_from_db()
+        self.assertNotEqual(list(record.renditions.values()), old_paths)
+        self.assertFalse(any(default_storage.exists(path) for path in old_paths))
+
+    @patch('api.tasks.process_image_task.delay')
+    def test_cleared_and_deleted_images_drop_renditions(self, mock_delay):
+        course = Course.objects.create(title="Image Course", teacher=self.teacher, thumbnail=make_image())
+        process_image('course.Course', str(course.pk), 'thumbnail')
+        paths = list(ImageRendition.objects.get(object_id=course.pk).renditions.values())
+
+        course.thumbnail = None
+        course.save()
+        self.assertFalse(process_image('course.Course', str(course.pk), 'thumbnail'))
+        self.assertFalse(ImageRendition.objects.filter(object_id=course.pk).exists())
+        self.assertFalse(any(default_storage.exists(path) for path in paths))
+
+        self.teacher.user.avatar = make_image()
+        self.teacher.user.save()
+        process_image('userAuth.User', str(self.teacher.user.pk), 'avatar')
+        self.assertEqual(rendition_urls([self.teacher.user], 'avatar').keys(), {self.teacher.user.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher.user.delete()
+        self.assertFalse(ImageRendition.objects.exists())
+
+    @patch('api.tasks.process_image_task.delay')
+    def test_serializers_return_renditions(self, mock_delay):
+        from course.models import CourseCategory
+        from course.serializer import CourseSerializer
+        from userAuth.serializer import StudentProfileSerializer
+
+        category = CourseCategory.objects.create(name="Imaged", icon=make_image())
+        courses = [
+            Course.objects.create(title=f"Image Course {i}", teacher=self.teacher, category=category, thumbnail=make_image())
+            for i in range(3)
+        ]
+        process_image('course.CourseCategory', str(category.pk), 'icon')
+        for course in courses[:2]:
+            process_image('course.Course', str(course.pk), 'thumbnail')
+
+        queryset = Course.objects.filter(pk__in=[course.pk for course in courses]).select_related('category').order_by('title')
+        # one rendition query per image field for the whole list
+        with self.assertNumQueries(3):
+            data = CourseSerializer(queryset, many=True).data
+        self.assertEqual(set(data[0]['thumbnail_renditions']), {'list', 'detail', 'retina'})
+        self.assertIsNone(data[2]['thumbnail_renditions'])
+        self.assertEqual(data[0]['category']['icon_renditions'], data[2]['category']['icon_renditions'])
+        self.assertIsNotNone(data[0]['category']['icon_renditions'])
+
+        student = User.objects.create(username='image_student', email='image_student@example.com', phone='3000000022', user_type='student', avatar=make_image())
+        process_image('userAuth.User', str(student.pk), 'avatar')
+        data = StudentProfileSerializer(student.student_profile).data
+        self.assertEqual(set(data['user']['avatar_renditions']), {'list', 'detail', 'retina'})
+        self.assertIsNone(data['user']['logo_renditions'])
+
+    @patch('api.tasks.process_image_task.delay')
+    def test_question_paper_picks_up_new_renditions(self, mock_delay):
+        from django.core.cache import cache
+        from assessments.papers import question_paper
+
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            course = Course.objects.create(title="Image Course", teacher=self.teacher)
+            assessment = Assessment.objects.create(
+                title="Image Exam",
+                assessment_type=Assessment.AssessmentType.COURSE_EXAM,
+                teacher=self.teacher,
+                course=course,
+            )
+            question = Question.objects.create(
+                assessment=assessment, question_text="Q", question_type=Question.QuestionType.TRUE_FALSE, image=make_image()
+            )
+        self.assertIsNone(question_paper(assessment)['questions'][0]['image_renditions'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            process_image('assessments.Question', str(question.pk), 'image')
+        self.assertEqual(set(question_paper(assessment)['questions'][0]['image_renditions']), {'list', 'detail', 'retina'})
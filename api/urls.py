@@ -77,6 +77,8 @@ urlpatterns = [
     # Course Modules ( under course require(course_id))
     path('courses/<uuid:course_id>/modules/', course_views.CourseModuleListView.as_view(), name='course-modules-list'),            # GET: list modules
     path('courses/<uuid:course_id>/modules/create/', course_views.CourseModuleCreateView.as_view(), name='course-module-create'),  # POST: create module
+    path('courses/<uuid:course_id>/modules/reorder/', course_views.CourseModuleReorderView.as_view(), name='course-module-reorder'),  # POST: reorder modules
+    path('courses/<uuid:course_id>/modules/bulk/', course_views.CourseModuleBulkUpdateView.as_view(), name='course-module-bulk-update'),  # PATCH: reorder / edit many modules
     
 
     # Single Module (detail / update / delete) - based on module_id only
@@ -89,15 +91,20 @@ urlpatterns = [
     # Course Module Lessons ( under module require(module_id))
     path('modules/<uuid:module_id>/lessons/', course_views.LessonListView.as_view(), name='lesson-list'),             # GET: list lessons in a module
     path('modules/<uuid:module_id>/lessons/create/', course_views.LessonCreateView.as_view(), name='lesson-create'), # POST: create lesson in module
+    path('modules/<uuid:module_id>/lessons/reorder/', course_views.LessonReorderView.as_view(), name='lesson-reorder'), # POST: reorder lessons in module
+    path('modules/<uuid:module_id>/lessons/bulk/', course_views.LessonBulkUpdateView.as_view(), name='lesson-bulk-update'), # PATCH: reorder / edit many lessons
     
     # Single Lesson actions (using lesson id)
     path('lessons/<uuid:id>/', course_views.LessonDetailView.as_view(), name='lesson-detail'),             # GET: retrieve lesson
     path('lessons/<uuid:id>/update/', course_views.LessonUpdateView.as_view(), name='lesson-update'),      # PUT/PATCH: update lesson
     path('lessons/<uuid:id>/delete/', course_views.LessonDeleteView.as_view(), name='lesson-delete'),      # DELETE: delete lesson
+    path('lessons/<uuid:id>/video-uploads/', course_views.VideoUploadCreateView.as_view(), name='lesson-video-upload-create'),  # POST: start a resumable video upload
+    path('lessons/<uuid:id>/video-uploads/<uuid:upload_id>/', course_views.VideoUploadView.as_view(), name='lesson-video-upload'),  # HEAD: offset, PATCH: next chunk
     # progress
     path('lessons/<uuid:id>/status/', course_views.UpdateLessonProgressView.as_view(), name='lesson-progress'),
     # video status check
     path('video/check-status/<lesson_id>', course_views.CheckVideoStatusAPIView.as_view(), name='check-video-status'),
+    path('video/webhook/', course_views.VdoCipherWebhookView.as_view(), name='vdocipher-webhook'),  # POST: VdoCipher video events
     
       # Assessment CRUD
      path('teacher/assessments/', 
@@ -117,6 +124,10 @@ urlpatterns = [
          assessments_views.TeacherQuestionListCreateView.as_view(), 
          name='teacher-question-list-create'),
     
+    path('teacher/assessments/<uuid:assessment_id>/questions/reorder/', 
+         assessments_views.TeacherQuestionReorderView.as_view(), 
+         name='teacher-question-reorder'),
+    
     path('teacher/assessments/questions/<uuid:question_id>/', 
          assessments_views.TeacherQuestionRetrieveUpdateDestroyView.as_view(), 
          name='teacher-question-detail'),
@@ -126,6 +137,10 @@ urlpatterns = [
          assessments_views.TeacherQuestionOptionListCreateView.as_view(), 
          name='teacher-question-option-list-create'),
     
+    path('teacher/questions/<uuid:question_id>/options/reorder/', 
+         assessments_views.TeacherQuestionOptionReorderView.as_view(), 
+         name='teacher-question-option-reorder'),
+    
     path('teacher/questions/options/<uuid:option_id>/', 
          assessments_views.TeacherQuestionOptionRetrieveUpdateDestroyView.as_view(), 
          name='teacher-question-option-detail'),
@@ -163,6 +178,13 @@ urlpatterns = [
          assessments_views.StudentStartAssessmentView.as_view(), 
          name='student-start-assessment'),
     
+    # student autosave answers of an attempt in progress
+    path(
+        'students/attempts/<uuid:attempt_id>/answers/',
+        assessments_views.StudentAutosaveAttemptView.as_view(),
+        name='student-autosave-attempt'
+    ),
+    
     # student submit assessment
     path(
         'students/attempts/<uuid:attempt_id>/submit/',
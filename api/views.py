@@ -1,6 +1,36 @@
+from django.db import transaction
+from rest_framework import generics, status
+from rest_framework.response import Response
+from .ordering import reorder
+from .serializers import ReorderSerializer
+
 # Create your views here.
 
 
+class ReorderAPIView(generics.GenericAPIView):
+    """
+    POST {"ids": [...]}: puts every item of one parent in the given order.
+    Subclasses set ``queryset`` and ``parent_lookup``, the foreign key of
+    the items that is also the URL keyword argument of the parent.
+    """
+    serializer_class = ReorderSerializer
+    parent_lookup = None
+
+    def get_siblings(self):
+        assert self.parent_lookup is not None, (
+            f"'{self.__class__.__name__}' should include a `parent_lookup` attribute."
+        )
+        return self.get_queryset().filter(**{self.parent_lookup: self.kwargs[self.parent_lookup]})
 
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
+        with transaction.atomic():
+            siblings = self.get_siblings().select_for_update()
+            try:
+                keys = reorder(siblings, serializer.validated_data['ids'])
+            except ValueError:
+                return Response({'ids': ['Must list every item exactly once.']}, status=status.HTTP_400_BAD_REQUEST)
 
+        return Response({'order': [{'id': pk, 'order': key} for pk, key in keys.items()]}, status=status.HTTP_200_OK)
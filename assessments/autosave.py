@@ -0,0 +1,127 @@
+"""
+Autosaved answers of in-progress attempts.
+
+Answers sent to the autosave endpoint are buffered per attempt in the
+cache, as ``{question_id: (selected_option_id, text_answer)}`` with the
+latest value per question winning. The buffer is written to
+``StudentAnswer`` with one upsert once it holds ``AUTOSAVE_FLUSH_SIZE``
+questions or its oldest change is ``AUTOSAVE_FLUSH_INTERVAL`` seconds old,
+so writes are spread over the exam instead of arriving all at once when it
+closes. Submitting or expiring the attempt applies whatever is still
+buffered before grading. Requests of the same attempt update the buffer one
+at a time under a ``cache.add`` lock, so overlapping saves keep every answer;
+one that cannot get the lock is refused with ``AutosaveBusy`` and resent.
+"""
+
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .models import StudentAnswer
+import time
+import uuid
+
+LOCK_POLL_INTERVAL = 0.01
+
+
+class AutosaveBusy(Exception):
+    pass
+
+
+def _cache_key(attempt_id):
+    return f'autosave:{attempt_id}'
+
+
+@contextmanager
+def _buffer_lock(attempt_id):
+    """Holds the buffer of ``attempt_id`` for one read-modify-write; yields whether it was acquired."""
+    lock_key = f'autosave-lock:{attempt_id}'
+    token = uuid.uuid4().hex
+    # an abandoned lock expires, so waiting as long as it lives is enough
+    deadline = time.monotonic() + settings.AUTOSAVE_LOCK_TIMEOUT
+    acquired = cache.add(lock_key, token, timeout=settings.AUTOSAVE_LOCK_TIMEOUT)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        acquired = cache.add(lock_key, token, timeout=settings.AUTOSAVE_LOCK_TIMEOUT)
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def buffered_answers(attempt_id):
+    """The answers of ``attempt_id`` not written to the database yet."""
+    buffer = cache.get(_cache_key(attempt_id))
+    return buffer['answers'] if buffer else {}
+
+
+def buffered_answers_many(attempt_ids):
+    """``buffered_answers`` of several attempts with one cache read, by attempt id."""
+    keys = {_cache_key(attempt_id): attempt_id for attempt_id in attempt_ids}
+    return {keys[key]: buffer['answers'] for key, buffer in cache.get_many(keys).items()}
+
+
+def discard_buffer(attempt_id):
+    cache.delete(_cache_key(attempt_id))
+
+
+def discard_buffers(attempt_ids):
+    cache.delete_many([_cache_key(attempt_id) for attempt_id in attempt_ids])
+
+
+def write_answers(attempt, answers, key):
+    """
+    Upserts ``answers`` (``{question_id: (selected_option_id, text_answer)}``)
+    into the ``StudentAnswer`` rows of ``attempt`` with one query. Questions
+    deleted since the answer was given are skipped.
+    """
+    now = timezone.now()
+    rows = [
+        StudentAnswer(
+            attempt=attempt,
+            question_id=question_id,
+            selected_option_id=selected_option_id,
+            text_answer=text_answer,
+            created_at=now,
+            updated_at=now,
+        )
+        for question_id, (selected_option_id, text_answer) in answers.items()
+        if question_id in key
+    ]
+    if rows:
+        StudentAnswer.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['attempt', 'question'],
+            update_fields=['selected_option', 'text_answer', 'updated_at'],
+        )
+    return len(rows)
+
+
+def autosave(attempt, answers, key):
+    """
+    Buffers ``answers`` (validated ``AnswerSubmitSerializer`` data) for
+    ``attempt`` and writes the buffer when it is due. Returns whether it was
+    written. Raises ``AutosaveBusy`` when the buffer stays locked.
+    """
+    changes = {attrs['question_id']: (attrs.get('selected_option'), attrs.get('text_answer')) for attrs in answers}
+    with _buffer_lock(attempt.pk) as locked:
+        if not locked:
+            # writing around the lock would let the older buffered value win later
+            raise AutosaveBusy(f'The autosave buffer of attempt {attempt.pk} is locked.')
+
+        now = timezone.now()
+        buffer = cache.get(_cache_key(attempt.pk)) or {'since': now, 'answers': {}}
+        buffer['answers'].update(changes)
+
+        due = (
+            len(buffer['answers']) >= settings.AUTOSAVE_FLUSH_SIZE
+            or (now - buffer['since']).total_seconds() >= settings.AUTOSAVE_FLUSH_INTERVAL
+        )
+        if due:
+            write_answers(attempt, buffer['answers'], key)
+            discard_buffer(attempt.pk)
+        else:
+            cache.set(_cache_key(attempt.pk), buffer, timeout=settings.AUTOSAVE_BUFFER_TTL)
+        return due
@@ -0,0 +1,55 @@
+"""
+Attempt deadlines.
+
+Every attempt stores ``deadline_at``, the earlier of its start plus the
+time limit and the end of the assessment window, so expiry is an indexed
+range query instead of a scan of every open attempt. Each start also
+queues the expiry sweep to run at its deadline. Deadlines falling in the
+same ``ATTEMPT_EXPIRY_ETA_GRANULARITY`` seconds share one queued sweep,
+so an exam started by hundreds of students at once queues a handful. The
+per-minute beat sweep stays as a backstop for sweeps the broker lost.
+"""
+
+import math
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import StudentAssessmentAttempt
+from .tasks import expire_old_attempts
+
+TIMING_FIELDS = ('is_timed', 'time_limit', 'available_until')
+
+
+def schedule_expiry(deadline_at):
+    """Queue the expiry sweep to run at ``deadline_at`` once the transaction commits."""
+    if deadline_at is None:
+        return
+    granularity = settings.ATTEMPT_EXPIRY_ETA_GRANULARITY
+    bucket = math.ceil(deadline_at.timestamp() / granularity) * granularity
+    # a sweep queued for longer than the broker's visibility timeout may be
+    # delivered twice, which is harmless
+    if cache.add(f'attempt-expiry:{bucket}', True, timeout=max(bucket - time.time(), 0) + granularity):
+        eta = datetime.fromtimestamp(bucket, tz=dt_timezone.utc)
+        transaction.on_commit(lambda: expire_old_attempts.apply_async(eta=eta))
+
+
+def refresh_deadlines(assessment):
+    """Recompute the deadlines of the in-progress attempts of ``assessment`` after its timing changed."""
+    attempts = list(
+        StudentAssessmentAttempt.objects.filter(
+            assessment=assessment,
+            status=StudentAssessmentAttempt.AttemptStatus.IN_PROGRESS,
+        ).only('pk', 'started_at', 'deadline_at')
+    )
+    changed = []
+    for attempt in attempts:
+        deadline_at = assessment.deadline_for(attempt.started_at)
+        if deadline_at != attempt.deadline_at:
+            attempt.deadline_at = deadline_at
+            changed.append(attempt)
+    StudentAssessmentAttempt.objects.bulk_update(changed, ['deadline_at'], batch_size=settings.EXPIRY_SWEEP_BATCH_SIZE)
+    for deadline_at in {attempt.deadline_at for attempt in changed}:
+        schedule_expiry(deadline_at)
+    return len(changed)
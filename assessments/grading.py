@@ -0,0 +1,217 @@
+"""
+Batch grading of assessment attempts.
+
+Submitting an attempt used to save every answer on its own: each save ran
+``full_clean()`` and read the answer's question and option again, and the
+final score then re-read every answer with its question. A 100-question
+exam cost hundreds of queries.
+
+Grading now reads the assessment's answer key (question types, marks,
+option ids and correct option ids) with one query, grades every answer in
+memory, writes them with one ``bulk_update`` and computes the score,
+percentage and pass mark in the same pass.
+
+Answer keys are immutable and versioned by a generation counter per
+assessment (see api/catalog_cache.py), which edits to its questions or
+options bump after commit. A key is built once per version, kept in the
+shared cache for ``ANSWER_KEY_CACHE_TTL`` seconds and in each process for
+the ``ANSWER_KEY_LOCAL_SIZE`` most recent versions, so a burst of
+submissions reads it from memory. Within the transaction that edits an
+assessment its key is read from the database. Publishing an assessment
+builds its key ahead of the first submission.
+"""
+
+from dataclasses import dataclass
+from decimal import Decimal
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from api.catalog_cache import bump, bump_pending, generations
+from course.deferred import defer
+from .models import Question, StudentAnswer, StudentAssessmentAttempt
+
+AUTO_GRADABLE = frozenset({
+    Question.QuestionType.MULTIPLE_CHOICE,
+    Question.QuestionType.TRUE_FALSE,
+})
+
+ANSWER_FIELDS = ('selected_option', 'text_answer', 'marks_awarded', 'is_correct', 'auto_graded', 'updated_at')
+
+
+@dataclass(frozen=True)
+class KeyEntry:
+    question_type: str
+    mark: Decimal
+    options: frozenset
+    correct: frozenset
+
+    @property
+    def auto_gradable(self):
+        return self.question_type in AUTO_GRADABLE
+
+
+class AnswerKey:
+    """What grading needs to know about an assessment's questions, by question id."""
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def __contains__(self, question_id):
+        return question_id in self.entries
+
+    def __getitem__(self, question_id):
+        return self.entries[question_id]
+
+
+def load_answer_key(assessment_id):
+    """The ``AnswerKey`` of ``assessment_id``, read with one query."""
+    rows = Question.objects.filter(assessment_id=assessment_id).order_by().values_list(
+        'id', 'question_type', 'mark', 'options__id', 'options__is_correct',
+    )
+    questions, options, correct = {}, {}, {}
+    for question_id, question_type, mark, option_id, is_correct in rows:
+        questions[question_id] = (question_type, mark)
+        options.setdefault(question_id, set())
+        correct.setdefault(question_id, set())
+        if option_id is not None:
+            options[question_id].add(option_id)
+            if is_correct:
+                correct[question_id].add(option_id)
+    return AnswerKey({
+        question_id: KeyEntry(question_type, mark, frozenset(options[question_id]), frozenset(correct[question_id]))
+        for question_id, (question_type, mark) in questions.items()
+    })
+
+
+def questions_scope(assessment_id):
+    """The generation scope of the questions and options of ``assessment_id``."""
+    return f'answer-key:{assessment_id}'
+
+
+@lru_cache(maxsize=settings.ANSWER_KEY_LOCAL_SIZE)
+def _versioned_key(assessment_id, generation):
+    cache_key = f'{questions_scope(assessment_id)}:{generation}'
+    entries = cache.get(cache_key)
+    if entries is None:
+        entries = load_answer_key(assessment_id).entries
+        cache.set(cache_key, entries, timeout=settings.ANSWER_KEY_CACHE_TTL)
+    return AnswerKey(entries)
+
+
+def answer_key(assessment_id):
+    """The current ``AnswerKey`` of ``assessment_id``, from memory or the cache when possible."""
+    scope = questions_scope(assessment_id)
+    if bump_pending(scope):
+        # edited in this transaction; every cached version predates the edit
+        return load_answer_key(assessment_id)
+    return _versioned_key(assessment_id, generations([scope])[scope])
+
+
+def invalidate_answer_key(assessment_id):
+    """Retire the answer key of ``assessment_id`` once the transaction commits."""
+    bump(questions_scope(assessment_id))
+
+
+def _warm(assessment_ids):
+    for assessment_id in assessment_ids:
+        answer_key(assessment_id)
+
+
+def warm_answer_key(assessment_id):
+    """Build the answer key of ``assessment_id`` once the transaction commits."""
+    defer('answer-key', assessment_id, flush=_warm)
+
+
+def grade_answer(answer, entry):
+    """``StudentAnswer.clean`` and ``auto_grade`` in memory, against ``entry``."""
+    if entry.auto_gradable:
+        answer.text_answer = None
+        answer.is_correct = answer.selected_option_id in entry.correct
+        answer.marks_awarded = entry.mark if answer.is_correct else 0
+        answer.auto_graded = True
+    else:
+        answer.selected_option_id = None
+
+
+def _graded(answer, entry):
+    return answer.auto_graded if entry.auto_gradable else answer.manual_graded
+
+
+def score_attempt(attempt, answers, key):
+    """
+    Sets the score of ``attempt`` from its graded ``answers``, as
+    ``calculate_final_score`` does, without saving. Returns the fields set.
+    """
+    entries = [key[answer.question_id] for answer in answers]
+    if not all(_graded(answer, entry) for answer, entry in zip(answers, entries)):
+        attempt.auto_graded = False
+        attempt.status = StudentAssessmentAttempt.AttemptStatus.SUBMITTED
+        return ['auto_graded', 'status']
+
+    assessment = attempt.assessment
+    total_score = sum((answer.marks_awarded for answer in answers), Decimal(0))
+    attempt.score = total_score
+    attempt.percentage = round(
+        (total_score / assessment.total_marks) * 100
+        if assessment.total_marks > 0 else 0, 2)
+    attempt.is_passed = attempt.percentage >= assessment.passing_score
+    attempt.auto_graded = all(entry.auto_gradable for entry in entries)
+    attempt.graded_at = timezone.now()
+    attempt.status = StudentAssessmentAttempt.AttemptStatus.GRADED
+    return ['score', 'percentage', 'is_passed', 'auto_graded', 'graded_at', 'status']
+
+
+def _write_answers(graded, now):
+    created, updated = [], []
+    for answers, key in graded:
+        for answer in answers:
+            grade_answer(answer, key[answer.question_id])
+            answer.updated_at = now
+            (created if answer._state.adding else updated).append(answer)
+    if created:
+        # an autosave flush may have written some of these rows since they were read
+        StudentAnswer.objects.bulk_create(
+            created,
+            update_conflicts=True,
+            unique_fields=['attempt', 'question'],
+            update_fields=ANSWER_FIELDS,
+        )
+    if updated:
+        StudentAnswer.objects.bulk_update(updated, ANSWER_FIELDS)
+
+
+def grade_attempt(attempt, answers, key=None, fields=()):
+    """
+    Grades ``answers`` (the attempt's ``StudentAnswer`` rows, in memory) and
+    scores ``attempt``. Existing answers are written with one
+    ``bulk_update`` and new ones with one upserting ``bulk_create``; the
+    attempt with one UPDATE of the score and of ``fields``.
+    """
+    if key is None:
+        key = answer_key(attempt.assessment_id)
+    _write_answers([(answers, key)], timezone.now())
+
+    fields = [*fields, *score_attempt(attempt, answers, key)]
+    StudentAssessmentAttempt.objects.filter(pk=attempt.pk).update(
+        **{field: getattr(attempt, field) for field in dict.fromkeys(fields)}
+    )
+    return attempt
+
+
+def grade_attempts(graded, fields=(), graded_status=None):
+    """
+    ``grade_attempt`` for many attempts: ``graded`` is a list of
+    ``(attempt, answers, key)``. The answers of every attempt are written
+    with one ``bulk_create`` and one ``bulk_update``, the attempts with one
+    ``bulk_update``. Fully graded attempts get ``graded_status`` if given.
+    """
+    _write_answers([(answers, key) for _, answers, key in graded], timezone.now())
+
+    written = {*fields, 'score', 'percentage', 'is_passed', 'auto_graded', 'graded_at', 'status'}
+    for attempt, answers, key in graded:
+        score_attempt(attempt, answers, key)
+        if graded_status and attempt.status == StudentAssessmentAttempt.AttemptStatus.GRADED:
+            attempt.status = graded_status
+    StudentAssessmentAttempt.objects.bulk_update([attempt for attempt, _, _ in graded], sorted(written))
+    return [attempt for attempt, _, _ in graded]
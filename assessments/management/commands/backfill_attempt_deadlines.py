@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from assessments.deadlines import refresh_deadlines
+from assessments.models import Assessment, StudentAssessmentAttempt
+
+
+class Command(BaseCommand):
+    help = 'Sets deadline_at on in-progress attempts started before it was stored, so the expiry sweep sees them.'
+
+    def handle(self, *args, **options):
+        assessments = Assessment.objects.filter(
+            attempts__status=StudentAssessmentAttempt.AttemptStatus.IN_PROGRESS,
+            attempts__deadline_at__isnull=True,
+        ).distinct()
+        updated = sum(refresh_deadlines(assessment) for assessment in assessments)
+        self.stdout.write(self.style.SUCCESS(f'Deadlines set on {updated} in-progress attempts.'))
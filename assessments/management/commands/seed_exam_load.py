@@ -0,0 +1,85 @@
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from assessments.models import Assessment, Question, QuestionOption
+from course.models import Course, CourseEnrollment
+from userAuth.models import TeacherStudentProfile, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates a teacher, enrolled students and a timed exam that opens shortly, '
+        'for load testing exam starts with locustfile.py.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=500, help='Number of enrolled students.')
+        parser.add_argument('--questions', type=int, default=50, help='Questions in the exam.')
+        parser.add_argument('--opens-in', type=int, default=120, help='Seconds until the exam opens.')
+        parser.add_argument('--time-limit', type=int, default=30, help='Exam time limit in minutes.')
+        parser.add_argument('--teacher', default='loadteacher', help='Username of the teacher.')
+        parser.add_argument('--password', default='password123', help='Password of every student.')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        teacher_user, _ = User.objects.get_or_create(
+            username=options['teacher'],
+            defaults={
+                'email': f'{options["teacher"]}@example.com',
+                'phone': '2000000000',
+                'password': make_password(options['password']),
+                'user_type': User.userType.TEACHER,
+            },
+        )
+        teacher = teacher_user.teacher_profile
+        course = Course.objects.create(title='Load Test Course', teacher=teacher, is_published=True)
+
+        opens_at = timezone.now() + timedelta(seconds=options['opens_in'])
+        assessment = Assessment.objects.create(
+            title='Load Test Exam',
+            assessment_type=Assessment.AssessmentType.COURSE_EXAM,
+            teacher=teacher,
+            course=course,
+            is_timed=True,
+            time_limit=options['time_limit'],
+            available_from=opens_at,
+            available_until=opens_at + timedelta(minutes=options['time_limit']),
+        )
+        for i in range(options['questions']):
+            question = Question.objects.create(
+                assessment=assessment,
+                question_text=f'Question {i + 1}',
+                question_type=Question.QuestionType.MULTIPLE_CHOICE,
+                mark=1,
+            )
+            for n in range(4):
+                QuestionOption.objects.create(question=question, option_text=f'Option {n + 1}', is_correct=n == 0)
+        assessment.is_published = True
+        assessment.save()
+
+        self.stdout.write(f'Creating {options["students"]} students...')
+        password = make_password(options['password'])
+        offset = User.objects.filter(username__startswith=f'{options["teacher"]}_student').count()
+        for i in range(offset, offset + options['students']):
+            student_user = User.objects.create(
+                username=f'{options["teacher"]}_student{i}',
+                email=f'{options["teacher"]}_student{i}@example.com',
+                phone=str(2100000000 + i),
+                password=password,
+                user_type=User.userType.STUDENT,
+            )
+            student = student_user.student_profile
+            TeacherStudentProfile.objects.get_or_create(teacher=teacher, student=student)
+            CourseEnrollment.objects.create(
+                student=student,
+                course=course,
+                status=CourseEnrollment.EnrollmentStatus.ACTIVE,
+                access_type=CourseEnrollment.AccessType.FULL_ACCESS,
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Exam {assessment.id} of {options["teacher"]} opens at {opens_at.isoformat()}; '
+            f'students {options["teacher"]}_student{offset}..{offset + options["students"] - 1}@example.com'
+        ))
@@ -1,8 +1,10 @@
 from django.db import models
 from django.utils import timezone
+from datetime import timedelta
 import uuid
 from userAuth.models import StudentProfile, TeacherProfile
 from course.models import Lesson,Course,CourseModule
+from api.ordering import OrderedMixin
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
 # Create your models here.
@@ -87,6 +89,15 @@ class Assessment(models.Model):
             self.available_from <= now and 
             (self.available_until is None or self.available_until >= now)
         )
+
+    def deadline_for(self, started_at):
+        """When an attempt started at ``started_at`` runs out: its time limit or the end of the window, whichever is first."""
+        deadlines = []
+        if self.is_timed and self.time_limit:
+            deadlines.append(started_at + timedelta(minutes=self.time_limit))
+        if self.available_until:
+            deadlines.append(self.available_until)
+        return min(deadlines, default=None)
         
     @property
     def related_course(self):
@@ -124,9 +135,11 @@ class Assessment(models.Model):
         self.save(update_fields=['total_questions', 'total_marks'])
         
     
-class Question(models.Model):
+class Question(OrderedMixin, models.Model):
     """Question model for assessments"""
     
+    order_scope = 'assessment'
+
     class QuestionType(models.TextChoices):
         MULTIPLE_CHOICE='multiple_choice','Multiple Choice'
         TRUE_FALSE='true_false', 'True/False'
@@ -150,45 +163,25 @@ class Question(models.Model):
     class Meta:
         ordering=['order']
         # unique_together=('assessment','order')
+        indexes = [
+            models.Index(fields=['assessment', 'order']),
+        ]
     
     def save(self, *args, **kwargs):
-        is_new = self._state.adding
-        with transaction.atomic():
-            if is_new:
-                if self.order is None:
-                    last_question_order=Question.objects.filter(assessment=self.assessment).aggregate(models.Max('order'))['order__max']
-                    self.order=1 if last_question_order is None else last_question_order+1
-                else:
-                    if Question.objects.filter(assessment=self.assessment,order=self.order).exists():
-                        Question.objects.filter(assessment=self.assessment,order__gte=self.order).update(order=models.F('order')+1)
-
-            else:
-                old_order=Question.objects.get(pk=self.pk).order
-                if self.order != old_order:
-                    if self.order < old_order:
-                        Question.objects.filter(
-                            assessment=self.assessment,
-                            order__gte=self.order,
-                            order__lt=old_order
-                        ).update(order=models.F('order') + 1)
-
-                    else:
-                        Question.objects.filter(
-                            assessment=self.assessment,
-                            order__lte=self.order,
-                            order__gt=old_order
-                        ).update(order=models.F('order') - 1)
-        
+        self.place_in_order()
         super().save(*args, **kwargs)
+        self.remember_order()
         self.assessment.update_totals()
         
     def delete(self, *args, **kwargs):
         super().delete(*args, **kwargs)
         self.assessment.update_totals()
         
-class QuestionOption(models.Model):
+class QuestionOption(OrderedMixin, models.Model):
     """Options for multiple choice questions"""
     
+    order_scope = 'question'
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, unique=True)
     question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='options')
     option_text = models.CharField(max_length=500)
@@ -198,39 +191,17 @@ class QuestionOption(models.Model):
     class Meta:
         ordering = ['order']
         # unique_together = ('question', 'order')
+        indexes = [
+            models.Index(fields=['question', 'order']),
+        ]
         
     def __str__(self):
         return f"{self.order}-{self.option_text[:50]}... ({'✓' if self.is_correct else '✗'})"
 
     def save(self, *args, **kwargs):
-        is_new = self._state.adding
-        with transaction.atomic():
-            if is_new:
-                if self.order is None:
-                    last_question_option_order=QuestionOption.objects.filter(question=self.question).aggregate(models.Max('order'))['order__max']
-                    self.order=1 if last_question_option_order is None else last_question_option_order+1
-                else:
-                    if QuestionOption.objects.filter(question=self.question,order=self.order).exists():
-                        QuestionOption.objects.filter(question=self.question,order__gte=self.order).update(order=models.F('order')+1)
-
-            else:
-                old_order=QuestionOption.objects.get(pk=self.pk).order
-                if self.order != old_order:
-                    if self.order < old_order:
-                        QuestionOption.objects.filter(
-                            question=self.question,
-                            order__gte=self.order,
-                            order__lt=old_order
-                        ).update(order=models.F('order') + 1)
-
-                    else:
-                        QuestionOption.objects.filter(
-                            question=self.question,
-                            order__lte=self.order,
-                            order__gt=old_order
-                        ).update(order=models.F('order') - 1)
-        
+        self.place_in_order()
         super().save(*args, **kwargs)
+        self.remember_order()
 
 class StudentAssessmentAttempt(models.Model):
     """Student's attempt at an assessment"""
@@ -253,6 +224,8 @@ class StudentAssessmentAttempt(models.Model):
     started_at=models.DateTimeField(auto_now_add=True)
     ended_at=models.DateTimeField(null=True,blank=True)
     time_taken = models.PositiveIntegerField(blank=True, null=True, help_text="Time taken in seconds")
+    # Assessment.deadline_for(started_at), kept current by assessments.deadlines
+    deadline_at = models.DateTimeField(blank=True, null=True)
     
     # Scoring
     score=models.DecimalField(max_digits=6,decimal_places=2,default=0.00)
@@ -273,6 +246,10 @@ class StudentAssessmentAttempt(models.Model):
         indexes=[
            models.Index(fields=('status',)),
            models.Index(fields=('started_at',)),
+           models.Index(fields=('status','started_at')),
+           models.Index(fields=('status','deadline_at')),
+           models.Index(fields=('assessment','-started_at','-id')),
+           models.Index(fields=('student','-started_at','-id')),
         ]
     
     def __str__(self):
@@ -280,6 +257,9 @@ class StudentAssessmentAttempt(models.Model):
     
     def save(self, *args, **kwargs):
         self.full_clean()
+
+        if self._state.adding and self.deadline_at is None:
+            self.deadline_at = self.assessment.deadline_for(self.started_at or timezone.now())
         
         if self.status == self.AttemptStatus.SUBMITTED and not self.ended_at : 
             self.ended_at=timezone.now()
@@ -307,87 +287,29 @@ class StudentAssessmentAttempt(models.Model):
         if self.status != self.AttemptStatus.IN_PROGRESS:
             return False
 
-        now = timezone.now()
-
-        # if assessment ended
-        if self.assessment.available_until and now > self.assessment.available_until:
-            return True
-
-        # if time limit
-        if self.assessment.is_timed and self.started_at:
-            time_limit_seconds = self.assessment.time_limit * 60
-            elapsed = (now - self.started_at).total_seconds()
-            if elapsed > time_limit_seconds:
-                return True
-
-        return False
+        # from the assessment as loaded, which deadline_at mirrors
+        deadline = self.assessment.deadline_for(self.started_at or timezone.now())
+        return deadline is not None and timezone.now() > deadline
 
     def expire_attempt(self):
         """Mark attempt as expired and auto-grade if possible"""
+        from .tasks import expire_attempts
         if self.status == self.AttemptStatus.IN_PROGRESS:
-            now = timezone.now()
-            elapsed = (now - self.started_at).total_seconds()
-            self.status = self.AttemptStatus.EXPIRED
-            self.ended_at = now
-            self.time_taken = int(elapsed)
-            self.save()
+            expire_attempts(attempts=StudentAssessmentAttempt.objects.filter(pk=self.pk))
+            self.refresh_from_db()
 
     def all_questions_auto_gradable(self):
         """Check if all questions in the attempt can be auto-graded."""
-        auto_gradable_types = [
-            Question.QuestionType.MULTIPLE_CHOICE,
-            Question.QuestionType.TRUE_FALSE
-        ]
-        return all(
-            answer.question.question_type in auto_gradable_types
-            for answer in self.answers.all()
-        )
+        from .grading import AUTO_GRADABLE
+        return not self.answers.exclude(question__question_type__in=AUTO_GRADABLE).exists()
         
     def calculate_final_score(self):
         """
         Calculate score when all answers are graded (manual or auto).
         """
-        answers = self.answers.all()
-
-        # Check if any answers are ungraded (manual or auto)
-        ungraded_exists = answers.filter(
-            models.Q(
-                question__question_type__in=[
-                    Question.QuestionType.SHORT_ANSWER,
-                    Question.QuestionType.ESSAY,
-                    Question.QuestionType.FILL_BLANK
-                ],
-                manual_graded=False
-            )
-            |
-            models.Q(
-                question__question_type__in=[
-                    Question.QuestionType.MULTIPLE_CHOICE,
-                    Question.QuestionType.TRUE_FALSE
-                ],
-                auto_graded=False
-            )
-        ).exists()
-
-        if ungraded_exists:
-            # Still some ungraded answers
-            self.auto_graded = False
-            if self.status != self.AttemptStatus.SUBMITTED:
-                self.status = self.AttemptStatus.SUBMITTED
-            self.save(update_fields=["auto_graded", "status"])
-            return
-
-        # All answers graded
-        total_score = sum(answer.marks_awarded for answer in answers)
-        self.score = total_score
-        self.percentage = round(
-            (total_score / self.assessment.total_marks) * 100
-            if self.assessment.total_marks > 0 else 0,2)
-        self.is_passed = self.percentage >= self.assessment.passing_score
-        self.auto_graded = self.all_questions_auto_gradable()
-        self.graded_at = timezone.now()
-        self.status = self.AttemptStatus.GRADED
-        self.save()
+        from .grading import answer_key, score_attempt
+        fields = score_attempt(self, list(self.answers.all()), answer_key(self.assessment_id))
+        self.save(update_fields=fields)
         
 class StudentAnswer(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, unique=True)
@@ -421,12 +343,11 @@ class StudentAnswer(models.Model):
     
     def auto_grade(self):
         """Auto-grade multiple choice and true/false questions"""
-        if self.question.question_type in [
-            Question.QuestionType.MULTIPLE_CHOICE,
-            Question.QuestionType.TRUE_FALSE
-        ]:
-            if self.selected_option and self.selected_option.is_correct:
-                self.marks_awarded = self.question.mark
+        from .grading import answer_key
+        entry = answer_key(self.question.assessment_id)[self.question_id]
+        if entry.auto_gradable:
+            if self.selected_option_id in entry.correct:
+                self.marks_awarded = entry.mark
                 self.is_correct = True
             else:
                 self.marks_awarded = 0
@@ -0,0 +1,42 @@
+"""
+Pre-serialized question papers for the exam start endpoint.
+
+When a timed assessment opens, every student starts it at once, and each
+start used to serialize all questions and options again. The rendered
+paper is now cached per version of the assessment's questions (the
+generation its answer key is versioned by, see grading.py) and of the
+assessment itself (``updated_at``), for ``QUESTION_PAPER_CACHE_TTL``
+seconds. Only ``is_available`` is computed per request.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+from api.catalog_cache import bump_pending, generations
+from .grading import questions_scope
+from .models import Assessment, Question
+from .serializers import AssessmentRetrieveSerializer
+
+
+def render_paper(assessment):
+    """The ``AssessmentRetrieveSerializer`` payload of ``assessment``, from the database."""
+    assessment = Assessment.objects.select_related('lesson', 'module', 'course').prefetch_related(
+        Prefetch('questions', queryset=Question.objects.prefetch_related('options')),
+    ).get(pk=assessment.pk)
+    return dict(AssessmentRetrieveSerializer(assessment).data)
+
+
+def question_paper(assessment):
+    """The question paper of ``assessment``, rendered once per version."""
+    scope = questions_scope(assessment.pk)
+    if bump_pending(scope):
+        # edited in this transaction; every cached paper predates the edit
+        paper = render_paper(assessment)
+    else:
+        generation = generations([scope])[scope]
+        cache_key = f'question-paper:{assessment.pk}:{generation}:{assessment.updated_at.timestamp()}'
+        paper = cache.get(cache_key)
+        if paper is None:
+            paper = render_paper(assessment)
+            cache.set(cache_key, paper, timeout=settings.QUESTION_PAPER_CACHE_TTL)
+    return {**paper, 'is_available': assessment.is_available()}
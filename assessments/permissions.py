@@ -1,5 +1,5 @@
 from rest_framework.permissions import BasePermission
-from course.models import CourseEnrollment, ModuleEnrollment
+from course.access import get_access
 from assessments.models import Assessment
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
@@ -24,10 +24,12 @@ class IsStudentEnrolledAndAssessmentAvailable(BasePermission):
             return False
 
         try:
-            assessment = Assessment.objects.get(id=assessment_id)
+            assessment = Assessment.objects.select_related('lesson', 'course__teacher__user').get(id=assessment_id)
         except Assessment.DoesNotExist:
             self.message = "Assessment not found."
             return False
+        # the view reuses it rather than loading it again
+        view.assessment = assessment
 
         if teacher_username and assessment.course and assessment.course.teacher.user.username != teacher_username:
             self.message = "Assessment does not belong to the specified teacher."
@@ -47,33 +49,7 @@ class IsStudentEnrolledAndAssessmentAvailable(BasePermission):
             self.message = "Assessment has ended."
             return False
 
-        enrolled = False
-
-        if assessment.course:
-            enrolled = CourseEnrollment.objects.filter(
-                student=student,
-                course=assessment.course,
-                is_active=True,
-                access_type=CourseEnrollment.AccessType.FULL_ACCESS
-            ).exists()
-
-        elif assessment.module:
-            enrolled = ModuleEnrollment.objects.filter(
-                student=student,
-                module=assessment.module,
-                is_active=True,
-                status=ModuleEnrollment.EnrollmentStatus.ACTIVE
-            ).exists()
-
-        elif assessment.lesson:
-            enrolled = ModuleEnrollment.objects.filter(
-                student=student,
-                module=assessment.lesson.module,
-                is_active=True,
-                status=ModuleEnrollment.EnrollmentStatus.ACTIVE
-            ).exists()
-
-        if not enrolled:
+        if not get_access(request).can_take_assessment(assessment):
             self.message = "You are not enrolled in the related course/module."
             return False
 
@@ -93,10 +69,12 @@ class CanSubmitAttempt(BasePermission):
             return False
 
         attempt = get_object_or_404(
-            StudentAssessmentAttempt,
+            StudentAssessmentAttempt.objects.select_related('assessment__lesson'),
             id=attempt_id,
             student=student
         )
+        # the view reuses it rather than loading it again
+        view.attempt = attempt
 
         if attempt.status != StudentAssessmentAttempt.AttemptStatus.IN_PROGRESS:
             self.message = "This attempt is not in progress."
@@ -124,32 +102,7 @@ class CanSubmitAttempt(BasePermission):
                 self.message = "Time limit exceeded."
                 return False
 
-        enrolled = False
-        if assessment.course:
-            enrolled = CourseEnrollment.objects.filter(
-                student=student,
-                course=assessment.course,
-                is_active=True,
-                access_type=CourseEnrollment.AccessType.FULL_ACCESS
-            ).exists()
-
-        elif assessment.module:
-            enrolled = ModuleEnrollment.objects.filter(
-                student=student,
-                module=assessment.module,
-                is_active=True,
-                status=ModuleEnrollment.EnrollmentStatus.ACTIVE
-            ).exists()
-
-        elif assessment.lesson:
-            enrolled = ModuleEnrollment.objects.filter(
-                student=student,
-                module=assessment.lesson.module,
-                is_active=True,
-                status=ModuleEnrollment.EnrollmentStatus.ACTIVE
-            ).exists()
-
-        if not enrolled:
+        if not get_access(request).can_take_assessment(assessment):
             self.message = "You are not enrolled in the related course/module."
             return False
 
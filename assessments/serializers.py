@@ -1,4 +1,6 @@
 from rest_framework import serializers
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from .models import (
@@ -7,6 +9,10 @@ from .models import (
 )
 from course.models import Lesson, CourseModule
 from userAuth.models import User
+from api.serializers import RenditionsField, RenditionsListSerializer
+from .autosave import autosave, buffered_answers, discard_buffer
+from .deadlines import schedule_expiry
+from .grading import answer_key, grade_attempt
 
 # Question Option Serializers
 class QuestionOptionCreateSerializer(serializers.ModelSerializer):
@@ -100,10 +106,12 @@ class QuestionUpdateSerializer(serializers.ModelSerializer):
 
 class QuestionRetrieveSerializer(serializers.ModelSerializer):
     options = QuestionOptionListSerializer(many=True, read_only=True)
+    image_renditions = RenditionsField('image')
     
     class Meta:
         model = Question
-        fields = ['id', 'question_text', 'question_type', 'mark', 'order', 'explanation', 'image', 'options']
+        fields = ['id', 'question_text', 'question_type', 'mark', 'order', 'explanation', 'image', 'image_renditions', 'options']
+        list_serializer_class = RenditionsListSerializer
 
 class QuestionListSerializer(serializers.ModelSerializer):
     class Meta:
@@ -281,66 +289,61 @@ class StudentAssessmentAttemptCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = StudentAssessmentAttempt
         fields = ['assessment']
+        read_only_fields = ['assessment']
 
-    def validate_assessment(self, value):
-        student = self.context['request'].user.student_profile
+    def validate(self, attrs):
+        # loaded once by the view's permission check
+        value = self.context['assessment']
         now = timezone.now()
 
         if not value.is_published:
-            raise serializers.ValidationError("This assessment is not published yet.")
+            raise serializers.ValidationError({"assessment": "This assessment is not published yet."})
 
         if not value.is_available(): 
             if value.available_from and now < value.available_from:
-                raise serializers.ValidationError("The assessment has not started yet.")
+                raise serializers.ValidationError({"assessment": "The assessment has not started yet."})
             elif value.available_until and now > value.available_until:
-                raise serializers.ValidationError("The assessment has already ended.")
+                raise serializers.ValidationError({"assessment": "The assessment has already ended."})
             else:
-                raise serializers.ValidationError("The assessment is not available.")
-
-        previous_attempts = StudentAssessmentAttempt.objects.filter(
-            student=student,
-            assessment=value
-        ).count()
-
-        if previous_attempts >= value.max_attempts:
-            raise serializers.ValidationError(
-                f"You have reached the maximum number of attempts ({value.max_attempts})."
-            )
-
-        in_progress = StudentAssessmentAttempt.objects.filter(
-            student=student,
-            assessment=value,
-            status=StudentAssessmentAttempt.AttemptStatus.IN_PROGRESS
-        ).exists()
-
-        if in_progress:
-            raise serializers.ValidationError("You already have an attempt in progress for this assessment.")
+                raise serializers.ValidationError({"assessment": "The assessment is not available."})
 
-        return value
+        attrs['assessment'] = value
+        return attrs
 
     def create(self, validated_data):
         student = self.context['request'].user.student_profile
         assessment = validated_data['assessment']
         
-        previous_attempts = StudentAssessmentAttempt.objects.filter(
-            student=student,
-            assessment=assessment
-        ).count()
+        # both limits from one query
+        attempts = StudentAssessmentAttempt.objects.filter(student=student, assessment=assessment).aggregate(
+            taken=Count('id'),
+            in_progress=Count('id', filter=Q(status=StudentAssessmentAttempt.AttemptStatus.IN_PROGRESS)),
+        )
 
-        attempt = StudentAssessmentAttempt.objects.create(
+        if attempts['taken'] >= assessment.max_attempts:
+            raise serializers.ValidationError(
+                {"assessment": f"You have reached the maximum number of attempts ({assessment.max_attempts})."}
+            )
+
+        if attempts['in_progress']:
+            raise serializers.ValidationError({"assessment": "You already have an attempt in progress for this assessment."})
+
+        # attempt numbers are unique per student and assessment, so of two
+        # simultaneous starts only one gets the next number
+        attempt = StudentAssessmentAttempt(
             student=student,
             assessment=assessment,
-            attempt_number=previous_attempts + 1
+            attempt_number=attempts['taken'] + 1,
+            deadline_at=assessment.deadline_for(timezone.now()),
         )
+        try:
+            with transaction.atomic():
+                StudentAssessmentAttempt.objects.bulk_create([attempt])
+        except IntegrityError:
+            raise serializers.ValidationError({"assessment": "You already have an attempt in progress for this assessment."})
+        schedule_expiry(attempt.deadline_at)
 
-        # Create empty answers for all questions
-        questions = assessment.questions.all()
-        student_answers = [
-            StudentAnswer(attempt=attempt, question=question)
-            for question in questions
-        ]
-        StudentAnswer.objects.bulk_create(student_answers)
-
+        # answer rows are created when the attempt is submitted
         return attempt
 
 # Handle answer in submitting
@@ -349,73 +352,78 @@ class AnswerSubmitSerializer(serializers.Serializer):
     selected_option = serializers.UUIDField(required=False, allow_null=True)  
     text_answer = serializers.CharField(required=False, allow_blank=True, allow_null=True)
 
-    def validate(self, attrs):
-        try:
-            question = Question.objects.get(id=attrs["question_id"])
-        except Question.DoesNotExist:
-            raise serializers.ValidationError({"question_id": "Invalid question ID."})
-        
-        selected_option_id = attrs.get("selected_option")
-        text_answer = attrs.get("text_answer")
-
-        # Multiple choice / true-false
-        if question.question_type in [Question.QuestionType.MULTIPLE_CHOICE, Question.QuestionType.TRUE_FALSE]:
-            if selected_option_id:
-                try:
-                    option = QuestionOption.objects.get(id=selected_option_id)
-                    if option.question != question:
-                        raise serializers.ValidationError({"selected_option": "Selected option does not belong to this question."})
-                except QuestionOption.DoesNotExist:
-                    raise serializers.ValidationError({"selected_option": "Invalid option ID."})
-            # Clear text answer for multiple choice
-            attrs["text_answer"] = None
-
-        # Short answer / essay / fill blank
-        elif question.question_type in [Question.QuestionType.SHORT_ANSWER, Question.QuestionType.ESSAY, Question.QuestionType.FILL_BLANK]:
-            # Clear selected option for text questions
-            attrs["selected_option"] = None
-
-        attrs["question"] = question
-        return attrs
+class AttemptAnswersSerializer(serializers.Serializer):
+    answers = AnswerSubmitSerializer(many=True)
+
+    def validate_answers(self, value):
+        # checked against the answer key rather than one question and option query per answer
+        key = answer_key(self.instance.assessment_id)
+        errors = []
+        for attrs in value:
+            error = {}
+            question_id = attrs["question_id"]
+            selected_option_id = attrs.get("selected_option")
+            if question_id not in key:
+                error = {"question_id": "Invalid question ID."}
+            elif key[question_id].auto_gradable:
+                if selected_option_id and selected_option_id not in key[question_id].options:
+                    if QuestionOption.objects.filter(id=selected_option_id).exists():
+                        error = {"selected_option": "Selected option does not belong to this question."}
+                    else:
+                        error = {"selected_option": "Invalid option ID."}
+            errors.append(error)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        self.answer_key = key
+        return value
+
+# Student autosave answers of an attempt in progress
+class StudentAssessmentAttemptAutosaveSerializer(AttemptAnswersSerializer):
+
+    def update(self, instance, validated_data):
+        self.flushed = autosave(instance, validated_data["answers"], self.answer_key)
+        return instance
 
 # Student submit assessment   
-class StudentAssessmentAttemptSubmitSerializer(serializers.Serializer):
-    answers = AnswerSubmitSerializer(many=True)
+class StudentAssessmentAttemptSubmitSerializer(AttemptAnswersSerializer):
+    # may be left out when every answer was autosaved
+    answers = AnswerSubmitSerializer(many=True, required=False)
 
     def update(self, instance, validated_data):
         now = timezone.now()
+        if not hasattr(self, 'answer_key'):
+            self.answer_key = answer_key(instance.assessment_id)
 
         answers_data = validated_data.get("answers", [])
-        answers_map = {str(ans.question_id): ans for ans in instance.answers.all()}
+        # read before the rows: an autosave flush in between then shows up
+        # in one or the other
+        buffered = buffered_answers(instance.pk)
+        answers_map = {ans.question_id: ans for ans in instance.answers.all()}
+        # rows of the questions that have none yet
+        for question_id in self.answer_key.entries:
+            if question_id not in answers_map:
+                answers_map[question_id] = StudentAnswer(attempt=instance, question_id=question_id)
+
+        # autosaved answers not written yet, then the ones sent with the submit
+        for question_id, (selected_option_id, text_answer) in buffered.items():
+            if question_id in answers_map:
+                answers_map[question_id].selected_option_id = selected_option_id
+                answers_map[question_id].text_answer = text_answer
 
         for ans_data in answers_data:
-            question_id = str(ans_data["question_id"])
-            student_answer = answers_map.get(question_id)
-            if not student_answer:
-                raise serializers.ValidationError(f"Invalid question ID {question_id}.")
-
+            student_answer = answers_map[ans_data["question_id"]]
             student_answer.selected_option_id = ans_data.get("selected_option")
             student_answer.text_answer = ans_data.get("text_answer")
 
-        # Bulk update
-        StudentAnswer.objects.bulk_update(
-            answers_map.values(), 
-            ["selected_option", "text_answer"]
-        )
-
-        # Auto-grade
-        for answer in answers_map.values():
-            answer.auto_grade()
-            answer.save()
-
         # Mark as submitted
         instance.status = StudentAssessmentAttempt.AttemptStatus.SUBMITTED
         instance.ended_at = now
         if instance.started_at:
             instance.time_taken = int((now - instance.started_at).total_seconds())
 
-        instance.calculate_final_score()
-        instance.save()
+        # Grade every answer and score the attempt in one pass
+        grade_attempt(instance, list(answers_map.values()), key=self.answer_key, fields=['status', 'ended_at', 'time_taken'])
+        discard_buffer(instance.pk)
 
         return instance
 
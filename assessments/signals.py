@@ -0,0 +1,49 @@
+from django.db.models.signals import post_delete, post_save
+from django.contrib.contenttypes.models import ContentType
+from api.models import ImageRendition
+from .deadlines import TIMING_FIELDS, refresh_deadlines
+from .grading import invalidate_answer_key, warm_answer_key
+from .models import Assessment, Question, QuestionOption
+
+
+def retire_question_key(sender, instance, **kwargs):
+    invalidate_answer_key(instance.assessment_id)
+
+
+def retire_option_key(sender, instance, **kwargs):
+    try:
+        invalidate_answer_key(instance.question.assessment_id)
+    except Question.DoesNotExist:
+        # deleted along with its question, which retires the key itself
+        pass
+
+
+def retire_question_image_key(sender, instance, **kwargs):
+    # cached question papers carry the image renditions, which arrive later
+    if ContentType.objects.get_for_id(instance.content_type_id).model_class() is not Question:
+        return
+    assessment_id = Question.objects.filter(pk=instance.object_id).values_list('assessment_id', flat=True).first()
+    if assessment_id is not None:
+        invalidate_answer_key(assessment_id)
+
+
+def build_published_key(sender, instance, update_fields=None, **kwargs):
+    if not instance.is_published:
+        return
+    if update_fields is None or 'is_published' in update_fields:
+        warm_answer_key(instance.pk)
+
+
+def move_attempt_deadlines(sender, instance, created=False, update_fields=None, **kwargs):
+    if created:
+        return
+    if update_fields is None or set(update_fields) & set(TIMING_FIELDS):
+        refresh_deadlines(instance)
+
+
+for signal in (post_save, post_delete):
+    signal.connect(retire_question_key, sender=Question, dispatch_uid=f'answer_key_question_{signal is post_save}')
+    signal.connect(retire_option_key, sender=QuestionOption, dispatch_uid=f'answer_key_option_{signal is post_save}')
+    signal.connect(retire_question_image_key, sender=ImageRendition, dispatch_uid=f'answer_key_rendition_{signal is post_save}')
+post_save.connect(build_published_key, sender=Assessment, dispatch_uid='answer_key_publish')
+post_save.connect(move_attempt_deadlines, sender=Assessment, dispatch_uid='attempt_deadlines')
@@ -1,14 +1,95 @@
 from celery import shared_task
+from django.db.models import Case, DateTimeField, IntegerField, Value, When
 from django.utils import timezone
-from .models import StudentAssessmentAttempt
+from course.expiry import sweep
+from .autosave import buffered_answers_many, discard_buffers
+from .grading import answer_key, grade_attempts
+from .models import StudentAnswer, StudentAssessmentAttempt
 
-@shared_task
-def expire_old_attempts():
-    now = timezone.now()
-    attempts = StudentAssessmentAttempt.objects.filter(
-        status=StudentAssessmentAttempt.AttemptStatus.IN_PROGRESS
+
+def expired_attempts(now):
+    """In-progress attempts whose deadline has passed, served by the (status, deadline_at) index."""
+    return StudentAssessmentAttempt.objects.filter(
+        status=StudentAssessmentAttempt.AttemptStatus.IN_PROGRESS,
+        deadline_at__lte=now,
     )
 
+
+def grade_expired(rows):
+    """
+    Auto-grades the attempts just expired by ``expire_attempts``: their
+    answers, written or still autosaved, are read together and every
+    attempt is graded in one pass, with rows for unanswered questions.
+    """
+    attempts = list(
+        StudentAssessmentAttempt.objects.filter(
+            pk__in=[row[0] for row in rows],
+            status=StudentAssessmentAttempt.AttemptStatus.EXPIRED,
+        ).select_related('assessment')
+    )
+    if not attempts:
+        return
+
+    answers = {attempt.pk: {} for attempt in attempts}
+    # the buffers first, so an autosave flush in between is not missed
+    buffered = buffered_answers_many(answers)
+    for answer in StudentAnswer.objects.filter(attempt__in=attempts):
+        answers[answer.attempt_id][answer.question_id] = answer
+
+    graded = []
     for attempt in attempts:
-        if attempt.is_expired:
-            attempt.expire_attempt()
+        key = answer_key(attempt.assessment_id)
+        rows_by_question = answers[attempt.pk]
+        for question_id in key.entries:
+            if question_id not in rows_by_question:
+                rows_by_question[question_id] = StudentAnswer(attempt=attempt, question_id=question_id)
+        for question_id, (selected_option_id, text_answer) in buffered.get(attempt.pk, {}).items():
+            if question_id in rows_by_question:
+                rows_by_question[question_id].selected_option_id = selected_option_id
+                rows_by_question[question_id].text_answer = text_answer
+        graded.append((attempt, list(rows_by_question.values()), key))
+
+    # answers waiting for the teacher leave the attempt SUBMITTED, so it
+    # shows up in the pending grading list
+    grade_attempts(graded, graded_status=StudentAssessmentAttempt.AttemptStatus.EXPIRED)
+    discard_buffers(answers)
+
+
+def expire_attempts(now=None, batch_size=None, attempts=None):
+    """
+    Expires the attempts past their deadline (or the in-progress ones of
+    ``attempts``) as of their deadline, and auto-grades them.
+    """
+    now = now or timezone.now()
+    if attempts is None:
+        attempts = expired_attempts(now)
+    else:
+        attempts = attempts.filter(status=StudentAssessmentAttempt.AttemptStatus.IN_PROGRESS)
+
+    def values(rows):
+        ended = {pk: min(deadline_at or now, now) for pk, _, deadline_at in rows}
+        return {
+            'status': StudentAssessmentAttempt.AttemptStatus.EXPIRED,
+            'ended_at': Case(
+                *[When(pk=pk, then=Value(ended[pk])) for pk, _, _ in rows],
+                output_field=DateTimeField(),
+            ),
+            'time_taken': Case(
+                *[When(pk=pk, then=Value(int((ended[pk] - started_at).total_seconds()))) for pk, started_at, _ in rows],
+                output_field=IntegerField(),
+            ),
+        }
+
+    return sweep(
+        attempts,
+        values,
+        fields=('started_at', 'deadline_at'),
+        batch_size=batch_size,
+        name='attempts',
+        after=grade_expired,
+    )
+
+
+@shared_task
+def expire_old_attempts():
+    return expire_attempts()
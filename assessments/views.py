@@ -9,17 +9,20 @@ from userAuth.models import TeacherProfile,StudentProfile,User
 from django.utils import timezone
 from assessments.serializers import AssessmentRetrieveSerializer
 from course.models import Course
-from rest_framework.pagination import PageNumberPagination
+from api.views import ReorderAPIView
+from api.pagination import ListPagination
 from rest_framework.permissions import IsAuthenticated
 from course.permissions import IsStudent,IsTeacher
 from .permissions import (IsStudentEnrolledAndAssessmentAvailable,CanSubmitAttempt,IsTeacherAndAssessmentOwner,
 IsQuestionOwner,IsTeacherOfQuestionOption)
 from .models import (Assessment, Question, QuestionOption, StudentAssessmentAttempt, StudentAnswer)
+from .autosave import AutosaveBusy
+from .papers import question_paper
 from .serializers import (
     AssessmentCreateSerializer, AssessmentUpdateSerializer, AssessmentListSerializer, AssessmentRetrieveSerializer,
     QuestionCreateSerializer, QuestionUpdateSerializer, QuestionListSerializer, QuestionRetrieveSerializer,
     QuestionOptionCreateSerializer, QuestionOptionUpdateSerializer, QuestionOptionListSerializer,
-    StudentAssessmentAttemptCreateSerializer, StudentAssessmentAttemptSubmitSerializer,
+    StudentAssessmentAttemptCreateSerializer, StudentAssessmentAttemptSubmitSerializer, StudentAssessmentAttemptAutosaveSerializer,
     StudentAssessmentAttemptListSerializer, StudentAssessmentAttemptDetailSerializer,
     TeacherAnswerGradeSerializer, 
 )
@@ -125,6 +128,15 @@ class TeacherQuestionRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPI
         return QuestionRetrieveSerializer
 
 
+class TeacherQuestionReorderView(ReorderAPIView):
+    """
+    POST: Put all questions of an assessment in the given order
+    """
+    permission_classes = [IsAuthenticated, IsQuestionOwner]
+    queryset = Question.objects.all()
+    parent_lookup = 'assessment_id'
+
+
 class TeacherQuestionOptionListCreateView(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated, IsTeacherOfQuestionOption]
     
@@ -161,6 +173,13 @@ class TeacherQuestionOptionRetrieveUpdateDestroyView(generics.RetrieveUpdateDest
         return QuestionOptionListSerializer
     
 
+class TeacherQuestionOptionReorderView(ReorderAPIView):
+    permission_classes = [IsAuthenticated, IsTeacherOfQuestionOption]
+
+    def get_siblings(self):
+        return QuestionOption.objects.filter(question_id=self.kwargs['question_id'])
+    
+
 # Student Views
 class StudentAssessmentListView(generics.ListAPIView):
     serializer_class = AssessmentListSerializer
@@ -210,24 +229,26 @@ class StudentStartAssessmentView(generics.CreateAPIView):
     serializer_class = StudentAssessmentAttemptCreateSerializer
     permission_classes = [IsAuthenticated, IsStudentEnrolledAndAssessmentAvailable]
 
-    def create(self, request, *args, **kwargs):
-        data = request.data.copy()
-        data['assessment'] = self.kwargs['assessment_id']
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # set by IsStudentEnrolledAndAssessmentAvailable
+        context['assessment'] = self.assessment
+        return context
 
-        serializer = self.get_serializer(data=data)
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data={})
         serializer.is_valid(raise_exception=True)
         attempt = self.perform_create(serializer)
-
-        assessment_data = AssessmentRetrieveSerializer(attempt.assessment).data
+        assessment = self.assessment
 
         return Response({
             'attempt_id': attempt.id,
             'message': 'Assessment started successfully',
-            'assessment': assessment_data,
-            'time_limit': attempt.assessment.time_limit if attempt.assessment.is_timed else None,
-            'total_questions': attempt.assessment.total_questions,
-            'available_from': attempt.assessment.available_from,
-            'available_until': attempt.assessment.available_until
+            'assessment': question_paper(assessment),
+            'time_limit': assessment.time_limit if assessment.is_timed else None,
+            'total_questions': assessment.total_questions,
+            'available_from': assessment.available_from,
+            'available_until': assessment.available_until
         }, status=status.HTTP_201_CREATED)
 
     def perform_create(self, serializer):
@@ -239,12 +260,8 @@ class StudentSubmitAssessmentView(generics.UpdateAPIView):
     permission_classes = [IsAuthenticated,IsStudent, CanSubmitAttempt]
     
     def get_object(self):
-        attempt_id = self.kwargs.get('attempt_id')
-        return get_object_or_404(
-            StudentAssessmentAttempt,
-            id=attempt_id,
-            student=self.request.user.student_profile
-        )
+        # loaded with its assessment by CanSubmitAttempt
+        return self.attempt
     
     def update(self, request, *args, **kwargs):
         attempt = self.get_object()
@@ -257,6 +274,31 @@ class StudentSubmitAssessmentView(generics.UpdateAPIView):
             'attempt_id': updated_attempt.id
         }, status=status.HTTP_200_OK)
         
+# student autosave answers while the attempt is in progress
+class StudentAutosaveAttemptView(generics.UpdateAPIView):
+    serializer_class = StudentAssessmentAttemptAutosaveSerializer
+    permission_classes = [IsAuthenticated, IsStudent, CanSubmitAttempt]
+    http_method_names = ['patch']
+
+    def get_object(self):
+        # loaded with its assessment by CanSubmitAttempt
+        return self.attempt
+
+    def update(self, request, *args, **kwargs):
+        attempt = self.get_object()
+        serializer = self.get_serializer(attempt, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            serializer.save()
+        except AutosaveBusy:
+            return Response({'message': 'Answers are still being saved, please resend.'}, status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+
+        return Response({
+            'message': 'Answers saved',
+            'attempt_id': attempt.id,
+            'flushed': serializer.flushed
+        }, status=status.HTTP_200_OK)
+
 # to show result of specific attemp
 class StudentAssessmentAttemptDetailView(generics.RetrieveAPIView):
     serializer_class = StudentAssessmentAttemptDetailSerializer
@@ -449,7 +491,7 @@ class TeacherGradeAnswerView(generics.UpdateAPIView):
 
 
 # pagination
-class TeacherAttemptsPagination(PageNumberPagination):
+class TeacherAttemptsPagination(ListPagination):
     page_size = 10  
     page_size_query_param = 'page_size' 
     max_page_size = 100
@@ -458,6 +500,7 @@ class TeacherStudentsAttempts(generics.ListAPIView):
     serializer_class = StudentAssessmentAttemptListSerializer
     permission_classes = [IsAuthenticated, IsTeacherAndAssessmentOwner]
     pagination_class = TeacherAttemptsPagination
+    cursor_ordering = ('-started_at', '-id')
     
     def get_queryset(self):
         teacher = self.request.user.teacher_profile
@@ -481,7 +524,7 @@ class TeacherStudentsAttempts(generics.ListAPIView):
     
 
 # pagination
-class AllStudentAttempsPagination(PageNumberPagination):
+class AllStudentAttempsPagination(ListPagination):
     page_size = 10  
     page_size_query_param = 'page_size' 
     max_page_size = 100
@@ -489,6 +532,7 @@ class AllStudentAttemps(generics.ListAPIView):
     serializer_class = StudentAssessmentAttemptListSerializer
     permission_classes = [IsAuthenticated, IsTeacherAndAssessmentOwner]
     pagination_class = AllStudentAttempsPagination
+    cursor_ordering = ('-started_at', '-id')
     
     def get_queryset(self):
         teacher = self.request.user.teacher_profile
@@ -0,0 +1,180 @@
+"""
+Per-request access resolution.
+
+Permission classes and views used to load the lesson or module and query
+the student's enrollments once each, so a single lesson request ran the
+same lookups twice. They now share one ``AccessContext`` that is attached
+to the request. It loads each lesson or module at most once, along with its
+course, and reads the student's rows of the entitlement table (see
+entitlements.py) at most once, with a single indexed query.
+
+Those rows are also cached per student for ``ACCESS_CACHE_TTL`` seconds.
+Whenever they change, the cached copy is dropped after commit. Expiry is
+checked on every use, so a grant stops working the moment it ends.
+"""
+
+from dataclasses import dataclass
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.functional import cached_property
+from userAuth.models import User
+from .deferred import defer
+from .models import CourseModule, Entitlement, Lesson
+
+
+def _cache_key(user_id):
+    return f'access:entitlements:{user_id}'
+
+
+@dataclass(frozen=True)
+class Entitlements:
+    # id -> expiry (None for no expiry)
+    courses: dict
+    modules: dict
+    # course id of every granted module
+    module_courses: dict
+
+    def _granted(self, grants, pk):
+        if pk not in grants:
+            return False
+        expires_at = grants[pk]
+        return expires_at is None or expires_at > timezone.now()
+
+    def course(self, course_id):
+        return self._granted(self.courses, course_id)
+
+    def module(self, module_id):
+        return self._granted(self.modules, module_id)
+
+    def any_module_of(self, course_id):
+        return any(course == course_id and self.module(module_id) for module_id, course in self.module_courses.items())
+
+
+NO_ENTITLEMENTS = Entitlements({}, {}, {})
+
+
+def load_entitlements(user_id):
+    """The student's grants, from the cache when possible."""
+    key = _cache_key(user_id)
+    cached = cache.get(key)
+    if cached is not None:
+        return Entitlements(*cached)
+
+    courses, modules, module_courses = {}, {}, {}
+    rows = Entitlement.objects.filter(student__user_id=user_id).values_list('course_id', 'module_id', 'expires_at')
+    for course_id, module_id, expires_at in rows:
+        if module_id is None:
+            courses[course_id] = expires_at
+        else:
+            modules[module_id] = expires_at
+            module_courses[module_id] = course_id
+    cache.set(key, (courses, modules, module_courses), timeout=settings.ACCESS_CACHE_TTL)
+    return Entitlements(courses, modules, module_courses)
+
+
+def _forget(user_ids):
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+def forget_entitlements(user_id):
+    """Drop the cached entitlements of the student ``user_id`` once the transaction commits."""
+    defer('access-entitlements', user_id, flush=_forget)
+
+
+def _is_free(item):
+    return item.is_free or item.price == 0
+
+
+class AccessContext:
+    """What the user of one request may see. Use ``get_access(request)``."""
+
+    def __init__(self, user):
+        self.user = user
+        self._lessons = {}
+        self._modules = {}
+
+    @cached_property
+    def is_teacher(self):
+        return self.user.is_authenticated and self.user.user_type == User.userType.TEACHER
+
+    @cached_property
+    def is_student(self):
+        return self.user.is_authenticated and self.user.user_type == User.userType.STUDENT
+
+    @cached_property
+    def entitlements(self):
+        if not self.is_student:
+            return NO_ENTITLEMENTS
+        return load_entitlements(self.user.pk)
+
+    def lesson(self, lesson_id):
+        """The lesson with its module and course, or None; loaded once per request."""
+        key = str(lesson_id)
+        if key not in self._lessons:
+            lesson = Lesson.objects.select_related('module__course__teacher').filter(id=lesson_id).first()
+            self._lessons[key] = lesson
+            if lesson is not None:
+                self._modules.setdefault(str(lesson.module_id), lesson.module)
+        return self._lessons[key]
+
+    def module(self, module_id):
+        """The module with its course, or None; loaded once per request."""
+        key = str(module_id)
+        if key not in self._modules:
+            self._modules[key] = CourseModule.objects.select_related('course__teacher').filter(id=module_id).first()
+        return self._modules[key]
+
+    def owns_course(self, course):
+        return self.is_teacher and course.teacher.user_id == self.user.pk
+
+    def has_full_access(self, course_id):
+        return self.entitlements.course(course_id)
+
+    def has_module(self, module_id):
+        return self.entitlements.module(module_id)
+
+    def can_view_module(self, module):
+        course = module.course
+        if self.owns_course(course):
+            return True
+        if not self.is_student:
+            return False
+        if _is_free(course) and course.is_published and module.is_published:
+            return True
+        if _is_free(module) and module.is_published:
+            return True
+        return self.has_full_access(course.pk) or self.has_module(module.pk)
+
+    def can_view_lesson(self, lesson):
+        module = lesson.module
+        course = module.course
+        if self.owns_course(course):
+            return True
+        if not self.is_student or not lesson.is_published:
+            return False
+        if _is_free(course) and course.is_published:
+            return True
+        if _is_free(module) and module.is_published:
+            return True
+        return self.has_full_access(course.pk) or self.has_module(module.pk)
+
+    def can_take_assessment(self, assessment):
+        """Enrollment in whatever the assessment is attached to."""
+        if not self.is_student:
+            return False
+        if assessment.course_id:
+            return self.has_full_access(assessment.course_id)
+        if assessment.module_id:
+            return self.has_module(assessment.module_id)
+        if assessment.lesson_id:
+            return self.has_module(assessment.lesson.module_id)
+        return False
+
+
+def get_access(request):
+    """The ``AccessContext`` of ``request``, created on first use."""
+    context = getattr(request, '_access_context', None)
+    if context is None or context.user is not request.user:
+        context = request._access_context = AccessContext(request.user)
+    return context
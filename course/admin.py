@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import CourseCategory, Course, CourseEnrollment , Coupon ,CouponUsage,CourseModule,Lesson, ModuleEnrollment,Rating,StudentLessonProgress
+from .models import CourseCategory, Course, CourseEnrollment , Coupon ,CouponUsage,CourseModule,Entitlement,Lesson, ModuleEnrollment,Rating,StudentLessonProgress,VideoUpload
 
 # Register your models here.
 
@@ -30,7 +30,7 @@ class CouponAdmin(admin.ModelAdmin):
 admin.site.register(Coupon, CouponAdmin)
 
 class CourseEnrollmentAdmin(admin.ModelAdmin):
-    list_display = ('id','student', 'course', 'status',  'enrollment_date','ended_date','progress','is_completed','last_activity')
+    list_display = ('id','student', 'course', 'status',  'enrollment_date','ended_date','progress','completed_lessons','total_lessons','is_completed','last_activity')
     list_filter = ('status',)
     search_fields = ('student',)
     raw_id_fields = ('student', 'course')
@@ -75,6 +75,13 @@ class ModuleEnrollmentAdmin(admin.ModelAdmin):
 admin.site.register(ModuleEnrollment ,ModuleEnrollmentAdmin)
 
 
+class EntitlementAdmin(admin.ModelAdmin):
+    list_display = ('id', 'student', 'course', 'module', 'expires_at')
+    raw_id_fields = ('student', 'course', 'module')
+
+admin.site.register(Entitlement, EntitlementAdmin)
+
+
 class RatingAdmin(admin.ModelAdmin):
     list_display = ('id', 'course', 'student', 'rating', 'created_at')
     list_filter = ('course', 'student')
@@ -83,3 +90,10 @@ class RatingAdmin(admin.ModelAdmin):
 
 admin.site.register(Rating, RatingAdmin)
 
+
+
+class VideoUploadAdmin(admin.ModelAdmin):
+    list_display = ('id', 'lesson', 'filename', 'offset', 'upload_length', 'created_at', 'completed_at')
+    raw_id_fields = ('lesson',)
+
+admin.site.register(VideoUpload, VideoUploadAdmin)
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class CourseConfig(AppConfig):
@@ -7,3 +8,6 @@ class CourseConfig(AppConfig):
 
     def ready(self):
         import course.signals
+        from course.search import ensure_search_backend
+
+        post_migrate.connect(ensure_search_backend, sender=self, dispatch_uid='course-search-backend')
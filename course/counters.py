@@ -0,0 +1,211 @@
+"""
+Denormalized counter maintenance for Course and TeacherProfile.
+
+Signal handlers record deltas with ``adjust()`` and rating changes with
+``schedule_rating_refresh()``. Everything recorded inside a transaction is
+coalesced per row and applied after commit: rows sharing the same delta get
+one UPDATE, ratings are re-aggregated once per course, and a teacher's
+rating is recomputed only when one of their course averages really moved.
+The hot Course rows are therefore never locked by the transaction that
+enrolled a student or posted a review.
+
+``check_counters()`` diffs the stored values against ground-truth
+aggregates and can repair them.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+from django.db.models import Avg, Count, F, Value
+from django.db.models.functions import Greatest
+from userAuth.models import TeacherProfile
+from .deferred import defer
+from .models import Course, CourseEnrollment, Lesson, Rating
+import logging
+
+logger = logging.getLogger(__name__)
+
+TWO_PLACES = Decimal('0.01')
+
+
+def _merge_deltas(old, new):
+    merged = dict(old)
+    for field, delta in new.items():
+        merged[field] = merged.get(field, 0) + delta
+    return merged
+
+
+def _apply_deltas(model):
+    def flush(items):
+        groups = defaultdict(list)
+        for pk, deltas in items.items():
+            deltas = tuple(sorted((field, delta) for field, delta in deltas.items() if delta))
+            if deltas:
+                groups[deltas].append(pk)
+
+        for deltas, pks in groups.items():
+            model.objects.filter(pk__in=pks).update(
+                **{field: Greatest(F(field) + delta, Value(0)) for field, delta in deltas}
+            )
+    return flush
+
+
+def adjust(model, pk, **deltas):
+    """Add ``deltas`` to counter fields of one row once the transaction commits."""
+    defer(f'counters:{model._meta.label}', pk, deltas, flush=_apply_deltas(model), combine=_merge_deltas)
+
+
+def _average(value):
+    return Decimal(str(value or 0)).quantize(TWO_PLACES)
+
+
+def refresh_course_ratings(course_ids):
+    """Recompute total_reviews/average_rating for the given courses in one aggregate."""
+    course_ids = list(course_ids)
+    stats = {
+        row['course_id']: (row['total'], _average(row['average']))
+        for row in Rating.objects.filter(course_id__in=course_ids)
+        .values('course_id')
+        .annotate(total=Count('id'), average=Avg('rating'))
+    }
+
+    changed = []
+    teacher_ids = set()
+    for course in Course.objects.filter(pk__in=course_ids).only('id', 'teacher_id', 'total_reviews', 'average_rating'):
+        total, average = stats.get(course.id, (0, _average(0)))
+        if course.total_reviews == total and _average(course.average_rating) == average:
+            continue
+        if _average(course.average_rating) != average:
+            teacher_ids.add(course.teacher_id)
+        course.total_reviews = total
+        course.average_rating = average
+        changed.append(course)
+
+    if changed:
+        Course.objects.bulk_update(changed, ['total_reviews', 'average_rating'])
+    if teacher_ids:
+        refresh_teacher_ratings(teacher_ids)
+
+
+def refresh_teacher_ratings(teacher_ids):
+    """Teacher rating is the mean of their rated courses' averages."""
+    teacher_ids = list(teacher_ids)
+    averages = dict(
+        Course.objects.filter(teacher_id__in=teacher_ids)
+        .exclude(average_rating=0)
+        .values('teacher_id')
+        .annotate(average=Avg('average_rating'))
+        .values_list('teacher_id', 'average')
+    )
+
+    changed = []
+    for teacher in TeacherProfile.objects.filter(pk__in=teacher_ids).only('id', 'rating'):
+        rating = _average(averages.get(teacher.id))
+        if _average(teacher.rating) != rating:
+            teacher.rating = rating
+            changed.append(teacher)
+    if changed:
+        TeacherProfile.objects.bulk_update(changed, ['rating'])
+
+
+def schedule_rating_refresh(course_id):
+    defer('counters:course-ratings', course_id, flush=refresh_course_ratings)
+
+
+def schedule_teacher_rating_refresh(teacher_id):
+    defer('counters:teacher-ratings', teacher_id, flush=refresh_teacher_ratings)
+
+
+def _grouped(queryset, key, **aggregates):
+    return {row[key]: row for row in queryset.values(key).annotate(**aggregates)}
+
+
+def _check_courses(course_ids, fix):
+    enrollments = _grouped(CourseEnrollment.objects.filter(course_id__in=course_ids), 'course_id', total=Count('id'))
+    lessons = _grouped(Lesson.objects.filter(module__course_id__in=course_ids), 'module__course_id', total=Count('id'))
+    ratings = _grouped(Rating.objects.filter(course_id__in=course_ids), 'course_id', total=Count('id'), average=Avg('rating'))
+
+    drift = []
+    changed = []
+    fields = ['total_enrollments', 'total_lessons', 'total_reviews', 'average_rating']
+    for course in Course.objects.filter(pk__in=course_ids).only('id', *fields):
+        expected = {
+            'total_enrollments': enrollments.get(course.id, {}).get('total', 0),
+            'total_lessons': lessons.get(course.id, {}).get('total', 0),
+            'total_reviews': ratings.get(course.id, {}).get('total', 0),
+            'average_rating': _average(ratings.get(course.id, {}).get('average')),
+        }
+        stored = {field: getattr(course, field) for field in fields}
+        stored['average_rating'] = _average(stored['average_rating'])
+
+        diff = [(field, stored[field], value) for field, value in expected.items() if stored[field] != value]
+        if not diff:
+            continue
+        drift.extend(('course', course.id, field, old, new) for field, old, new in diff)
+        for field, _, value in diff:
+            setattr(course, field, value)
+        changed.append(course)
+
+    if fix and changed:
+        Course.objects.bulk_update(changed, fields)
+    return drift
+
+
+def _check_teachers(teacher_ids, fix):
+    courses = _grouped(Course.objects.filter(teacher_id__in=teacher_ids), 'teacher_id', total=Count('id'))
+    averages = _grouped(
+        Course.objects.filter(teacher_id__in=teacher_ids).exclude(average_rating=0), 'teacher_id', average=Avg('average_rating')
+    )
+
+    drift = []
+    changed = []
+    for teacher in TeacherProfile.objects.filter(pk__in=teacher_ids).only('id', 'number_of_courses', 'rating'):
+        expected = {
+            'number_of_courses': courses.get(teacher.id, {}).get('total', 0),
+            'rating': _average(averages.get(teacher.id, {}).get('average')),
+        }
+        stored = {'number_of_courses': teacher.number_of_courses, 'rating': _average(teacher.rating)}
+
+        diff = [(field, stored[field], value) for field, value in expected.items() if stored[field] != value]
+        if not diff:
+            continue
+        drift.extend(('teacher', teacher.id, field, old, new) for field, old, new in diff)
+        for field, _, value in diff:
+            setattr(teacher, field, value)
+        changed.append(teacher)
+
+    if fix and changed:
+        TeacherProfile.objects.bulk_update(changed, ['number_of_courses', 'rating'])
+    return drift
+
+
+def _chunks(ids, size):
+    chunk = []
+    for pk in ids:
+        chunk.append(pk)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def check_counters(fix=False, batch_size=500):
+    """
+    Compare every stored counter with its aggregate.
+
+    Returns ``(kind, pk, field, stored, expected)`` tuples. Courses are checked
+    (and fixed) before teachers, because a teacher's rating is derived from
+    the course averages.
+    """
+    drift = []
+    course_ids = Course.objects.values_list('id', flat=True).iterator(chunk_size=batch_size)
+    for chunk in _chunks(course_ids, batch_size):
+        drift.extend(_check_courses(chunk, fix))
+
+    teacher_ids = TeacherProfile.objects.values_list('id', flat=True).iterator(chunk_size=batch_size)
+    for chunk in _chunks(teacher_ids, batch_size):
+        drift.extend(_check_teachers(chunk, fix))
+
+    if fix and drift:
+        logger.info(f"Repaired {len(drift)} drifted counters.")
+    return drift
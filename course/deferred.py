@@ -0,0 +1,93 @@
+"""
+Per-transaction work coalescing.
+
+Signal handlers call ``defer()`` instead of writing immediately. Items are
+grouped by namespace and key, and each namespace's ``flush`` callable runs
+once with all of its items after the surrounding transaction commits. If
+the transaction rolls back, the queued work is dropped with it, and work
+queued inside a savepoint that rolls back is dropped with the savepoint.
+Outside an atomic block the item is flushed straight away.
+"""
+
+import threading
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+
+_local = threading.local()
+
+
+class _Batch:
+    def __init__(self, savepoints):
+        # the savepoints whose rollback drops this batch
+        self.savepoints = savepoints
+        self.namespaces = {}
+        self.done = False
+
+    def run(self):
+        self.done = True
+        namespaces, self.namespaces = self.namespaces, {}
+        for flush, items in namespaces.values():
+            flush(items)
+
+
+def _live_batches(using):
+    connection = transaction.get_connection(using)
+    queued = {id(entry[1]) for entry in connection.run_on_commit}
+    # a batch is only reusable while its callback is still queued on this
+    # transaction and has not run yet; after a commit or rollback django
+    # clears run_on_commit, and rolling back a savepoint drops the callbacks
+    # registered inside it
+    batches = [
+        batch for batch in getattr(_local, 'batches', {}).get(using, [])
+        if not batch.done and id(batch.run) in queued
+    ]
+    if getattr(_local, 'batches', None) is None:
+        _local.batches = {}
+    _local.batches[using] = batches
+    return batches
+
+
+def _current_batch(using):
+    connection = transaction.get_connection(using)
+    savepoints = frozenset(sid for sid in connection.savepoint_ids if sid)
+    # an item may join a batch registered in the same or a deeper savepoint
+    # (since released): every savepoint that could undo the item undoes it
+    for batch in _live_batches(using):
+        if savepoints <= batch.savepoints:
+            return batch
+
+    batch = _Batch(savepoints)
+    batch.run = batch.run  # pin the bound method so the identity check in _live_batches holds
+    _local.batches[using].append(batch)
+    transaction.on_commit(batch.run, using=using)
+    return batch
+
+
+def defer(namespace, key, value=None, *, flush, combine=None, using=None):
+    """
+    Queue ``value`` under ``key`` for ``namespace``.
+
+    ``flush(items)`` receives a dict of every key queued in the transaction.
+    ``combine(old, new)`` merges repeated keys; by default the first value wins.
+    """
+    using = using or DEFAULT_DB_ALIAS
+    connection = transaction.get_connection(using)
+
+    if not connection.in_atomic_block:
+        flush({key: value})
+        return
+
+    batch = _current_batch(using)
+    _, items = batch.namespaces.setdefault(namespace, (flush, {}))
+    if key in items and combine is not None:
+        items[key] = combine(items[key], value)
+    else:
+        items.setdefault(key, value)
+
+
+def pending(namespace, using=None):
+    """The keys queued for ``namespace`` in the current transaction and not flushed yet."""
+    items = {}
+    for batch in _live_batches(using or DEFAULT_DB_ALIAS):
+        items.update(batch.namespaces.get(namespace, (None, {}))[1])
+    return items
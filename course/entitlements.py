@@ -0,0 +1,111 @@
+"""
+The student entitlement table.
+
+``Entitlement`` rows say which courses a student has full access to and
+which modules they are enrolled in, and until when. They are derived from
+the enrollments:
+
+* an active full-access ``CourseEnrollment`` grants its course;
+* an active ``ModuleEnrollment`` with status active grants its module.
+
+A grant lasts until the enrollment's ``ended_date``. No grant is made
+while the teacher has blocked the student. Free courses and modules need
+no rows.
+
+Enrollment writes (including coupon redemptions), the expiry sweep, and
+blocking or unblocking a student mark the student dirty. Their rows are
+re-derived once per transaction, after commit, and only the rows that
+differ are written. ``rebuild_entitlements`` re-derives everyone, for
+backfills and repairs.
+"""
+
+from django.db.models import Exists, OuterRef
+from userAuth.models import StudentProfile, TeacherStudentProfile
+from .access import forget_entitlements
+from .deferred import defer
+from .models import CourseEnrollment, Entitlement, ModuleEnrollment
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _not_blocked(teacher_path):
+    return ~Exists(TeacherStudentProfile.objects.filter(
+        student=OuterRef('student'),
+        teacher=OuterRef(teacher_path),
+        is_active=False,
+    ))
+
+
+def derive(student_ids):
+    """``{(student_id, course_id, module_id): expires_at}`` as the enrollments of ``student_ids`` dictate."""
+    grants = {}
+    courses = CourseEnrollment.objects.filter(
+        _not_blocked('course__teacher'),
+        student_id__in=student_ids,
+        is_active=True,
+        access_type=CourseEnrollment.AccessType.FULL_ACCESS,
+    ).values_list('student_id', 'course_id', 'ended_date')
+    for student_id, course_id, ended_date in courses:
+        grants[(student_id, course_id, None)] = ended_date
+
+    modules = ModuleEnrollment.objects.filter(
+        _not_blocked('module__course__teacher'),
+        student_id__in=student_ids,
+        is_active=True,
+        status=ModuleEnrollment.EnrollmentStatus.ACTIVE,
+    ).values_list('student_id', 'module__course_id', 'module_id', 'ended_date')
+    for student_id, course_id, module_id, ended_date in modules:
+        grants[(student_id, course_id, module_id)] = ended_date
+    return grants
+
+
+def sync_entitlements(student_ids):
+    """
+    Brings the entitlement rows of ``student_ids`` in line with their
+    enrollments. Returns ``{'created', 'updated', 'deleted'}``.
+    """
+    student_ids = list(student_ids)
+    desired = derive(student_ids)
+    existing = {
+        (row.student_id, row.course_id, row.module_id): row
+        for row in Entitlement.objects.filter(student_id__in=student_ids)
+    }
+
+    created, updated = [], []
+    for key, expires_at in desired.items():
+        row = existing.pop(key, None)
+        if row is None:
+            created.append(Entitlement(student_id=key[0], course_id=key[1], module_id=key[2], expires_at=expires_at))
+        elif row.expires_at != expires_at:
+            row.expires_at = expires_at
+            updated.append(row)
+
+    if existing:
+        Entitlement.objects.filter(pk__in=[row.pk for row in existing.values()]).delete()
+    if created:
+        Entitlement.objects.bulk_create(created)
+    if updated:
+        Entitlement.objects.bulk_update(updated, ['expires_at'])
+
+    if created or updated or existing:
+        for user_id in StudentProfile.objects.filter(pk__in=student_ids).values_list('user_id', flat=True):
+            forget_entitlements(user_id)
+    return {'created': len(created), 'updated': len(updated), 'deleted': len(existing)}
+
+
+def schedule_sync(student_id):
+    """Re-derive the entitlements of ``student_id`` once the transaction commits."""
+    defer('entitlements', student_id, flush=sync_entitlements)
+
+
+def rebuild_entitlements(batch_size=500):
+    """Re-derives the entitlements of every student. Returns the summed counts of ``sync_entitlements``."""
+    totals = {'created': 0, 'updated': 0, 'deleted': 0}
+    student_ids = list(StudentProfile.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(student_ids), batch_size):
+        counts = sync_entitlements(student_ids[start:start + batch_size])
+        for key, value in counts.items():
+            totals[key] += value
+    logger.info(f"Rebuilt entitlements of {len(student_ids)} students: {totals}")
+    return totals
@@ -0,0 +1,104 @@
+"""
+Set-based expiry sweeps.
+
+Each sweep walks the rows matching an expiry predicate in primary key order,
+one batch at a time, and expires every batch with a single UPDATE. The
+predicate is applied again in the UPDATE so rows changed concurrently (a
+coupon re-activated, an attempt submitted) are left alone. The work done is
+proportional to the number of expiring rows, not the size of the table, as
+long as the predicate is backed by an index.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Coupon, CourseEnrollment, ModuleEnrollment
+from .entitlements import schedule_sync
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def sweep(queryset, values, *, fields=(), batch_size=None, name=None, after=None):
+    """
+    Expire every row of ``queryset`` in batches of ``batch_size``.
+
+    ``values`` is either a dict of field updates or a callable that receives
+    the batch as a list of ``(pk, *fields)`` tuples and returns the dict, for
+    updates that depend on the row (e.g. ``Case``/``When`` expressions).
+    ``after`` receives the same rows once their batch is expired.
+
+    Returns ``{'scanned', 'expired', 'batches', 'elapsed'}``.
+    """
+    batch_size = batch_size or settings.EXPIRY_SWEEP_BATCH_SIZE
+    name = name or queryset.model._meta.label
+    started = time.monotonic()
+    scanned = expired = batches = 0
+    last_pk = None
+
+    candidates = queryset.order_by('pk').values_list('pk', *fields)
+    while True:
+        batch = candidates.filter(pk__gt=last_pk) if last_pk is not None else candidates
+        rows = list(batch[:batch_size])
+        if not rows:
+            break
+
+        last_pk = rows[-1][0]
+        pks = [row[0] for row in rows]
+        update = values(rows) if callable(values) else values
+        # a batch and its follow-up commit together
+        with transaction.atomic():
+            expired += queryset.filter(pk__in=pks).update(**update)
+            if after is not None:
+                after(rows)
+        scanned += len(rows)
+        batches += 1
+
+    metrics = {
+        'scanned': scanned,
+        'expired': expired,
+        'batches': batches,
+        'elapsed': round(time.monotonic() - started, 3),
+    }
+    logger.info(f"Expiry sweep {name}: {metrics}")
+    return metrics
+
+
+def expire_coupons(now=None, batch_size=None):
+    now = now or timezone.now()
+    return sweep(
+        Coupon.objects.filter(is_active=True, expiration_date__lte=now),
+        {'is_active': False},
+        batch_size=batch_size,
+        name='coupons',
+    )
+
+
+def _sync_expired_entitlements(rows):
+    for _, student_id in rows:
+        schedule_sync(student_id)
+
+
+def expire_enrollments(now=None, batch_size=None):
+    now = now or timezone.now()
+    return sweep(
+        CourseEnrollment.objects.filter(is_active=True, ended_date__lte=now),
+        {'is_active': False, 'status': CourseEnrollment.EnrollmentStatus.EXPIRED},
+        fields=('student_id',),
+        batch_size=batch_size,
+        name='enrollments',
+        after=_sync_expired_entitlements,
+    )
+
+
+def expire_module_enrollments(now=None, batch_size=None):
+    now = now or timezone.now()
+    return sweep(
+        ModuleEnrollment.objects.filter(is_active=True, ended_date__lte=now),
+        {'is_active': False, 'status': ModuleEnrollment.EnrollmentStatus.EXPIRED},
+        fields=('student_id',),
+        batch_size=batch_size,
+        name='module enrollments',
+        after=_sync_expired_entitlements,
+    )
@@ -0,0 +1,79 @@
+import random
+import statistics
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from course.models import Course
+from course.search import index_courses, search_courses
+from userAuth.models import User
+
+WORDS = (
+    'python', 'django', 'algebra', 'physics', 'chemistry', 'biology', 'history', 'english', 'arabic',
+    'geometry', 'statistics', 'programming', 'design', 'marketing', 'finance', 'drawing', 'music',
+    'beginner', 'advanced', 'complete', 'masterclass', 'revision', 'exam', 'practice', 'course',
+)
+PAGE_SIZE = 20
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the course search index against the old icontains filter on a throwaway '
+        'catalog. Everything it creates is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=100_000, help='Number of synthetic courses.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per query; the median is reported.')
+        parser.add_argument('--term', action='append', dest='terms', help='Search term (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def _time(self, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            count = queryset.count()
+            list(queryset[:PAGE_SIZE])
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings), count
+
+    def handle(self, *args, **options):
+        terms = options['terms'] or ['python', 'advanced physics', 'masterclas', 'histroy']
+        rng = random.Random(356)
+
+        with transaction.atomic():
+            suffix = uuid.uuid4().hex[:8]
+            teacher = User.objects.create(
+                username=f'benchmark_{suffix}',
+                email=f'benchmark_{suffix}@example.com',
+                phone=str(rng.randrange(10 ** 10, 10 ** 11)),
+                user_type=User.userType.TEACHER,
+            ).teacher_profile
+
+            self.stdout.write(f'Creating {options["courses"]} courses...')
+            for start in range(0, options['courses'], options['batch_size']):
+                size = min(options['batch_size'], options['courses'] - start)
+                courses = Course.objects.bulk_create(
+                    Course(
+                        teacher=teacher,
+                        title=' '.join(rng.sample(WORDS, 3)).title(),
+                        description=' '.join(rng.choices(WORDS, k=40)),
+                    )
+                    for _ in range(size)
+                )
+                index_courses([course.pk for course in courses])
+
+            published = Course.objects.filter(is_published=True).order_by('-created_at')
+            for term in terms:
+                old = published.filter(Q(title__icontains=term) | Q(description__icontains=term))
+                old_ms, old_count = self._time(old, options['repeat'])
+                new_ms, new_count = self._time(search_courses(published, term), options['repeat'])
+                self.stdout.write(
+                    f'{term!r}: icontains {old_ms:.1f} ms ({old_count} rows), '
+                    f'search index {new_ms:.1f} ms ({new_count} rows)'
+                )
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark finished, synthetic courses rolled back.'))
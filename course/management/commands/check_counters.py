@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from course.counters import check_counters
+
+
+class Command(BaseCommand):
+    help = 'Diffs Course and TeacherProfile counters against their aggregates and optionally repairs them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rewrite drifted counters.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        drift = check_counters(fix=options['fix'], batch_size=options['batch_size'])
+
+        for kind, pk, field, stored, expected in drift:
+            self.stdout.write(f'{kind} {pk}: {field} stored {stored}, expected {expected}')
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('All counters are consistent.'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Repaired {len(drift)} counters.'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{len(drift)} counters have drifted. Run with --fix to repair them.'))
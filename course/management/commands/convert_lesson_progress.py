@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from course.models import CourseEnrollment, ModuleEnrollment, StudentLessonProgress
+from course.provisioning import provision_student
+
+
+class Command(BaseCommand):
+    help = 'Converts StudentLessonProgress between the eager and sparse storage modes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', choices=['sparse', 'eager'], required=True, dest='mode')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if options['mode'] == 'sparse':
+            removed = self.drop_incomplete(batch_size)
+            self.stdout.write(self.style.SUCCESS(f'Removed {removed} incomplete progress rows.'))
+        else:
+            created = self.provision_all(batch_size)
+            self.stdout.write(self.style.SUCCESS(f'Provisioned progress rows for {created} enrollments.'))
+
+    def drop_incomplete(self, batch_size):
+        # incomplete rows carry no information, deleting them never changes progress
+        incomplete = StudentLessonProgress.objects.filter(is_completed=False).order_by('pk')
+        removed = 0
+        while True:
+            pks = list(incomplete.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return removed
+            removed += StudentLessonProgress.objects.filter(pk__in=pks).delete()[0]
+
+    def provision_all(self, batch_size):
+        enrollments = 0
+        course_access = CourseEnrollment.objects.filter(
+            is_active=True,
+            access_type=CourseEnrollment.AccessType.FULL_ACCESS,
+        ).values_list('student_id', 'course_id')
+        for student_id, course_id in course_access.iterator(chunk_size=batch_size):
+            provision_student(student_id, course_id=course_id, batch_size=batch_size)
+            enrollments += 1
+
+        module_access = ModuleEnrollment.objects.filter(
+            is_active=True,
+            status=ModuleEnrollment.EnrollmentStatus.ACTIVE,
+        ).values_list('student_id', 'module_id')
+        for student_id, module_id in module_access.iterator(chunk_size=batch_size):
+            provision_student(student_id, module_id=module_id, batch_size=batch_size)
+            enrollments += 1
+        return enrollments
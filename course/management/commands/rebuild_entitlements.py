@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from course.entitlements import rebuild_entitlements
+
+
+class Command(BaseCommand):
+    help = 'Regenerates the student entitlement table from course and module enrollments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        counts = rebuild_entitlements(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Entitlements rebuilt: {counts['created']} created, {counts['updated']} updated, {counts['deleted']} deleted."
+        ))
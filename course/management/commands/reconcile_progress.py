@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from course.progress import reconcile_progress
+
+
+class Command(BaseCommand):
+    help = 'Verifies enrollment progress counters against lesson progress rows and optionally repairs drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', action='append', dest='courses', help='Limit the check to this course id (repeatable).')
+        parser.add_argument('--fix', action='store_true', help='Rewrite drifted enrollments.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        drift = reconcile_progress(
+            course_ids=options['courses'],
+            fix=options['fix'],
+            batch_size=options['batch_size'],
+        )
+
+        for enrollment_id, stored, expected in drift:
+            self.stdout.write(
+                f'Enrollment {enrollment_id}: stored {stored[0]}/{stored[1]}, expected {expected[0]}/{expected[1]}'
+            )
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('All enrollment progress counters are consistent.'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Repaired {len(drift)} enrollments.'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{len(drift)} enrollments have drifted. Run with --fix to repair them.'))
@@ -2,13 +2,17 @@ from datetime import timedelta
 from django.db import models
 from userAuth.models import  StudentProfile , TeacherProfile,TeacherStudentProfile
 import uuid
+import os
 from django.utils import timezone
 from .utilis import genrate_coupon_code,create_lesson_progress_for_access
+from .progress import calc_percentage
+from .provisioning import provision_lesson
+from api.ordering import OrderedMixin
 from django.db.models.functions import Coalesce
-from PIL import Image
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db.models import Sum,Count
 from django.db import models, transaction
+from django.contrib.postgres.search import SearchVectorField
 # Create your models here.
 
 class CourseCategory(models.Model):
@@ -53,8 +57,27 @@ class Course(models.Model):
         self.total_lessons = totals['total_lessons'] or 0
         self.total_durations = totals['total_duration'] or 0
         self.save(update_fields=['total_lessons', 'total_durations'])
+
+    class Meta:
+        indexes = [
+            # keyset pagination of the public catalog
+            models.Index(fields=['is_published', '-created_at', '-id']),
+        ]
     
     
+class CourseSearchIndex(models.Model):
+    """The text a course is found by, kept current by course.search."""
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, related_name='search_index')
+    title = models.CharField(max_length=100)
+    description = models.TextField(blank=True)
+    category = models.CharField(max_length=30, blank=True)
+    teacher = models.CharField(max_length=100, blank=True)
+    # PostgreSQL only, GIN indexed after migrate; SQLite uses an FTS5 table keyed by id
+    search_vector = SearchVectorField(null=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.title
 
 
 class CourseEnrollment(models.Model):
@@ -80,32 +103,38 @@ class CourseEnrollment(models.Model):
     is_active = models.BooleanField(default=True)
     progress = models.DecimalField(max_digits=5, decimal_places=2, default=0.00)
     last_activity = models.DateTimeField(blank=True, null=True)
+    # counters maintained incrementally by course.progress
+    completed_lessons = models.PositiveIntegerField(default=0)
+    total_lessons = models.PositiveIntegerField(default=0)
     
-    def calc_progress(self):
+    def count_lessons(self):
         completed_lessons = StudentLessonProgress.objects.filter(
-        student=self.student,
-        lesson__module__course=self.course,
+        student_id=self.student_id,
+        lesson__module__course_id=self.course_id,
+        lesson__is_published=True,
         is_completed=True).count()
         
         total_lessons = Lesson.objects.filter(
-        module__course=self.course,
+        module__course_id=self.course_id,
         is_published=True).count()
         
-        if total_lessons == 0:
-            progress = 0
-        else:
-            progress = (completed_lessons / total_lessons) * 100
-        
-        self.progress = round(progress, 2)
+        return completed_lessons, total_lessons
+    
+    def calc_progress(self):
+        """Full recount of this enrollment; the signal path only applies deltas."""
+        self.completed_lessons, self.total_lessons = self.count_lessons()
+        self.progress = calc_percentage(self.completed_lessons, self.total_lessons)
         self.is_completed = (self.progress == 100)
         self.last_activity = timezone.now()
-        self.save(update_fields=['progress','is_completed','last_activity'])
+        self.save(update_fields=['completed_lessons', 'total_lessons', 'progress', 'is_completed', 'last_activity'])
         return self.progress
     class Meta:
         unique_together = ('student', 'course')  
         indexes = [
             models.Index(fields=['status']),
             models.Index(fields=['enrollment_date']),
+            models.Index(fields=['is_active', 'ended_date']),
+            models.Index(fields=['course', '-enrollment_date', '-id']),
         ]
     
     
@@ -116,6 +145,11 @@ class CourseEnrollment(models.Model):
         creating = self._state.adding
         if not self.ended_date:
             self.ended_date = timezone.now() + timedelta(days=30)
+        if creating:
+            # completions recorded before enrolling (e.g. through a module) still count
+            self.completed_lessons, self.total_lessons = self.count_lessons()
+            self.progress = calc_percentage(self.completed_lessons, self.total_lessons)
+            self.is_completed = (self.progress == 100)
         super().save(*args, **kwargs)
         
         if creating and self.access_type==self.AccessType.FULL_ACCESS and self.is_active:
@@ -155,6 +189,8 @@ class Coupon(models.Model):
         unique_together = ('code', 'teacher')
         indexes = [
             models.Index(fields=['code']),
+            models.Index(fields=['is_active', 'expiration_date']),
+            models.Index(fields=['teacher', '-date', '-id']),
         ]
 
 
@@ -167,12 +203,17 @@ class CouponUsage(models.Model):
     module = models.ForeignKey('CourseModule', on_delete=models.SET_NULL, related_name='couponModule_usages', null=True, blank=True)
     class Meta:
         unique_together = ('coupon', 'student')
+        indexes = [
+            models.Index(fields=['coupon', '-used_at', '-id']),
+        ]
         
     def __str__(self):
         return f"{self.student} used {self.coupon.code}"
     
 
-class CourseModule(models.Model):
+class CourseModule(OrderedMixin, models.Model):
+    order_scope = 'course'
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, unique=True)
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='modules')
     title = models.CharField(max_length=200)
@@ -209,40 +250,14 @@ class CourseModule(models.Model):
     class Meta:
         ordering = ['order']
         # unique_together = ('course', 'order')
+        indexes = [
+            models.Index(fields=['course', 'order']),
+        ]
 
     def save(self, *args, **kwargs) :
-        is_new = self._state.adding
-        with transaction.atomic():
-            if is_new:
-                # new creation
-                # if not order value
-                if self.order is None:
-                    last_module_order=CourseModule.objects.filter(course=self.course).aggregate(models.Max('order'))['order__max']
-                    self.order=1 if last_module_order is None else last_module_order+1
-                # if user enter order value
-                else:
-                # if user enter order value
-                    if CourseModule.objects.filter(course=self.course, order=self.order).exists():
-                        CourseModule.objects.filter(course=self.course, order__gte=self.order).update(order=models.F('order') + 1)
-                # in order update
-            else:
-                old_order=CourseModule.objects.get(pk=self.pk).order
-                
-                if self.order != old_order:
-                    if self.order < old_order:
-                        CourseModule.objects.filter(
-                            course=self.course,
-                            order__gte=self.order,
-                            order__lt=old_order
-                        ).update(order=models.F('order') + 1)
-
-                    else:
-                        CourseModule.objects.filter(
-                            course=self.course,
-                            order__lte=self.order,
-                            order__gt=old_order
-                        ).update(order=models.F('order') - 1)
+        self.place_in_order()
         super().save(*args, **kwargs)
+        self.remember_order()
         
 class ModuleEnrollment(models.Model):
     class EnrollmentStatus(models.TextChoices):
@@ -266,6 +281,7 @@ class ModuleEnrollment(models.Model):
         indexes = [
             models.Index(fields=['status']),
             models.Index(fields=['enrollment_date']),
+            models.Index(fields=['is_active', 'ended_date']),
         ]
     
     
@@ -280,14 +296,37 @@ class ModuleEnrollment(models.Model):
     
         if creating and self.status==self.EnrollmentStatus.ACTIVE and self.is_active:
             create_lesson_progress_for_access(student=self.student,module=self.module)
+
+
+class Entitlement(models.Model):
+    """
+    A student's grant to a whole course (``module`` empty) or to one module,
+    derived from their enrollments by course.entitlements.
+    """
+    student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, related_name='entitlements')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='entitlements')
+    module = models.ForeignKey(CourseModule, on_delete=models.CASCADE, related_name='entitlements', null=True, blank=True)
+    expires_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'course'], condition=models.Q(module__isnull=True), name='unique_course_entitlement'),
+            models.UniqueConstraint(fields=['student', 'module'], condition=models.Q(module__isnull=False), name='unique_module_entitlement'),
+        ]
+
+    def __str__(self):
+        return f'{self.student_id} -> {self.module_id or self.course_id}'
+    
     
-class Lesson(models.Model):
+class Lesson(OrderedMixin, models.Model):
     class VideoProcessingStatus(models.TextChoices):
         PRE_UPLOAD = 'pre-upload', 'Pre-Upload'
         QUEUED = 'queued', 'Queued'
         READY = 'ready', 'Ready'
         FAILED = 'failed', 'Failed'
     
+    order_scope = 'module'
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, unique=True)
     module = models.ForeignKey(CourseModule, on_delete=models.CASCADE, related_name='lessons')
     title = models.CharField(max_length=200)
@@ -313,70 +352,27 @@ class Lesson(models.Model):
     def __str__(self):
         return f"{self.module.title} - {self.title}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remembered so signals can tell a publish/unpublish apart from other edits
+        instance._loaded_is_published = instance.__dict__.get('is_published')
+        # and whether the module totals need recomputing
+        instance._loaded_module_id = instance.__dict__.get('module_id')
+        instance._loaded_duration = instance.__dict__.get('duration')
+        return instance
+    
     def save(self, *args, **kwargs):
         creating=self._state.adding
-        with transaction.atomic():
-            if creating:
-                if self.order is None:
-                    last_lesson_order=Lesson.objects.filter(module=self.module).aggregate(models.Max('order'))['order__max']
-                    self.order=1 if last_lesson_order is None else last_lesson_order+1
-
-                else:
-                    if Lesson.objects.filter(module=self.module,order=self.order).exists():
-                        Lesson.objects.filter(module=self.module,order__gte=self.order).update(order=models.F('order') + 1)
-            else:
-                old_order=Lesson.objects.get(pk=self.pk).order
-                
-                if self.order != old_order:
-                    if self.order < old_order:
-                        Lesson.objects.filter(
-                            module=self.module,
-                            order__gte=self.order,
-                            order__lt=old_order
-                        ).update(order=models.F('order')+1)
-            
-                    else:
-                        Lesson.objects.filter(
-                            module=self.module,
-                            order__lte=self.order,
-                            order__gt=old_order
-                        ).update(order=models.F('order') - 1)
-        
+        self.place_in_order()
         super().save(*args, **kwargs)
-        
-        if self.module:
-            self.module.update_totals()
+        self.remember_order()
 
-        
-        if self.thumbnail:
-            if self.thumbnail:
-                img = Image.open(self.thumbnail.path)
-                max_size = (400, 300)
-                img.thumbnail(max_size)
-                img.save(self.thumbnail.path)
+        # module and course totals are recomputed after commit, see totals.py
+        # thumbnail renditions are made off-request, see api.images
             
         if creating:
-            from .models import StudentLessonProgress, CourseEnrollment, ModuleEnrollment
-
-            course_students = CourseEnrollment.objects.filter(
-                course=self.module.course,
-                status=CourseEnrollment.EnrollmentStatus.ACTIVE,
-                is_active=True,
-                access_type=CourseEnrollment.AccessType.FULL_ACCESS,
-            ).values_list("student", flat=True)
-
-            module_students = ModuleEnrollment.objects.filter(
-                module=self.module,
-                status=ModuleEnrollment.EnrollmentStatus.ACTIVE,
-                is_active=True,
-            ).values_list("student", flat=True)
-
-            student_ids = set(course_students) | set(module_students)
-
-            StudentLessonProgress.objects.bulk_create(
-                [StudentLessonProgress(student_id=sid, lesson=self) for sid in student_ids],
-                ignore_conflicts=True
-            )
+            provision_lesson(self)
             
             
     def delete(self, *args, **kwargs):
@@ -389,12 +385,14 @@ class Lesson(models.Model):
             self.thumbnail.delete(save=False)
         
         super().delete(*args, **kwargs)
-        self.module.update_totals()
         
     
     class Meta:
         ordering = ['order']
         # unique_together = ('module', 'order')
+        indexes = [
+            models.Index(fields=['module', 'order']),
+        ]
         
     @property
     def teacher(self):
@@ -409,6 +407,13 @@ class StudentLessonProgress(models.Model):
     def __str__(self):
         return f"{self.student.user.username} - {self.lesson.title} - {self.is_completed}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the stored value, so signals can apply +1/-1 deltas instead of recounting
+        instance._loaded_is_completed = instance.__dict__.get('is_completed')
+        return instance
+    
     class Meta:
         unique_together = ('student', 'lesson') 
         
@@ -430,3 +435,29 @@ class Rating(models.Model):
 
     def __str__(self):
         return f"{self.student.user.first_name} rated {self.course.title} - {self.rating}"
+
+
+class VideoUpload(models.Model):
+    """A resumable (tus-style) lesson video upload, written straight to disk chunk by chunk."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, unique=True)
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='video_uploads')
+    filename = models.CharField(max_length=255)
+    upload_length = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    @property
+    def temp_dir_path(self):
+        return os.path.join('tmp', str(self.id))
+
+    @property
+    def temp_video_path(self):
+        return os.path.join(self.temp_dir_path, self.filename)
+
+    @property
+    def is_complete(self):
+        return self.offset >= self.upload_length
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.upload_length})"
@@ -1,5 +1,6 @@
 from rest_framework import permissions
-from .models import CourseEnrollment, CourseModule,Lesson,Course, ModuleEnrollment, Rating
+from .models import CourseModule,Lesson,Course, Rating
+from .access import get_access
 from userAuth.models import User, StudentProfile, TeacherProfile
 from django.shortcuts import get_object_or_404
 
@@ -14,44 +15,10 @@ class IsLessonAccessible(permissions.BasePermission):
         lesson_id = view.kwargs.get('id')
         if not lesson_id:
             return False
-            
-        try:
-            lesson = Lesson.objects.select_related('module__course__teacher').get(id=lesson_id)
-            course = lesson.module.course
-            module = lesson.module
-            user = request.user
-
-            if user.user_type == User.userType.TEACHER and hasattr(user, 'teacher_profile') and course.teacher == user.teacher_profile:
-                return True
-            
-            if user.user_type == User.userType.STUDENT and hasattr(user, 'student_profile'):
-                
-                
-                if (course.is_free or course.price == 0) and course.is_published and lesson.is_published:
-                    return True
-                
-                if (module.is_free or module.price == 0) and module.is_published and lesson.is_published:
-                    return True
-                
-                has_full_access = CourseEnrollment.objects.filter(
-                    student=user.student_profile,
-                    course=course,
-                    access_type=CourseEnrollment.AccessType.FULL_ACCESS,
-                    is_active=True,
-                ).exists()
-                
-                has_module_access = ModuleEnrollment.objects.filter(
-                    student=user.student_profile,
-                    module=lesson.module,
-                    is_active=True,
-                ).exists()
 
-                return has_full_access or has_module_access
-            
-            return False
-            
-        except Lesson.DoesNotExist:
-            return False
+        access = get_access(request)
+        lesson = access.lesson(lesson_id)
+        return lesson is not None and access.can_view_lesson(lesson)
                 
         
 class IsModuleAccessible(permissions.BasePermission):
@@ -68,42 +35,9 @@ class IsModuleAccessible(permissions.BasePermission):
         if not module_id:
             return False
 
-        try:
-            module = CourseModule.objects.select_related('course__teacher').get(id=module_id)
-            course = module.course
-            user = request.user
-
-            if user.user_type == User.userType.TEACHER and hasattr(user, 'teacher_profile') and course.teacher == user.teacher_profile:
-                return True
-
-            if user.user_type == User.userType.STUDENT and hasattr(user, 'student_profile'):
-                
-                if (course.is_free or course.price == 0) and course.is_published and module.is_published:
-                    return True
-                
-                if (module.is_free or module.price == 0) and module.is_published:
-                    return True
-                
-                has_full_access = CourseEnrollment.objects.filter(
-                    student=user.student_profile,
-                    course=course,
-                    access_type=CourseEnrollment.AccessType.FULL_ACCESS,
-                    is_active=True,
-                ).exists()
-
-                has_module_access = ModuleEnrollment.objects.filter(
-                    student=user.student_profile,
-                    module=module,
-                    status=ModuleEnrollment.EnrollmentStatus.ACTIVE,
-                    is_active=True,
-                ).exists()
-
-                return has_full_access or has_module_access
-
-            return False
-
-        except CourseModule.DoesNotExist:
-            return False
+        access = get_access(request)
+        module = access.module(module_id)
+        return module is not None and access.can_view_module(module)
         
         
 class IsModuleOwner(permissions.BasePermission):
@@ -175,18 +109,9 @@ class CanRateCourse(permissions.BasePermission):
             course = get_object_or_404(Course, id=course_id)
             
             # Check if the student has full access to the course or is enrolled in at least one module
-            has_full_access = CourseEnrollment.objects.filter(
-                student=request.user.student_profile,
-                course=course,
-                access_type=CourseEnrollment.AccessType.FULL_ACCESS,
-                is_active=True
-            ).exists()
-
-            is_enrolled_in_module = ModuleEnrollment.objects.filter(
-                student=request.user.student_profile,
-                module__course=course,
-                is_active=True
-            ).exists()
+            access = get_access(request)
+            has_full_access = access.has_full_access(course.pk)
+            is_enrolled_in_module = access.entitlements.any_module_of(course.pk)
 
             if not (has_full_access or is_enrolled_in_module):
                 self.message = "You must have full access to the course or be enrolled in at least one module to rate it."
@@ -0,0 +1,63 @@
+"""
+VdoCipher playback credentials.
+
+An OTP and its playbackInfo are fetched with a single API call per
+(user, video) and cached for ``VDOCIPHER_OTP_CACHE_TTL`` seconds. That is
+kept below the ``VDOCIPHER_OTP_TTL`` requested from VdoCipher, so a cached
+OTP is always still valid when it reaches the player. Lists resolve their
+cache misses concurrently instead of one blocking request per lesson.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from .utilis import genrate_otp
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _cache_key(user_id, video_id):
+    return f'vdocipher:playback:{user_id}:{video_id}'
+
+
+def get_playback(video_id, user_id):
+    """Returns ``(otp, playback_info)``, or ``(None, None)`` when it can't be fetched."""
+    if not video_id:
+        return None, None
+    return prefetch_playback([video_id], user_id).get(video_id, (None, None))
+
+
+def prefetch_playback(video_ids, user_id):
+    """Returns ``{video_id: (otp, playback_info)}`` for every video that could be resolved."""
+    video_ids = list(dict.fromkeys(video_id for video_id in video_ids if video_id))
+    if not video_ids:
+        return {}
+
+    keys = {video_id: _cache_key(user_id, video_id) for video_id in video_ids}
+    cached = cache.get_many(keys.values())
+    credentials = {video_id: tuple(cached[key]) for video_id, key in keys.items() if key in cached}
+
+    missing = [video_id for video_id in video_ids if video_id not in credentials]
+    if not missing:
+        return credentials
+
+    if len(missing) == 1:
+        fetched = [genrate_otp(missing[0])]
+    else:
+        workers = min(settings.VDOCIPHER_MAX_CONCURRENCY, len(missing))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            fetched = list(executor.map(genrate_otp, missing))
+
+    to_cache = {}
+    for video_id, (otp, playback_info) in zip(missing, fetched):
+        # failures are not cached, the next request retries them
+        if otp is None:
+            continue
+        credentials[video_id] = (otp, playback_info)
+        to_cache[keys[video_id]] = (otp, playback_info)
+
+    if to_cache:
+        cache.set_many(to_cache, timeout=settings.VDOCIPHER_OTP_CACHE_TTL)
+    logger.debug(f"Fetched {len(to_cache)}/{len(missing)} playback credentials for user {user_id}.")
+    return credentials
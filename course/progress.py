@@ -0,0 +1,153 @@
+from django.conf import settings
+from django.db.models import Case, Count, DecimalField, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast, Greatest, Least, Round
+from django.utils import timezone
+from decimal import Decimal
+from .deferred import defer
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _progress_for(completed):
+    """SQL expression for the progress percentage given a completed-lessons expression."""
+    return Case(
+        When(total_lessons=0, then=Value(0)),
+        default=Least(
+            Round(Cast(completed, FloatField()) * 100.0 / F('total_lessons'), 2),
+            Value(100.0),
+        ),
+        output_field=DecimalField(max_digits=5, decimal_places=2),
+    )
+
+
+def _is_completed_for(completed):
+    return Case(
+        When(Q(total_lessons__gt=0) & Q(total_lessons__lte=completed), then=Value(True)),
+        default=Value(False),
+    )
+
+
+def is_sparse_mode():
+    """
+    In ``sparse`` mode StudentLessonProgress only stores completions: rows are
+    created when a lesson is completed and deleted when it is un-completed,
+    instead of being provisioned for every (student, lesson) pair.
+    """
+    return settings.LESSON_PROGRESS_MODE == 'sparse'
+
+
+def calc_percentage(completed, total):
+    if total == 0:
+        return Decimal('0.00')
+    return Decimal(str(round(min(completed / total * 100, 100), 2))).quantize(Decimal('0.01'))
+
+
+def apply_completion_delta(student_id, course_id, delta):
+    """
+    Shift the completed-lessons counter of one enrollment by ``delta`` and
+    derive progress from the stored counters in the same UPDATE.
+    """
+    from .models import CourseEnrollment
+
+    completed = Greatest(F('completed_lessons') + delta, Value(0))
+    return CourseEnrollment.objects.filter(student_id=student_id, course_id=course_id).update(
+        completed_lessons=completed,
+        progress=_progress_for(completed),
+        is_completed=_is_completed_for(completed),
+        last_activity=timezone.now(),
+    )
+
+
+def schedule_course_recompute(course_id):
+    """Recompute every enrollment of the course once the current transaction commits."""
+    defer('course-progress', course_id, flush=lambda items: reconcile_progress(course_ids=list(items), fix=True))
+
+
+def _published_totals(course_ids):
+    from .models import Lesson
+
+    rows = (
+        Lesson.objects.filter(module__course_id__in=course_ids, is_published=True)
+        .values('module__course_id')
+        .annotate(total=Count('id'))
+        .values_list('module__course_id', 'total')
+    )
+    return dict(rows)
+
+
+def _completed_counts(course_ids):
+    from .models import StudentLessonProgress
+
+    rows = (
+        StudentLessonProgress.objects.filter(
+            lesson__module__course_id__in=course_ids,
+            lesson__is_published=True,
+            is_completed=True,
+        )
+        .values('student_id', 'lesson__module__course_id')
+        .annotate(completed=Count('id'))
+        .values_list('student_id', 'lesson__module__course_id', 'completed')
+    )
+    return {(student_id, course_id): completed for student_id, course_id, completed in rows}
+
+
+def reconcile_progress(course_ids=None, fix=False, batch_size=500):
+    """
+    Compare stored enrollment counters with the ground truth, course by course.
+
+    Returns a list of ``(enrollment_id, stored, expected)`` tuples where each
+    side is ``(completed_lessons, total_lessons)``. With ``fix=True`` the
+    drifted enrollments are rewritten with ``bulk_update``.
+    """
+    from .models import Course
+
+    if course_ids is None:
+        course_ids = Course.objects.values_list('id', flat=True).iterator(chunk_size=batch_size)
+
+    drift = []
+    chunk = []
+    for course_id in course_ids:
+        chunk.append(course_id)
+        if len(chunk) >= batch_size:
+            drift.extend(_reconcile_chunk(chunk, fix, batch_size))
+            chunk = []
+    if chunk:
+        drift.extend(_reconcile_chunk(chunk, fix, batch_size))
+    return drift
+
+
+def _reconcile_chunk(course_ids, fix, batch_size):
+    from .models import CourseEnrollment
+
+    totals = _published_totals(course_ids)
+    completed_counts = _completed_counts(course_ids)
+
+    drift = []
+    to_update = []
+    enrollments = CourseEnrollment.objects.filter(course_id__in=course_ids).only(
+        'id', 'student_id', 'course_id', 'completed_lessons', 'total_lessons', 'progress', 'is_completed'
+    )
+    for enrollment in enrollments.iterator(chunk_size=batch_size):
+        total = totals.get(enrollment.course_id, 0)
+        completed = completed_counts.get((enrollment.student_id, enrollment.course_id), 0)
+        stored = (enrollment.completed_lessons, enrollment.total_lessons)
+        if stored == (completed, total) and enrollment.progress == calc_percentage(completed, total):
+            continue
+
+        drift.append((enrollment.id, stored, (completed, total)))
+        if fix:
+            enrollment.completed_lessons = completed
+            enrollment.total_lessons = total
+            enrollment.progress = calc_percentage(completed, total)
+            enrollment.is_completed = total > 0 and completed >= total
+            to_update.append(enrollment)
+
+    if to_update:
+        CourseEnrollment.objects.bulk_update(
+            to_update,
+            ['completed_lessons', 'total_lessons', 'progress', 'is_completed'],
+            batch_size=batch_size,
+        )
+        logger.info(f"Repaired progress counters for {len(to_update)} enrollments.")
+    return drift
@@ -0,0 +1,143 @@
+"""
+Bulk provisioning of StudentLessonProgress rows.
+
+Rows are produced straight from id streams: on PostgreSQL with a single
+``INSERT ... SELECT ... ON CONFLICT DO NOTHING``, elsewhere by streaming
+``values_list`` ids into chunked ``bulk_create`` calls. Both report the rows
+actually created, not the ones skipped as already present. No Lesson or
+StudentProfile instances are loaded. Fan-outs larger than
+``PROGRESS_PROVISION_ASYNC_THRESHOLD`` students are handed to Celery
+once the creating transaction commits.
+"""
+
+from django.conf import settings
+from django.db import connection, transaction
+from .progress import is_sparse_mode
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _insert_select(ids_qs, student_id=None, lesson_id=None):
+    """One INSERT ... SELECT; the subquery yields the ids of the side that varies."""
+    from .models import StudentLessonProgress
+
+    opts = StudentLessonProgress._meta
+    sub_sql, sub_params = ids_qs.query.sql_with_params()
+    if student_id is None:
+        columns, fixed = 'src.id, %s::uuid', lesson_id
+    else:
+        columns, fixed = '%s::uuid, src.id', student_id
+
+    sql = (
+        f'INSERT INTO {opts.db_table} ('
+        f'{opts.get_field("id").column}, {opts.get_field("student").column}, '
+        f'{opts.get_field("lesson").column}, {opts.get_field("is_completed").column}) '
+        f'SELECT gen_random_uuid(), {columns}, false FROM ({sub_sql}) AS src(id) '
+        f'ON CONFLICT DO NOTHING'
+    )
+    params = [str(fixed), *sub_params]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def _insert_chunk(ids, student_id=None, lesson_id=None):
+    """Insert one chunk; returns how many of its rows did not exist yet."""
+    from .models import StudentLessonProgress
+
+    if student_id is None:
+        rows = [StudentLessonProgress(student_id=pk, lesson_id=lesson_id) for pk in ids]
+        existing = StudentLessonProgress.objects.filter(lesson_id=lesson_id, student_id__in=ids)
+    else:
+        rows = [StudentLessonProgress(student_id=student_id, lesson_id=pk) for pk in ids]
+        existing = StudentLessonProgress.objects.filter(student_id=student_id, lesson_id__in=ids)
+    # ignore_conflicts hands back every row it was given, skipped ones included
+    skipped = existing.count()
+    StudentLessonProgress.objects.bulk_create(rows, batch_size=len(rows), ignore_conflicts=True)
+    return len(rows) - skipped
+
+
+def _bulk_insert(ids_qs, student_id=None, lesson_id=None, batch_size=None):
+    """Stream ids and insert them in chunks of ``batch_size``."""
+    batch_size = batch_size or settings.PROGRESS_PROVISION_BATCH_SIZE
+    created = 0
+    chunk = []
+    for pk in ids_qs.iterator(chunk_size=batch_size):
+        chunk.append(pk)
+        if len(chunk) >= batch_size:
+            created += _insert_chunk(chunk, student_id=student_id, lesson_id=lesson_id)
+            chunk = []
+    if chunk:
+        created += _insert_chunk(chunk, student_id=student_id, lesson_id=lesson_id)
+    return created
+
+
+def _provision(ids_qs, student_id=None, lesson_id=None, batch_size=None):
+    if connection.vendor == 'postgresql':
+        return _insert_select(ids_qs, student_id=student_id, lesson_id=lesson_id)
+    return _bulk_insert(ids_qs, student_id=student_id, lesson_id=lesson_id, batch_size=batch_size)
+
+
+def students_with_access(module_id, course_id):
+    """Ids of students holding full course access or an active module enrollment."""
+    from .models import CourseEnrollment, ModuleEnrollment
+
+    course_students = CourseEnrollment.objects.filter(
+        course_id=course_id,
+        is_active=True,
+        access_type=CourseEnrollment.AccessType.FULL_ACCESS,
+    ).values_list('student_id', flat=True)
+
+    module_students = ModuleEnrollment.objects.filter(
+        module_id=module_id,
+        status=ModuleEnrollment.EnrollmentStatus.ACTIVE,
+        is_active=True,
+    ).values_list('student_id', flat=True)
+
+    # UNION also removes students holding both kinds of access
+    return course_students.order_by().union(module_students.order_by())
+
+
+def provision_student(student_id, course_id=None, module_id=None, batch_size=None):
+    """Progress rows for every lesson of a course or module the student just got access to."""
+    from .models import Lesson
+
+    if course_id:
+        lessons = Lesson.objects.filter(module__course_id=course_id)
+    elif module_id:
+        lessons = Lesson.objects.filter(module_id=module_id)
+    else:
+        return 0
+    return _provision(lessons.order_by().values_list('id', flat=True), student_id=student_id, batch_size=batch_size)
+
+
+def provision_lesson_students(lesson_id, module_id, course_id, batch_size=None):
+    """Progress rows of a new lesson for every student who has access to it."""
+    created = _provision(students_with_access(module_id, course_id), lesson_id=lesson_id, batch_size=batch_size)
+    logger.info(f"Provisioned {created} progress rows for lesson {lesson_id}.")
+    return created
+
+
+def provision_lesson(lesson):
+    """
+    Called when a lesson is created. Small fan-outs run inline; larger ones
+    go to Celery after commit so the request does not scale with the
+    number of enrolled students.
+    """
+    if is_sparse_mode():
+        return None
+
+    threshold = settings.PROGRESS_PROVISION_ASYNC_THRESHOLD
+    course_id = lesson.module.course_id
+    students = students_with_access(lesson.module_id, course_id)
+
+    # bounded probe: never counts further than the threshold
+    if len(students[:threshold + 1]) <= threshold:
+        return provision_lesson_students(lesson.id, lesson.module_id, course_id)
+
+    from .tasks import provision_lesson_progress_task
+
+    lesson_id = lesson.id
+    transaction.on_commit(lambda: provision_lesson_progress_task.delay(str(lesson_id)))
+    return None
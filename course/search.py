@@ -0,0 +1,214 @@
+"""
+Course search.
+
+Every course has a ``CourseSearchIndex`` row with the text it is found by:
+title, description, category name and teacher name. Writes to any of those
+mark the course dirty and its row is rebuilt once per transaction, after
+commit, so searching never joins the category or teacher tables.
+
+On PostgreSQL the row carries a weighted ``search_vector`` (title A,
+category and teacher B, description C) behind a GIN index; matches are
+ranked with ``ts_rank`` and misspelt titles are still found through a
+trigram index. On SQLite the same columns live in an FTS5 table ranked
+with bm25, and every word is matched as a prefix. Both indexes are created
+after ``migrate`` by ``ensure_search_backend``.
+"""
+
+from django.conf import settings
+from django.contrib.postgres.lookups import TrigramSimilar
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, router, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from rest_framework.filters import BaseFilterBackend
+from api.catalog_cache import bump
+from .deferred import defer
+from .models import Course, CourseSearchIndex
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'course_search_fts'
+# bm25 weights of the FTS5 columns, in table order
+FTS_WEIGHTS = (10.0, 1.0, 4.0, 4.0)
+# SQLite ranks in Python, so only this many matches are returned
+FTS_MAX_RESULTS = 1000
+INDEX_FIELDS = ('title', 'description', 'category', 'teacher')
+
+_word = re.compile(r'\w+', re.UNICODE)
+
+# the % operator, which the trigram index serves
+CourseSearchIndex._meta.get_field('title').register_lookup(TrigramSimilar)
+
+
+def _connection(model):
+    return connections[router.db_for_write(model)]
+
+
+def _search_vector():
+    config = settings.COURSE_SEARCH_CONFIG
+    return (
+        SearchVector('title', weight='A', config=config)
+        + SearchVector('category', weight='B', config=config)
+        + SearchVector('teacher', weight='B', config=config)
+        + SearchVector('description', weight='C', config=config)
+    )
+
+
+def ensure_search_backend(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Creates the database side of the index; connected to ``post_migrate``."""
+    connection = connections[using]
+    table = CourseSearchIndex._meta.db_table
+    if table not in connection.introspection.table_names():
+        return
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS course_search_vector_gin ON {table} USING gin (search_vector)')
+            try:
+                with transaction.atomic(using=using):
+                    cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+                    cursor.execute(f'CREATE INDEX IF NOT EXISTS course_search_title_trgm ON {table} USING gin (title gin_trgm_ops)')
+            except DatabaseError as e:
+                logger.warning(f"pg_trgm is not available, course search will not match misspellings: {e}")
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                f"USING fts5({', '.join(INDEX_FIELDS)}, tokenize='unicode61 remove_diacritics 2')"
+            )
+
+
+def schedule_index(course_id):
+    """Rebuild the search row of ``course_id`` once the transaction commits."""
+    defer('course-search', course_id, flush=index_courses)
+
+
+def schedule_drop(index_id):
+    """Remove a deleted search row from the SQLite FTS table after commit."""
+    defer('course-search-drop', index_id, flush=_drop_documents)
+
+
+def index_courses(course_ids):
+    """Brings the search rows of ``course_ids`` in line with the courses. Returns the number written."""
+    course_ids = list(course_ids)
+    courses = (
+        Course.objects.filter(pk__in=course_ids)
+        .select_related('category', 'teacher')
+        .only('id', 'title', 'description', 'category__name', 'teacher__full_name')
+    )
+    existing = {row.course_id: row for row in CourseSearchIndex.objects.filter(course_id__in=course_ids)}
+
+    created, updated = [], []
+    for course in courses:
+        row = existing.get(course.pk) or CourseSearchIndex(course=course)
+        row.title = course.title
+        row.description = course.description or ''
+        row.category = course.category.name if course.category else ''
+        row.teacher = course.teacher.full_name or ''
+        (updated if row.pk else created).append(row)
+
+    if created:
+        CourseSearchIndex.objects.bulk_create(created)
+    if updated:
+        CourseSearchIndex.objects.bulk_update(updated, [*INDEX_FIELDS, 'updated_at'])
+    rows = created + updated
+    if rows:
+        _write_documents(rows)
+        # cached search results were built from the old rows
+        bump('courses')
+
+    logger.debug(f"Indexed {len(rows)} of {len(course_ids)} courses for search.")
+    return len(rows)
+
+
+def _write_documents(rows):
+    connection = _connection(CourseSearchIndex)
+    if connection.vendor == 'postgresql':
+        CourseSearchIndex.objects.filter(pk__in=[row.pk for row in rows]).update(search_vector=_search_vector())
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row.pk,) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(INDEX_FIELDS)}) VALUES (%s, %s, %s, %s, %s)',
+                [(row.pk, *(getattr(row, field) for field in INDEX_FIELDS)) for row in rows],
+            )
+
+
+def _drop_documents(index_ids):
+    connection = _connection(CourseSearchIndex)
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in index_ids])
+
+
+def rebuild_index(batch_size=1000):
+    """Reindexes every course from scratch. Returns the number of courses indexed."""
+    connection = _connection(CourseSearchIndex)
+    ensure_search_backend(using=connection.alias)
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    total = 0
+    ids = list(Course.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(ids), batch_size):
+        with transaction.atomic():
+            total += index_courses(ids[start:start + batch_size])
+    return total
+
+
+def _fts_query(term):
+    # every word quoted (so FTS5 syntax in the input is inert) and matched as a prefix
+    return ' '.join(f'"{word}"*' for word in _word.findall(term))
+
+
+def search_courses(queryset, term):
+    """``queryset`` narrowed to the courses matching ``term``, best match first."""
+    term = term.strip()
+    if not term:
+        return queryset
+
+    connection = _connection(CourseSearchIndex)
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(term, search_type='websearch', config=settings.COURSE_SEARCH_CONFIG)
+        return (
+            queryset.annotate(
+                search_rank=SearchRank(F('search_index__search_vector'), query),
+                search_similarity=TrigramSimilarity('search_index__title', term),
+            )
+            .filter(Q(search_index__search_vector=query) | Q(search_index__title__trigram_similar=term))
+            .order_by('-search_rank', '-search_similarity', '-created_at')
+        )
+
+    if connection.vendor == 'sqlite':
+        match = _fts_query(term)
+        if not match:
+            return queryset.none()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, {", ".join(map(str, FTS_WEIGHTS))}) LIMIT %s',
+                [match, FTS_MAX_RESULTS],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return queryset.none()
+        rank = Case(
+            *(When(search_index__id=pk, then=Value(len(ids) - position)) for position, pk in enumerate(ids)),
+            output_field=IntegerField(),
+        )
+        return queryset.filter(search_index__id__in=ids).annotate(search_rank=rank).order_by('-search_rank', '-created_at')
+
+    condition = Q()
+    for field in INDEX_FIELDS:
+        condition |= Q(**{f'search_index__{field}__icontains': term})
+    return queryset.filter(condition)
+
+
+class CourseSearchFilter(BaseFilterBackend):
+    """``?search=`` through the course search index, ordered by relevance."""
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        return search_courses(queryset, request.query_params.get(self.search_param, ''))
+
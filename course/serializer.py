@@ -4,8 +4,11 @@ from moviepy.video.io.VideoFileClip import VideoFileClip
 from .models import CourseCategory , Course , CourseEnrollment , Coupon , CouponUsage,Lesson,CourseModule, ModuleEnrollment,Rating,StudentLessonProgress
 from userAuth.models import StudentProfile
 from django.db import IntegrityError, transaction
+from django.db.models.manager import BaseManager
 from django.utils import timezone
-from .utilis import genrate_coupon_code , genrate_otp
+from .utilis import genrate_coupon_code
+from .playback import get_playback, prefetch_playback
+from api.serializers import RenditionsField, RenditionsListSerializer
 from datetime import timedelta
 import uuid
 from .tasks import upload_video_to_vdocipher_task
@@ -13,10 +16,13 @@ import os
 from django.core.files.storage import default_storage
 import shutil
 class CourseCategorySerializer(serializers.ModelSerializer):
+    icon_renditions = RenditionsField('icon')
+
     class Meta:
         model = CourseCategory
-        fields = ['id', 'name', 'icon']
+        fields = ['id', 'name', 'icon', 'icon_renditions']
         read_only_fields = ['id']
+        list_serializer_class = RenditionsListSerializer
 
 class CourseCategoryCreateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -36,27 +42,31 @@ class CourseCategoryCreateSerializer(serializers.ModelSerializer):
 
 class CourseSerializer(serializers.ModelSerializer):
     category = CourseCategorySerializer(read_only=True)
+    thumbnail_renditions = RenditionsField('thumbnail')
     class Meta:
         model = Course
         fields = [
             'id', 'title', 'description', 'trailer_video', 'price', 
-            'is_published', 'is_free', 'category',  'thumbnail',
+            'is_published', 'is_free', 'category',  'thumbnail', 'thumbnail_renditions',
             'created_at', 'total_enrollments', 'total_lessons',
             'total_reviews', 'average_rating', 'total_durations'
         ]
         read_only_fields = ['id', 'created_at', 'total_enrollments',
                             'total_lessons', 'total_reviews', 
                             'average_rating', 'total_durations']
+        list_serializer_class = RenditionsListSerializer
 
 
 class CourseSerializerForTeacher(serializers.ModelSerializer):
     category = CourseCategorySerializer(read_only=True)
+    thumbnail_renditions = RenditionsField('thumbnail')
     class Meta:
         model = Course
         fields = "__all__"
         read_only_fields = read_only_fields = ['id', 'created_at', 'total_enrollments',
                             'total_lessons', 'total_reviews', 
                             'average_rating', 'total_durations',' total_revenue']
+        list_serializer_class = RenditionsListSerializer
 
 
 
@@ -77,8 +87,6 @@ class CourseCreateSerializer(serializers.ModelSerializer):
             teacher=teacher,
             **validated_data
         )
-        teacher.number_of_courses += 1
-        teacher.save(update_fields=['number_of_courses'])
         return course
 
 
@@ -451,11 +459,13 @@ class ModuleEnrollmentCreateSerializer(serializers.ModelSerializer):
 
 class LessonSimpleSerializer(serializers.ModelSerializer):
     thumbnail=serializers.SerializerMethodField()
+    thumbnail_renditions = RenditionsField('thumbnail')
     
     class Meta:
         model = Lesson
-        fields = ['id','title','order', 'duration','thumbnail']
+        fields = ['id','title','order', 'duration','thumbnail', 'thumbnail_renditions']
         read_only_fields = fields
+        list_serializer_class = RenditionsListSerializer
         
     def get_thumbnail(self, obj):
         request = self.context.get('request')
@@ -463,11 +473,29 @@ class LessonSimpleSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.thumbnail.url)
         return None
 
+def _playback_user_id(context):
+    request = context.get('request')
+    return request.user.pk if request else None
+
+
+class LessonDetailListSerializer(RenditionsListSerializer):
+    def to_representation(self, data):
+        lessons = list(data.all() if isinstance(data, BaseManager) else data)
+        # resolve the OTPs of the whole page concurrently before rendering
+        playback = self.context.setdefault('playback', {})
+        playback.update(prefetch_playback(
+            [lesson.video_id for lesson in lessons if lesson.video_id not in playback],
+            _playback_user_id(self.context),
+        ))
+        return super().to_representation(lessons)
+
+
 class LessonDetailSerializer(serializers.ModelSerializer):
     otp = serializers.SerializerMethodField()
     playback_info = serializers.SerializerMethodField()
     document_url = serializers.SerializerMethodField()
     thumbnail_url = serializers.SerializerMethodField()
+    thumbnail_renditions = RenditionsField('thumbnail')
     module = serializers.CharField(source='module.title',read_only=True)
 
     class Meta:
@@ -475,10 +503,11 @@ class LessonDetailSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'module', 'otp', 'playback_info', 'description', 'order',
             'is_published', 'is_free', 'duration',
-            'created_at',  'document_url', 'thumbnail_url'
+            'created_at',  'document_url', 'thumbnail_url', 'thumbnail_renditions'
         ]
 
         read_only_fields = fields
+        list_serializer_class = LessonDetailListSerializer
 
     def get_document_url(self, obj):
         request = self.context.get('request')
@@ -487,19 +516,27 @@ class LessonDetailSerializer(serializers.ModelSerializer):
     def get_thumbnail_url(self, obj):
         request = self.context.get('request')
         return request.build_absolute_uri(obj.thumbnail.url) if obj.thumbnail else None
-    
+
+    def _playback(self, obj):
+        # one OTP call serves both fields; lists fill this in advance
+        playback = self.context.setdefault('playback', {})
+        if obj.video_id not in playback:
+            playback[obj.video_id] = get_playback(obj.video_id, _playback_user_id(self.context))
+        return playback[obj.video_id]
+
     def get_otp(self, obj):
-        otp, _ = genrate_otp(obj.video_id)
+        otp, _ = self._playback(obj)
         return otp
 
     def get_playback_info(self, obj):
-        _, playback_info = genrate_otp(obj.video_id)
+        _, playback_info = self._playback(obj)
         return playback_info
 
 
 
 class LessonCreateUpdateSerializer(serializers.ModelSerializer):
-    video = serializers.FileField(write_only=True)
+    # optional: large videos can be sent afterwards through the resumable upload endpoint
+    video = serializers.FileField(write_only=True, required=False)
     class Meta:
         model = Lesson
         fields = [
@@ -545,25 +582,14 @@ class LessonCreateUpdateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Image larger than 2 MB")
         return value
     
-    def validate(self, attrs):
-        module = attrs.get('module') or (self.instance.module if self.instance else None)
-        order = attrs.get('order') or (self.instance.order if self.instance else None)
-
-        if module and order:
-            existing = Lesson.objects.filter(module=module, order=order)
-            if self.instance:
-                existing = existing.exclude(id=self.instance.id)
-            if existing.exists():
-                raise serializers.ValidationError("there is already lesson in this order")
-        return attrs
-    
-    
     # calculate duration after video saving
     def create(self,validated_data):
-        video = validated_data.pop('video')
+        video = validated_data.pop('video', None)
         
         # Create the lesson instance without the video_id first
         lesson = Lesson.objects.create(**validated_data)
+        if not video:
+            return lesson
         
         # Create a unique directory for the upload
         upload_task_id = str(uuid.uuid4())
@@ -701,5 +727,56 @@ class CourseModuleUpdateSerializer(serializers.ModelSerializer):
         return value
     
 
+# bulk edit of a course's modules or a module's lessons
+
+def _validate_bulk(attrs, items_key):
+    if 'ids' not in attrs and not attrs.get(items_key):
+        raise serializers.ValidationError(f"Send ids, {items_key}, or both.")
+    patch_ids = [item['id'] for item in attrs.get(items_key, [])]
+    if len(patch_ids) != len(set(patch_ids)):
+        raise serializers.ValidationError({items_key: "Each id may only appear once."})
+    return attrs
+
+
+class CourseModuleBulkItemSerializer(serializers.ModelSerializer):
+    id = serializers.UUIDField()
+
+    class Meta:
+        model = CourseModule
+        fields = ['id', 'title', 'description', 'is_published', 'price', 'is_free']
+        extra_kwargs = {'title': {'required': False}}
+
+    def validate_title(self, value):
+        if len(value.strip()) < 3:
+            raise serializers.ValidationError("Title must be at least 3 characters long.")
+        return value
+
+
+class CourseModuleBulkUpdateSerializer(serializers.Serializer):
+    # the full new order; other fields go in the per-module patches
+    ids = serializers.ListField(child=serializers.UUIDField(), required=False, allow_empty=False)
+    modules = CourseModuleBulkItemSerializer(many=True, required=False)
+
+    def validate(self, attrs):
+        return _validate_bulk(attrs, 'modules')
+
+
+class LessonBulkItemSerializer(serializers.ModelSerializer):
+    id = serializers.UUIDField()
+
+    class Meta:
+        model = Lesson
+        fields = ['id', 'title', 'description', 'is_published', 'is_free']
+        extra_kwargs = {'title': {'required': False}}
+
+
+class LessonBulkUpdateSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.UUIDField(), required=False, allow_empty=False)
+    lessons = LessonBulkItemSerializer(many=True, required=False)
+
+    def validate(self, attrs):
+        return _validate_bulk(attrs, 'lessons')
+
+
 class EarningSerializer(serializers.Serializer):
     revenue = serializers.DecimalField(max_digits=10, decimal_places=2)
@@ -1,62 +1,115 @@
 from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from django.db.models import F, Avg
-from .models import Course , CourseEnrollment, Lesson, Rating,StudentLessonProgress
+from django.db.models import F
+from userAuth.models import TeacherProfile, TeacherStudentProfile
+from .models import Course , CourseCategory, CourseEnrollment, CourseModule, CourseSearchIndex, Lesson, ModuleEnrollment, Rating,StudentLessonProgress
 from .tasks import delete_video_from_vdocipher_task
+from .counters import adjust, schedule_rating_refresh, schedule_teacher_rating_refresh
+from .progress import apply_completion_delta, schedule_course_recompute
+from .totals import schedule_course_totals, schedule_totals
+from .search import schedule_drop, schedule_index
+from .entitlements import schedule_sync
 import logging
 
 logger = logging.getLogger(__name__)
 
+# enrollment fields the entitlement table is derived from
+ENTITLEMENT_FIELDS = {'is_active', 'access_type', 'status', 'ended_date', 'student', 'course', 'module'}
+
 
 
 @receiver(post_delete, sender=Course)
 def update_course_count_on_delete(sender, instance, **kwargs):
-    teacher = instance.teacher
-    if teacher.number_of_courses == 0:
-        return
-    teacher.number_of_courses = F('number_of_courses') - 1
-    teacher.save(update_fields=['number_of_courses'])
+    adjust(TeacherProfile, instance.teacher_id, number_of_courses=-1)
+    # a rated course leaving changes the teacher's average
+    if instance.average_rating:
+        schedule_teacher_rating_refresh(instance.teacher_id)
 
 @receiver(post_save, sender=Course)
 def update_course_count_on_create(sender, instance, created, **kwargs):
     if created:
-        teacher = instance.teacher
-       
-        teacher.number_of_courses = F('number_of_courses') + 1
-        teacher.save(update_fields=['number_of_courses'])
+        adjust(TeacherProfile, instance.teacher_id, number_of_courses=1)
+
+
+@receiver(post_save, sender=Course)
+def index_course_for_search(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not {'title', 'description', 'category', 'category_id', 'teacher', 'teacher_id'} & set(update_fields):
+        return
+    schedule_index(instance.pk)
+
+
+@receiver(post_save, sender=CourseCategory)
+def reindex_category_courses(sender, instance, created, **kwargs):
+    if created:
+        return
+    # only the courses still indexed under another name
+    for course_id in instance.courses.exclude(search_index__category=instance.name).values_list('pk', flat=True):
+        schedule_index(course_id)
+
+
+@receiver(post_save, sender=TeacherProfile)
+def reindex_teacher_courses(sender, instance, created, **kwargs):
+    if created:
+        return
+    for course_id in instance.courses.exclude(search_index__teacher=instance.full_name or '').values_list('pk', flat=True):
+        schedule_index(course_id)
+
+
+@receiver(post_delete, sender=CourseSearchIndex)
+def drop_course_search_document(sender, instance, **kwargs):
+    schedule_drop(instance.pk)
+
+
+@receiver(post_save, sender=CourseEnrollment)
+@receiver(post_delete, sender=CourseEnrollment)
+@receiver(post_save, sender=ModuleEnrollment)
+@receiver(post_delete, sender=ModuleEnrollment)
+def sync_student_entitlements(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not ENTITLEMENT_FIELDS & set(update_fields):
+        return
+    schedule_sync(instance.student_id)
+
+
+@receiver(post_save, sender=TeacherStudentProfile)
+@receiver(post_delete, sender=TeacherStudentProfile)
+def sync_entitlements_on_block(sender, instance, created=False, update_fields=None, **kwargs):
+    # only blocking and unblocking changes what the student may open
+    if (created and instance.is_active) or (update_fields is not None and 'is_active' not in update_fields):
+        return
+    schedule_sync(instance.student_id)
 
 
 @receiver(post_save, sender=CourseEnrollment)
-def update_course_enrollment_count(sender, instance, **kwargs):
-    course = instance.course
-    course.total_enrollments = F('total_enrollments') + 1
-    course.save(update_fields=['total_enrollments'])
+def update_course_enrollment_count(sender, instance, created, **kwargs):
+    if created:
+        adjust(Course, instance.course_id, total_enrollments=1)
     
     
 @receiver(post_delete, sender=CourseEnrollment)
-def update_course_enrollment_count(sender, instance, **kwargs):
-    course = instance.course
-    if course.total_enrollments == 0:
-        return
-    course.total_enrollments = F('total_enrollments') - 1
-    course.save(update_fields=['total_enrollments'])
+def update_course_enrollment_count_on_delete(sender, instance, **kwargs):
+    adjust(Course, instance.course_id, total_enrollments=-1)
 
 
 @receiver(post_save, sender=Lesson)
-def update_number_of_lessons(sender, instance, **kwargs):
-    course = instance.module.course
-    course.total_lessons = F('total_lessons') + 1
-    course.save(update_fields=['total_lessons'])
+def update_structure_totals(sender, instance, created, update_fields=None, **kwargs):
+    loaded_module_id = getattr(instance, '_loaded_module_id', None)
+    loaded_duration = getattr(instance, '_loaded_duration', None)
+    instance._loaded_module_id = instance.module_id
+    instance._loaded_duration = instance.duration
+    if update_fields is not None and not {'module', 'module_id', 'duration'} & set(update_fields):
+        return
 
+    # only membership and duration feed the module and course totals
+    if created or loaded_module_id != instance.module_id:
+        schedule_totals(instance.module_id)
+        schedule_totals(loaded_module_id)
+    elif loaded_duration != instance.duration:
+        schedule_totals(instance.module_id)
 
   
 @receiver(post_delete, sender=Lesson)
 def update_number_of_lessons_and_delete_video(sender, instance, **kwargs):
-    # Update lesson count
-    course = instance.module.course
-    if course.total_lessons > 0:
-        course.total_lessons = F('total_lessons') - 1
-        course.save(update_fields=['total_lessons'])
+    schedule_totals(instance.module_id)
     
     # Delete video from VdoCipher
     if instance.video_id:
@@ -64,44 +117,56 @@ def update_number_of_lessons_and_delete_video(sender, instance, **kwargs):
                     f"Triggering background task to delete from VdoCipher.")
         delete_video_from_vdocipher_task.delay(instance.video_id)
 
+
+@receiver(post_delete, sender=CourseModule)
+def update_course_totals_on_module_delete(sender, instance, **kwargs):
+    # the cascaded lessons only mark this module, which is gone by commit time
+    schedule_course_totals(instance.course_id)
+
 @receiver(post_save, sender=Rating)
 def update_course_rating_on_save(sender, instance, **kwargs):
-    course = instance.course
-    ratings = Rating.objects.filter(course=course)
-    course.total_reviews = ratings.count()
-    course.average_rating = ratings.aggregate(Avg('rating'))['rating__avg'] or 0
-    course.save(update_fields=['total_reviews', 'average_rating'])
+    schedule_rating_refresh(instance.course_id)
 
 @receiver(post_delete, sender=Rating)
 def update_course_rating_on_delete(sender, instance, **kwargs):
-    course = instance.course
-    ratings = Rating.objects.filter(course=course)
-    course.total_reviews = ratings.count()
-    course.average_rating = ratings.aggregate(Avg('rating'))['rating__avg'] or 0
-    course.save(update_fields=['total_reviews', 'average_rating'])
+    schedule_rating_refresh(instance.course_id)
 
 
-@receiver(post_save, sender=Course)
-def update_teacher_rating(sender, instance, **kwargs):
-    teacher = instance.teacher
-    courses = Course.objects.filter(teacher=teacher).exclude(average_rating=0)
-    
-    if courses.exists():
-        teacher.rating = courses.aggregate(Avg('average_rating'))['average_rating__avg']
-    else:
-        teacher.rating = 0
-        
-    teacher.save(update_fields=['rating'])
+def _apply_progress_delta(instance, delta):
+    if delta == 0:
+        return
+    lesson = Lesson.objects.filter(pk=instance.lesson_id).values_list('module__course_id', 'is_published').first()
+    if lesson is None:
+        return
+    course_id, is_published = lesson
+    # unpublished lessons are not part of the course total
+    if is_published:
+        apply_completion_delta(instance.student_id, course_id, delta)
 
 
-@receiver([post_save, post_delete], sender=StudentLessonProgress)
-def update_enrollment_progress(sender, instance, **kwargs):
-    
-    try:
-        enrollment = CourseEnrollment.objects.get(
-            student=instance.student,
-            course=instance.lesson.module.course
-        )
-        enrollment.calc_progress()
-    except CourseEnrollment.DoesNotExist:
-        pass
\ No newline at end of file
+@receiver(post_save, sender=StudentLessonProgress)
+def update_enrollment_progress(sender, instance, created, **kwargs):
+    was_completed = False if created else getattr(instance, '_loaded_is_completed', instance.is_completed)
+    delta = int(instance.is_completed) - int(bool(was_completed))
+    instance._loaded_is_completed = instance.is_completed
+    _apply_progress_delta(instance, delta)
+
+
+@receiver(post_delete, sender=StudentLessonProgress)
+def update_enrollment_progress_on_delete(sender, instance, **kwargs):
+    was_completed = getattr(instance, '_loaded_is_completed', instance.is_completed)
+    _apply_progress_delta(instance, -int(bool(was_completed)))
+
+
+@receiver(post_save, sender=Lesson)
+def recompute_progress_on_publish(sender, instance, created, **kwargs):
+    was_published = False if created else getattr(instance, '_loaded_is_published', instance.is_published)
+    instance._loaded_is_published = instance.is_published
+    if bool(was_published) != instance.is_published:
+        schedule_course_recompute(instance.module.course_id)
+
+
+@receiver(post_delete, sender=Lesson)
+def recompute_progress_on_delete(sender, instance, **kwargs):
+    if instance.is_published:
+        schedule_course_recompute(instance.module.course_id)
\ No newline at end of file
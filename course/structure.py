@@ -0,0 +1,84 @@
+"""
+Bulk edits of a course's structure.
+
+A teacher reshuffling a course sends one request with the new order and/or
+a list of per-item patches instead of one update per lesson or module. The
+changes are applied in one transaction with a single ``bulk_update``.
+None of the editable fields feed the structure totals (see totals.py), so
+those are left alone; a change of published state schedules one progress
+recompute for the course instead of one per lesson.
+"""
+
+from django.db import transaction
+from api.ordering import apply_order
+from .progress import schedule_course_recompute
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BulkEditError(Exception):
+    pass
+
+
+def _bulk_edit(queryset, patches, ids=None):
+    """
+    Applies ``patches`` (dicts with an ``id`` and the fields to change) and
+    the order of ``ids`` to the locked rows of ``queryset``. Returns
+    ``(items, changed, fields)``, with ``items`` the instances as they were
+    before the edit.
+    """
+    items = {item.pk: item for item in queryset.select_for_update()}
+    before = {pk: {field: getattr(item, field) for patch in patches for field in patch if field != 'id'}
+              for pk, item in items.items()}
+
+    changed = {}
+    fields = set()
+    if ids is not None:
+        try:
+            for item in apply_order(items, ids):
+                changed[item.pk] = item
+        except ValueError as e:
+            raise BulkEditError(str(e))
+        fields.add('order')
+
+    for patch in patches:
+        patch = dict(patch)
+        item = items.get(patch.pop('id'))
+        if item is None:
+            raise BulkEditError('Every id must belong to the same parent.')
+        for field, value in patch.items():
+            if getattr(item, field) != value:
+                setattr(item, field, value)
+                changed[item.pk] = item
+                fields.add(field)
+
+    if changed:
+        queryset.model._default_manager.bulk_update(list(changed.values()), sorted(fields))
+    return before, list(changed.values()), fields
+
+
+def bulk_edit_lessons(module, patches, ids=None):
+    """Bulk edit of a module's lessons. Returns the number of lessons written."""
+    with transaction.atomic():
+        before, changed, fields = _bulk_edit(module.lessons.all(), patches, ids)
+        if not changed:
+            return 0
+
+        # published lessons make up the course total used by progress
+        if 'is_published' in fields and any(before[lesson.pk].get('is_published') != lesson.is_published for lesson in changed):
+            schedule_course_recompute(module.course_id)
+
+    logger.info(f"Bulk edited {len(changed)} lessons of module {module.pk}.")
+    return len(changed)
+
+
+def bulk_edit_modules(course, patches, ids=None):
+    """Bulk edit of a course's modules. Returns the number of modules written."""
+    with transaction.atomic():
+        _, changed, _ = _bulk_edit(course.modules.all(), patches, ids)
+        if not changed:
+            return 0
+
+    logger.info(f"Bulk edited {len(changed)} modules of course {course.pk}.")
+    return len(changed)
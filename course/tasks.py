@@ -3,6 +3,7 @@ from django.utils import timezone
 from .models import Coupon , CourseEnrollment , Lesson
 from datetime import timedelta
 from .utilis import upload_to_vdocipher, get_vdocipher_video_details, delete_vdocipher_video
+from .expiry import expire_coupons, expire_enrollments, expire_module_enrollments
 
 import logging
 import os
@@ -12,66 +13,62 @@ from django.core.files.storage import default_storage
 
 @shared_task
 def check_expired_coupons():
-    # Get all active coupons
-    active_coupons = Coupon.objects.filter(is_active=True)
-    
-    for coupon in active_coupons:
-        if coupon.expiration_date and coupon.expiration_date <= timezone.now():
-            coupon.is_active = False
-            coupon.save(update_fields=['is_active'])
-    
-    return "Expired coupons checked and updated"
+    # deactivate every active coupon past its expiration date in batched UPDATEs
+    return expire_coupons()
 
 @shared_task
 def check_expired_enrollments():
-
-    # Get all active enrollments
-    active_enrollments = CourseEnrollment.objects.filter(is_active=True)
-    for enrollment in active_enrollments:
-        if enrollment.ended_date and enrollment.ended_date <= timezone.now():
-            enrollment.status = CourseEnrollment.EnrollmentStatus.EXPIRED
-            enrollment.is_active = False
-            enrollment.save(update_fields=['is_active', 'status'])
-    
-    return "Expired enrollments checked and updated"
+    # expire every active course and module enrollment past its end date in batched UPDATEs
+    return {'courses': expire_enrollments(), 'modules': expire_module_enrollments()}
 
 
 
 logger = logging.getLogger(__name__)
 
+
+def _discard_upload(temp_dir_path):
+    # Clean up the entire unique temporary directory
+    if temp_dir_path and default_storage.exists(temp_dir_path):
+        shutil.rmtree(default_storage.path(temp_dir_path))
+
+
 @shared_task(bind=True, max_retries=3, default_retry_delay=60)
 def upload_video_to_vdocipher_task(self, lesson_id, temp_video_path, video_name, temp_dir_path):
+    """
+    Sends an uploaded lesson video to VdoCipher. The file is kept until the
+    upload succeeds or the last retry fails, so every retry can send it again.
+    """
     from .models import Lesson
     try:
         lesson = Lesson.objects.get(id=lesson_id)
-        lesson.video_processing_status = Lesson.VideoProcessingStatus.QUEUED
-        lesson.save(update_fields=['video_processing_status'])
-        
-        full_video_path = default_storage.path(temp_video_path)
-        logger.info(f"Starting video upload for lesson {lesson_id} from path {full_video_path}")
-        video_id = upload_to_vdocipher(full_video_path, video_name, lesson.title)
-        
-        if video_id:
-            logger.info(f"Successfully initiated video upload for lesson {lesson_id}. VdoCipher video_id: {video_id}")
-            lesson.video_id = video_id
-            lesson.save(update_fields=['video_id'])
-        else:
-            logger.error(f"upload_to_vdocipher did not return a video_id for lesson {lesson_id}.")
-            lesson.video_processing_status = Lesson.VideoProcessingStatus.FAILED
-            lesson.save(update_fields=['video_processing_status'])
-        
     except Lesson.DoesNotExist:
         logger.error(f"Lesson with id {lesson_id} not found.")
+        _discard_upload(temp_dir_path)
+        return
+
+    lesson.video_processing_status = Lesson.VideoProcessingStatus.QUEUED
+    lesson.save(update_fields=['video_processing_status'])
+
+    full_video_path = default_storage.path(temp_video_path)
+    logger.info(f"Starting video upload for lesson {lesson_id} from path {full_video_path}")
+    try:
+        video_id = upload_to_vdocipher(full_video_path, video_name, lesson.title)
     except Exception as e:
+        if self.request.retries < self.max_retries:
+            logger.warning(f"Error uploading video for lesson {lesson_id}, retrying: {e}")
+            raise self.retry(exc=e)
         logger.error(f"Error uploading video for lesson {lesson_id}: {e}")
+        video_id = None
+
+    if video_id:
+        logger.info(f"Successfully initiated video upload for lesson {lesson_id}. VdoCipher video_id: {video_id}")
+        lesson.video_id = video_id
+        lesson.save(update_fields=['video_id'])
+    else:
+        logger.error(f"Video upload for lesson {lesson_id} failed.")
         lesson.video_processing_status = Lesson.VideoProcessingStatus.FAILED
         lesson.save(update_fields=['video_processing_status'])
-        self.retry(exc=e)
-    finally:
-        # Clean up the entire unique temporary directory
-        if temp_dir_path and default_storage.exists(temp_dir_path):
-            full_temp_dir_path = default_storage.path(temp_dir_path)
-            shutil.rmtree(full_temp_dir_path)
+    _discard_upload(temp_dir_path)
 
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=300)
@@ -85,3 +82,30 @@ def delete_video_from_vdocipher_task(self, video_id):
     except Exception as e:
         logger.error(f"Failed to delete video {video_id} from VdoCipher. Retrying... Error: {e}")
         self.retry(exc=e)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def provision_lesson_progress_task(self, lesson_id):
+    """
+    Creates the progress rows of a newly added lesson for every student with access.
+    """
+    from .provisioning import provision_lesson_students
+    try:
+        lesson = Lesson.objects.select_related('module').only('id', 'module_id', 'module__course_id').get(id=lesson_id)
+    except Lesson.DoesNotExist:
+        logger.error(f"Lesson with id {lesson_id} not found.")
+        return
+    try:
+        provision_lesson_students(lesson.id, lesson.module_id, lesson.module.course_id)
+    except Exception as e:
+        logger.error(f"Failed to provision progress rows for lesson {lesson_id}. Retrying... Error: {e}")
+        self.retry(exc=e)
+
+
+@shared_task
+def reconcile_video_statuses_task():
+    """
+    Catches up on lesson videos whose VdoCipher webhook never arrived.
+    """
+    from .video_status import reconcile_video_statuses
+    return reconcile_video_statuses()
@@ -5,23 +5,35 @@ from unittest.mock import patch
 from decimal import Decimal
 import uuid
 import os
+import json
+import base64
+import shutil
+import tempfile
+import threading
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.db.models import F
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.urls import reverse
-from userAuth.models import StudentProfile, TeacherProfile, User
+from userAuth.models import StudentProfile, TeacherProfile, TeacherStudentProfile, User
+from api.ordering import GAP
 from .models import (
     CourseCategory,
     Course,
     CourseEnrollment,
     Coupon,
     CourseModule,
+    CourseSearchIndex,
+    Entitlement,
     Lesson,
     StudentLessonProgress,
     Rating,
     CouponUsage,
+    ModuleEnrollment,
+    VideoUpload,
 )
 
 # Mock data for testing
@@ -163,51 +175,44 @@ class LessonModelTest(TestCase):
         self.course = Course.objects.create(teacher=self.teacher_profile, title="Course")
         self.module = CourseModule.objects.create(course=self.course, title="Module")
 
-    @patch('my_app_name.models.Lesson.module.update_totals')
-    def test_lesson_delete_updates_totals(self, mock_update_totals):
-        lesson = Lesson.objects.create(module=self.module, title="Lesson 1", duration=10)
+    def test_lesson_delete_updates_totals(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson = Lesson.objects.create(module=self.module, title="Lesson 1", duration=10)
         self.assertEqual(self.module.lessons.count(), 1)
         
-        lesson.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson.delete()
         
-        # Assert that the module's update_totals method was called
-        mock_update_totals.assert_called_once()
+        # the module totals are recomputed once the delete commits
+        self.module.refresh_from_db()
+        self.assertEqual(self.module.total_lessons, 0)
         self.assertEqual(self.module.lessons.count(), 0)
 
     def test_lesson_order_on_creation(self):
-        # First lesson should have order 1
+        # lessons are appended GAP apart
         lesson1 = Lesson.objects.create(module=self.module, title="Lesson 1")
-        self.assertEqual(lesson1.order, 1)
+        self.assertEqual(lesson1.order, GAP)
 
-        # Second lesson should have order 2
         lesson2 = Lesson.objects.create(module=self.module, title="Lesson 2")
-        self.assertEqual(lesson2.order, 2)
+        self.assertEqual(lesson2.order, 2 * GAP)
 
-        # Create a lesson with a specific order, it should push others down
-        lesson3 = Lesson.objects.create(module=self.module, title="Lesson 3", order=1)
+        # Create a lesson in lesson1's place, it goes before it without touching the others
+        lesson3 = Lesson.objects.create(module=self.module, title="Lesson 3", order=GAP)
         
-        # Reload lesson1 to check if its order was updated
         lesson1.refresh_from_db()
-        self.assertEqual(lesson3.order, 1)
-        self.assertEqual(lesson1.order, 2)
-        self.assertEqual(lesson2.order, 3)
+        self.assertEqual(lesson1.order, GAP)
+        self.assertEqual(list(self.module.lessons.all()), [lesson3, lesson1, lesson2])
 
     def test_lesson_order_on_update(self):
         lesson1 = Lesson.objects.create(module=self.module, title="L1", order=1)
         lesson2 = Lesson.objects.create(module=self.module, title="L2", order=2)
         lesson3 = Lesson.objects.create(module=self.module, title="L3", order=3)
         
-        # Change order of lesson3 from 3 to 1
+        # Move lesson3 into lesson1's place; the dense keys have no room, so they are rebalanced
         lesson3.order = 1
         lesson3.save()
         
-        lesson1.refresh_from_db()
-        lesson2.refresh_from_db()
-        lesson3.refresh_from_db()
-        
-        self.assertEqual(lesson3.order, 1)
-        self.assertEqual(lesson1.order, 2)
-        self.assertEqual(lesson2.order, 3)
+        self.assertEqual(list(self.module.lessons.all()), [lesson3, lesson1, lesson2])
 
 
 class APIViewTest(APITestCase):
@@ -331,4 +336,1159 @@ class APIViewTest(APITestCase):
             data,
             format='json'
         )
-        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+def create_teacher(username, phone):
+    user = User.objects.create(username=username, email=f"{username}@example.com", phone=phone, user_type=User.userType.TEACHER)
+    return user.teacher_profile
+
+def create_student(username, phone):
+    user = User.objects.create(username=username, email=f"{username}@example.com", phone=phone, user_type=User.userType.STUDENT)
+    return user.student_profile
+
+
+class ProgressEngineTest(TestCase):
+    def setUp(self):
+        self.teacher_profile = create_teacher("progress_teacher", "2000000001")
+        self.student_profile = create_student("progress_student", "2000000002")
+        # run the work queued by the fixtures so later captures only see the
+        # callbacks registered by the test itself
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course = Course.objects.create(teacher=self.teacher_profile, title="Course", description="Course")
+            self.module = CourseModule.objects.create(course=self.course, title="Module")
+            self.lesson1 = Lesson.objects.create(module=self.module, title="Lesson 1")
+            self.lesson2 = Lesson.objects.create(module=self.module, title="Lesson 2")
+            self.enrollment = CourseEnrollment.objects.create(
+                student=self.student_profile,
+                course=self.course,
+                access_type=CourseEnrollment.AccessType.FULL_ACCESS,
+            )
+
+    def _toggle(self, lesson, value):
+        progress = StudentLessonProgress.objects.get(student=self.student_profile, lesson=lesson)
+        progress.is_completed = value
+        progress.save()
+
+    def test_enrollment_starts_with_lesson_totals(self):
+        self.assertEqual(self.enrollment.total_lessons, 2)
+        self.assertEqual(self.enrollment.completed_lessons, 0)
+
+    def test_toggle_applies_delta_without_recount(self):
+        progress = StudentLessonProgress.objects.get(student=self.student_profile, lesson=self.lesson1)
+        progress.is_completed = True
+        # row update, lesson lookup, enrollment counter update
+        with self.assertNumQueries(3):
+            progress.save()
+
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.completed_lessons, 1)
+        self.assertEqual(self.enrollment.progress, Decimal('50.00'))
+
+        self._toggle(self.lesson1, False)
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.completed_lessons, 0)
+        self.assertEqual(self.enrollment.progress, Decimal('0.00'))
+
+    def test_saving_unchanged_progress_does_not_touch_enrollment(self):
+        progress = StudentLessonProgress.objects.get(student=self.student_profile, lesson=self.lesson1)
+        with self.assertNumQueries(1):
+            progress.save()
+
+    def test_unpublishing_lesson_recomputes_totals(self):
+        self._toggle(self.lesson1, True)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lesson2.is_published = False
+            self.lesson2.save()
+
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.total_lessons, 1)
+        self.assertEqual(self.enrollment.progress, Decimal('100.00'))
+        self.assertTrue(self.enrollment.is_completed)
+
+    def test_reconcile_reports_and_repairs_drift(self):
+        from .progress import reconcile_progress
+
+        self._toggle(self.lesson1, True)
+        CourseEnrollment.objects.filter(pk=self.enrollment.pk).update(completed_lessons=2, progress=100)
+
+        drift = reconcile_progress(course_ids=[self.course.id])
+        self.assertEqual(drift, [(self.enrollment.id, (2, 2), (1, 2))])
+
+        reconcile_progress(course_ids=[self.course.id], fix=True)
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.completed_lessons, 1)
+        self.assertEqual(self.enrollment.progress, Decimal('50.00'))
+        self.assertEqual(reconcile_progress(course_ids=[self.course.id]), [])
+
+
+class ExpirySweepTest(TestCase):
+    def setUp(self):
+        self.teacher_profile = create_teacher("expiry_teacher", "2000000011")
+        self.course = Course.objects.create(teacher=self.teacher_profile, title="Course", description="Course")
+        past = timezone.now() - timedelta(days=1)
+        future = timezone.now() + timedelta(days=1)
+        self.expired_coupons = [
+            Coupon.objects.create(teacher=self.teacher_profile, expiration_date=past) for _ in range(3)
+        ]
+        self.valid_coupon = Coupon.objects.create(teacher=self.teacher_profile, expiration_date=future)
+
+        self.expired_enrollment = CourseEnrollment.objects.create(
+            student=create_student("expiry_student1", "2000000012"), course=self.course, ended_date=past
+        )
+        self.valid_enrollment = CourseEnrollment.objects.create(
+            student=create_student("expiry_student2", "2000000013"), course=self.course, ended_date=future
+        )
+
+    def test_expire_coupons_in_batches(self):
+        from .expiry import expire_coupons
+
+        metrics = expire_coupons(batch_size=2)
+        self.assertEqual(metrics['scanned'], 3)
+        self.assertEqual(metrics['expired'], 3)
+        self.assertEqual(metrics['batches'], 2)
+        self.assertFalse(Coupon.objects.filter(pk__in=[c.pk for c in self.expired_coupons], is_active=True).exists())
+        self.valid_coupon.refresh_from_db()
+        self.assertTrue(self.valid_coupon.is_active)
+
+        # a second run has nothing left to do
+        self.assertEqual(expire_coupons()['scanned'], 0)
+
+    def test_expire_enrollments(self):
+        from .expiry import expire_enrollments
+
+        metrics = expire_enrollments()
+        self.assertEqual(metrics['expired'], 1)
+        self.expired_enrollment.refresh_from_db()
+        self.valid_enrollment.refresh_from_db()
+        self.assertFalse(self.expired_enrollment.is_active)
+        self.assertEqual(self.expired_enrollment.status, CourseEnrollment.EnrollmentStatus.EXPIRED)
+        self.assertTrue(self.valid_enrollment.is_active)
+
+    def test_expire_module_enrollments(self):
+        from .expiry import expire_module_enrollments
+
+        module = CourseModule.objects.create(course=self.course, title="Module")
+        expired = ModuleEnrollment.objects.create(
+            student=self.expired_enrollment.student, module=module, ended_date=timezone.now() - timedelta(days=1)
+        )
+        # the default end date is 30 days away
+        valid = ModuleEnrollment.objects.create(student=self.valid_enrollment.student, module=module)
+
+        metrics = expire_module_enrollments()
+        self.assertEqual(metrics['expired'], 1)
+        expired.refresh_from_db()
+        valid.refresh_from_db()
+        self.assertFalse(expired.is_active)
+        self.assertEqual(expired.status, ModuleEnrollment.EnrollmentStatus.EXPIRED)
+        self.assertTrue(valid.is_active)
+
+
+class CounterMaintenanceTest(TestCase):
+    def setUp(self):
+        self.teacher_profile = create_teacher("counter_teacher", "2000000021")
+        self.students = [create_student(f"counter_student{i}", f"200000003{i}") for i in range(3)]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course = Course.objects.create(teacher=self.teacher_profile, title="Course", description="Course")
+
+    def test_course_count_tracks_create_and_delete(self):
+        self.teacher_profile.refresh_from_db()
+        self.assertEqual(self.teacher_profile.number_of_courses, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.delete()
+        self.teacher_profile.refresh_from_db()
+        self.assertEqual(self.teacher_profile.number_of_courses, 0)
+
+    def test_enrollment_burst_is_coalesced_into_one_update(self):
+        # entitlements are synced in the same batch; only the counter is measured here
+        with patch('course.signals.schedule_sync'), self.captureOnCommitCallbacks() as callbacks:
+            for student in self.students:
+                CourseEnrollment.objects.create(student=student, course=self.course)
+
+        self.assertEqual(len(callbacks), 1)
+        with self.assertNumQueries(1):
+            callbacks[0]()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.total_enrollments, 3)
+
+    def test_rolled_back_savepoint_drops_its_deltas(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            CourseEnrollment.objects.create(student=self.students[0], course=self.course)
+            try:
+                with transaction.atomic():
+                    CourseEnrollment.objects.create(student=self.students[1], course=self.course)
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+            CourseEnrollment.objects.create(student=self.students[2], course=self.course)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.total_enrollments, 2)
+
+    def test_enrollment_update_does_not_count_again(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enrollment = CourseEnrollment.objects.create(student=self.students[0], course=self.course)
+            enrollment.status = CourseEnrollment.EnrollmentStatus.ACTIVE
+            enrollment.save()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.total_enrollments, 1)
+
+    def test_ratings_are_aggregated_once_and_reach_the_teacher(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Rating.objects.create(course=self.course, student=self.students[0], rating=4)
+            Rating.objects.create(course=self.course, student=self.students[1], rating=5)
+
+        self.course.refresh_from_db()
+        self.teacher_profile.refresh_from_db()
+        self.assertEqual(self.course.total_reviews, 2)
+        self.assertEqual(self.course.average_rating, Decimal('4.50'))
+        self.assertEqual(self.teacher_profile.rating, Decimal('4.50'))
+
+    def test_check_counters_reports_and_repairs_drift(self):
+        from .counters import check_counters
+
+        Course.objects.filter(pk=self.course.pk).update(total_enrollments=7)
+        TeacherProfile.objects.filter(pk=self.teacher_profile.pk).update(number_of_courses=3)
+
+        drift = check_counters()
+        self.assertIn(('course', self.course.id, 'total_enrollments', 7, 0), drift)
+        self.assertIn(('teacher', self.teacher_profile.id, 'number_of_courses', 3, 1), drift)
+
+        check_counters(fix=True)
+        self.assertEqual(check_counters(), [])
+
+
+class ProgressProvisioningTest(TestCase):
+    def setUp(self):
+        self.teacher_profile = create_teacher("provision_teacher", "2000000041")
+        self.students = [create_student(f"provision_student{i}", f"200000005{i}") for i in range(3)]
+        self.course = Course.objects.create(teacher=self.teacher_profile, title="Course", description="Course")
+        self.module = CourseModule.objects.create(course=self.course, title="Module")
+        self.other_module = CourseModule.objects.create(course=self.course, title="Other Module")
+        for student in self.students[:2]:
+            CourseEnrollment.objects.create(
+                student=student, course=self.course, access_type=CourseEnrollment.AccessType.FULL_ACCESS
+            )
+        # module-only access, plus one student who has both kinds of access
+        for student in self.students[1:]:
+            ModuleEnrollment.objects.create(
+                student=student, module=self.module, status=ModuleEnrollment.EnrollmentStatus.ACTIVE
+            )
+
+    def test_new_lesson_is_provisioned_for_every_student_with_access(self):
+        lesson = Lesson.objects.create(module=self.module, title="Lesson")
+        self.assertEqual(
+            set(StudentLessonProgress.objects.filter(lesson=lesson).values_list('student_id', flat=True)),
+            {student.id for student in self.students},
+        )
+
+        other = Lesson.objects.create(module=self.other_module, title="Other Lesson")
+        self.assertEqual(StudentLessonProgress.objects.filter(lesson=other).count(), 2)
+
+    def test_enrollment_provisions_existing_lessons_in_batches(self):
+        from .provisioning import provision_student
+
+        lessons = [Lesson.objects.create(module=self.module, title=f"Lesson {i}") for i in range(5)]
+        student = create_student("provision_late", "2000000059")
+        self.assertEqual(provision_student(student.id, course_id=self.course.id, batch_size=2), len(lessons))
+        self.assertEqual(StudentLessonProgress.objects.filter(student=student).count(), len(lessons))
+
+        # provisioning again is a no-op and reports no created rows
+        self.assertEqual(provision_student(student.id, course_id=self.course.id, batch_size=2), 0)
+        self.assertEqual(StudentLessonProgress.objects.filter(student=student).count(), len(lessons))
+
+        # only the missing rows of a partly provisioned chunk are counted
+        StudentLessonProgress.objects.filter(student=student, lesson__in=lessons[1:3]).delete()
+        self.assertEqual(provision_student(student.id, course_id=self.course.id, batch_size=2), 2)
+        self.assertEqual(StudentLessonProgress.objects.filter(student=student).count(), len(lessons))
+
+    @patch('course.tasks.provision_lesson_progress_task.delay')
+    def test_large_fan_out_is_offloaded_after_commit(self, mock_delay):
+        with self.settings(PROGRESS_PROVISION_ASYNC_THRESHOLD=2):
+            with self.captureOnCommitCallbacks(execute=True):
+                lesson = Lesson.objects.create(module=self.module, title="Lesson")
+            self.assertFalse(StudentLessonProgress.objects.filter(lesson=lesson).exists())
+        mock_delay.assert_called_once_with(str(lesson.id))
+
+        from .tasks import provision_lesson_progress_task
+        provision_lesson_progress_task.run(str(lesson.id))
+        self.assertEqual(StudentLessonProgress.objects.filter(lesson=lesson).count(), 3)
+
+
+class SparseProgressModeTest(APITestCase):
+    def setUp(self):
+        self.teacher_profile = create_teacher("sparse_teacher", "2000000061")
+        self.student_profile = create_student("sparse_student", "2000000062")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course = Course.objects.create(
+                teacher=self.teacher_profile, title="Course", description="Course", price=100
+            )
+            self.module = CourseModule.objects.create(course=self.course, title="Module", price=100)
+            self.lesson1 = Lesson.objects.create(module=self.module, title="Lesson 1")
+            self.lesson2 = Lesson.objects.create(module=self.module, title="Lesson 2")
+        self.client.force_authenticate(self.student_profile.user)
+
+    def _enroll(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return CourseEnrollment.objects.create(
+                student=self.student_profile,
+                course=self.course,
+                access_type=CourseEnrollment.AccessType.FULL_ACCESS,
+            )
+
+    def test_sparse_mode_stores_only_completions(self):
+        with self.settings(LESSON_PROGRESS_MODE='sparse'):
+            enrollment = self._enroll()
+            self.assertFalse(StudentLessonProgress.objects.filter(student=self.student_profile).exists())
+
+            url = reverse('lesson-progress', kwargs={'id': self.lesson1.id})
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertFalse(response.data['is_completed'])
+
+            response = self.client.patch(url, {'is_completed': True}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            enrollment.refresh_from_db()
+            self.assertEqual(enrollment.completed_lessons, 1)
+            self.assertEqual(enrollment.progress, Decimal('50.00'))
+            self.assertEqual(enrollment.calc_progress(), Decimal('50.00'))
+
+            response = self.client.patch(url, {'is_completed': False}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertFalse(response.data['is_completed'])
+            self.assertFalse(StudentLessonProgress.objects.filter(student=self.student_profile).exists())
+            enrollment.refresh_from_db()
+            self.assertEqual(enrollment.completed_lessons, 0)
+
+    def test_convert_between_modes(self):
+        from django.core.management import call_command
+        from io import StringIO
+
+        enrollment = self._enroll()
+        progress = StudentLessonProgress.objects.get(student=self.student_profile, lesson=self.lesson1)
+        progress.is_completed = True
+        progress.save()
+
+        call_command('convert_lesson_progress', '--to', 'sparse', stdout=StringIO())
+        self.assertEqual(
+            list(StudentLessonProgress.objects.filter(student=self.student_profile).values_list('lesson_id', flat=True)),
+            [self.lesson1.id],
+        )
+        self.assertEqual(enrollment.calc_progress(), Decimal('50.00'))
+
+        call_command('convert_lesson_progress', '--to', 'eager', stdout=StringIO())
+        self.assertEqual(StudentLessonProgress.objects.filter(student=self.student_profile).count(), 2)
+        self.assertEqual(enrollment.calc_progress(), Decimal('50.00'))
+
+
+class PlaybackCredentialsTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.teacher_profile = create_teacher("playback_teacher", "2000000071")
+        self.student_profile = create_student("playback_student", "2000000072")
+        self.course = Course.objects.create(teacher=self.teacher_profile, title="Course", description="Course")
+        self.module = CourseModule.objects.create(course=self.course, title="Module")
+        self.lessons = [
+            Lesson.objects.create(module=self.module, title=f"Lesson {i}", video_id=f"video{i}") for i in range(3)
+        ]
+
+    def _request(self, user):
+        from rest_framework.test import APIRequestFactory
+        request = APIRequestFactory().get('/')
+        request.user = user
+        return request
+
+    @patch('course.playback.genrate_otp', side_effect=lambda video_id: (f'otp-{video_id}', f'info-{video_id}'))
+    def test_detail_fetches_once_and_caches(self, mock_otp):
+        from .serializer import LessonDetailSerializer
+
+        context = {'request': self._request(self.student_profile.user)}
+        data = LessonDetailSerializer(self.lessons[0], context=context).data
+        self.assertEqual(data['otp'], 'otp-video0')
+        self.assertEqual(data['playback_info'], 'info-video0')
+        self.assertEqual(mock_otp.call_count, 1)
+
+        # served from the cache on the next request
+        LessonDetailSerializer(self.lessons[0], context={'request': self._request(self.student_profile.user)}).data
+        self.assertEqual(mock_otp.call_count, 1)
+
+        # credentials are per user
+        LessonDetailSerializer(self.lessons[0], context={'request': self._request(self.teacher_profile.user)}).data
+        self.assertEqual(mock_otp.call_count, 2)
+
+    @patch('course.playback.genrate_otp', side_effect=lambda video_id: (f'otp-{video_id}', f'info-{video_id}'))
+    def test_list_prefetches_every_lesson_once(self, mock_otp):
+        from .serializer import LessonDetailSerializer
+
+        context = {'request': self._request(self.student_profile.user)}
+        data = LessonDetailSerializer(self.lessons, many=True, context=context).data
+        self.assertEqual([item['otp'] for item in data], ['otp-video0', 'otp-video1', 'otp-video2'])
+        self.assertEqual(sorted(call.args[0] for call in mock_otp.call_args_list), ['video0', 'video1', 'video2'])
+
+    @patch('course.playback.genrate_otp', return_value=(None, None))
+    def test_failures_are_not_cached(self, mock_otp):
+        from .playback import get_playback
+
+        self.assertEqual(get_playback('video0', self.student_profile.user.pk), (None, None))
+        get_playback('video0', self.student_profile.user.pk)
+        self.assertEqual(mock_otp.call_count, 2)
+
+
+class FakeVdoCipherHandler(BaseHTTPRequestHandler):
+    # (status, body) responses served in order, the last one repeats
+    responses = []
+    requests_seen = []
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        type(self).requests_seen.append((self.command, self.path, self.headers.get('Authorization')))
+        responses = type(self).responses
+        code, body = responses.pop(0) if len(responses) > 1 else responses[0]
+        payload = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+class VdoCipherClientTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeVdoCipherHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}/api'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        FakeVdoCipherHandler.requests_seen = []
+
+    def _client(self, **kwargs):
+        from .vdocipher import VdoCipherClient
+        kwargs.setdefault('backoff_factor', 0)
+        return VdoCipherClient('secret', base_url=self.base_url, **kwargs)
+
+    def test_otp_request(self):
+        FakeVdoCipherHandler.responses = [(200, {'otp': 'abc', 'playbackInfo': 'xyz'})]
+        client = self._client()
+        self.assertEqual(client.otp('video1', ttl=300), {'otp': 'abc', 'playbackInfo': 'xyz'})
+        self.assertEqual(FakeVdoCipherHandler.requests_seen, [('POST', '/api/videos/video1/otp', 'Apisecret secret')])
+        self.assertEqual(client.metrics()['otp']['calls'], 1)
+
+    def test_retries_server_errors_and_rate_limits(self):
+        FakeVdoCipherHandler.responses = [(503, {}), (429, {}), (200, {'status': 'ready'})]
+        client = self._client(max_retries=3)
+        self.assertEqual(client.video_details('video1'), {'status': 'ready'})
+        self.assertEqual(len(FakeVdoCipherHandler.requests_seen), 3)
+
+    def test_creating_a_video_is_not_replayed(self):
+        FakeVdoCipherHandler.responses = [(503, {}), (200, {'videoId': 'video1'})]
+        client = self._client(max_retries=3)
+        with self.assertRaises(requests.exceptions.HTTPError):
+            client.create_upload('Lesson')
+        self.assertEqual(len(FakeVdoCipherHandler.requests_seen), 1)
+
+        # otp requests are safe to repeat
+        FakeVdoCipherHandler.requests_seen = []
+        FakeVdoCipherHandler.responses = [(503, {}), (200, {'otp': 'abc', 'playbackInfo': 'xyz'})]
+        self.assertEqual(client.otp('video1'), {'otp': 'abc', 'playbackInfo': 'xyz'})
+        self.assertEqual(len(FakeVdoCipherHandler.requests_seen), 2)
+
+    def test_client_errors_are_not_retried(self):
+        FakeVdoCipherHandler.responses = [(404, {'message': 'not found'})]
+        client = self._client()
+        with self.assertRaises(requests.exceptions.HTTPError):
+            client.video_details('missing')
+        self.assertEqual(len(FakeVdoCipherHandler.requests_seen), 1)
+        self.assertFalse(client.breaker.is_open)
+        self.assertEqual(client.metrics()['video_details']['errors'], 1)
+
+    def test_circuit_opens_and_recovers(self):
+        from .vdocipher import CircuitOpenError
+
+        FakeVdoCipherHandler.responses = [(500, {})]
+        client = self._client(max_retries=0, circuit_threshold=2, circuit_reset_timeout=60)
+        for _ in range(2):
+            with self.assertRaises(requests.exceptions.HTTPError):
+                client.video_details('video1')
+        self.assertTrue(client.breaker.is_open)
+
+        with self.assertRaises(CircuitOpenError):
+            client.video_details('video1')
+        self.assertEqual(len(FakeVdoCipherHandler.requests_seen), 2)
+
+        # after the cool-down a trial call closes the circuit again
+        FakeVdoCipherHandler.responses = [(200, {'status': 'ready'})]
+        client.breaker.opened_at -= 60
+        self.assertEqual(client.video_details('video1'), {'status': 'ready'})
+        self.assertFalse(client.breaker.is_open)
+
+    def test_helpers_go_through_the_shared_client(self):
+        from .utilis import genrate_otp, get_vdocipher_video_details
+
+        FakeVdoCipherHandler.responses = [(500, {})]
+        client = self._client(max_retries=0)
+        with patch('course.utilis.get_client', return_value=client):
+            self.assertEqual(genrate_otp('video1'), (None, None))
+            self.assertIsNone(get_vdocipher_video_details('video1'))
+        self.assertEqual(set(client.metrics()), {'otp', 'video_details'})
+
+
+class ResumableVideoUploadTest(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = self.settings(MEDIA_ROOT=self.media_root, VIDEO_UPLOAD_CHUNK_SIZE=4)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.teacher_profile = create_teacher("upload_teacher", "2000000081")
+        self.course = Course.objects.create(teacher=self.teacher_profile, title="Course", description="Course")
+        self.module = CourseModule.objects.create(course=self.course, title="Module")
+        self.lesson = Lesson.objects.create(module=self.module, title="Lesson")
+        self.client.force_authenticate(self.teacher_profile.user)
+        self.content = b'0123456789abcdefghij'
+
+    def _start(self, length=None, filename='lecture.mp4'):
+        metadata = 'filename ' + base64.b64encode(filename.encode()).decode()
+        return self.client.post(
+            reverse('lesson-video-upload-create', kwargs={'id': self.lesson.id}),
+            HTTP_UPLOAD_LENGTH=str(length or len(self.content)),
+            HTTP_UPLOAD_METADATA=metadata,
+        )
+
+    def _patch(self, url, offset, data):
+        return self.client.generic(
+            'PATCH', url, data, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    @patch('course.views.upload_video_to_vdocipher_task.delay')
+    def test_upload_in_pieces_and_resume(self, mock_delay):
+        response = self._start()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        url = response['Location']
+
+        response = self._patch(url, 0, self.content[:7])
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(response['Upload-Offset'], '7')
+
+        # a retried piece at a stale offset is rejected with the real offset
+        response = self._patch(url, 0, self.content[:7])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response['Upload-Offset'], '7')
+
+        response = self.client.head(url)
+        self.assertEqual(response['Upload-Offset'], '7')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self._patch(url, 7, self.content[7:])
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        upload = VideoUpload.objects.get()
+        self.assertIsNotNone(upload.completed_at)
+        with open(os.path.join(self.media_root, upload.temp_video_path), 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        mock_delay.assert_called_once_with(self.lesson.id, upload.temp_video_path, 'lecture.mp4', upload.temp_dir_path)
+
+    def test_overlapping_pieces_at_the_same_offset(self):
+        from .uploads import write_chunk
+
+        url = self._start()['Location']
+        overlapping = []
+
+        def write_while_another_arrives(upload, stream, offset):
+            # a retry of the same piece lands while the original is still writing
+            overlapping.append(self._patch(url, 0, b'X' * 7))
+            return write_chunk(upload, stream, offset)
+
+        with patch('course.views.write_chunk', side_effect=write_while_another_arrives):
+            response = self._patch(url, 0, self.content[:7])
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(overlapping[0].status_code, status.HTTP_409_CONFLICT)
+
+        # the retry after the original finished is told the real offset
+        response = self._patch(url, 0, b'X' * 7)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response['Upload-Offset'], '7')
+
+        upload = VideoUpload.objects.get()
+        with open(os.path.join(self.media_root, upload.temp_video_path), 'rb') as f:
+            self.assertEqual(f.read(), self.content[:7])
+
+    @patch('course.tasks.upload_to_vdocipher')
+    def test_upload_task_keeps_the_file_for_retries(self, mock_upload):
+        from .tasks import upload_video_to_vdocipher_task
+
+        temp_dir = 'temp_videos/retry'
+        temp_path = f'{temp_dir}/lecture.mp4'
+        os.makedirs(os.path.join(self.media_root, temp_dir))
+        with open(os.path.join(self.media_root, temp_path), 'wb') as f:
+            f.write(self.content)
+
+        seen = []
+
+        def fail_once(path, name, title):
+            seen.append(os.path.exists(path))
+            if len(seen) == 1:
+                raise ConnectionError('VdoCipher is down')
+            return 'video1'
+
+        mock_upload.side_effect = fail_once
+        upload_video_to_vdocipher_task.apply(args=(self.lesson.id, temp_path, 'lecture.mp4', temp_dir))
+        # the retry still had the file to send
+        self.assertEqual(seen, [True, True])
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.video_id, 'video1')
+        self.assertNotEqual(self.lesson.video_processing_status, Lesson.VideoProcessingStatus.FAILED)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, temp_dir)))
+
+    def test_rejects_bytes_past_declared_length(self):
+        url = self._start(length=5)['Location']
+        response = self._patch(url, 0, self.content)
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(VideoUpload.objects.get().offset, 0)
+
+    def test_rejects_unsupported_files_and_content_types(self):
+        self.assertEqual(self._start(filename='notes.txt').status_code, status.HTTP_400_BAD_REQUEST)
+
+        url = self._start()['Location']
+        response = self.client.patch(url, {'chunk': 'x'}, format='json', HTTP_UPLOAD_OFFSET='0')
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+
+class VideoStatusPipelineTest(APITestCase):
+    def setUp(self):
+        self.teacher_profile = create_teacher("status_teacher", "2000000091")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course = Course.objects.create(teacher=self.teacher_profile, title="Course", description="Course")
+            self.module = CourseModule.objects.create(course=self.course, title="Module")
+            self.lesson = Lesson.objects.create(
+                module=self.module, title="Lesson", video_id="video1",
+                video_processing_status=Lesson.VideoProcessingStatus.QUEUED,
+            )
+        self.webhook_url = reverse('vdocipher-webhook')
+
+    @patch('course.video_status.get_vdocipher_video_details')
+    def test_status_endpoint_makes_no_outbound_call(self, mock_details):
+        self.client.force_authenticate(self.teacher_profile.user)
+        response = self.client.get(reverse('check-video-status', kwargs={'lesson_id': self.lesson.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['message'], 'the video is processed')
+        mock_details.assert_not_called()
+
+    def test_webhook_marks_lesson_ready(self):
+        payload = {'event': 'video:ready', 'payload': {'id': 'video1', 'status': 'ready', 'length': 125}}
+        with self.settings(VDOCIPHER_WEBHOOK_SECRET='hook-secret'), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'{self.webhook_url}?token=hook-secret', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], 1)
+
+        self.lesson.refresh_from_db()
+        self.module.refresh_from_db()
+        self.assertEqual(self.lesson.video_processing_status, Lesson.VideoProcessingStatus.READY)
+        self.assertEqual(self.lesson.duration, 125)
+        self.assertEqual(self.module.total_duration, 125)
+
+    def test_webhook_rejects_wrong_token(self):
+        payload = {'event': 'video:ready', 'payload': {'id': 'video1', 'status': 'ready'}}
+        with self.settings(VDOCIPHER_WEBHOOK_SECRET='hook-secret'):
+            response = self.client.post(f'{self.webhook_url}?token=nope', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        with self.settings(VDOCIPHER_WEBHOOK_SECRET=''):
+            response = self.client.post(f'{self.webhook_url}?token=', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_webhook_rejects_malformed_bodies(self):
+        url = f'{self.webhook_url}?token=hook-secret'
+        with self.settings(VDOCIPHER_WEBHOOK_SECRET='hook-secret'):
+            for body in (['video1'], {'payload': 'video1'}, {'payload': {'id': 'video1', 'status': 'ready', 'length': 'long'}}):
+                response = self.client.post(url, body, format='json')
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+            response = self.client.post(
+                self.webhook_url, {'payload': {'id': 'video1'}}, format='json', HTTP_X_WEBHOOK_TOKEN='clé',
+            )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.video_processing_status, Lesson.VideoProcessingStatus.QUEUED)
+
+    @patch('course.video_status.get_vdocipher_video_details')
+    def test_reconciler_checks_every_processing_lesson(self, mock_details):
+        from .video_status import reconcile_video_statuses
+
+        failed = Lesson.objects.create(
+            module=self.module, title="Broken", video_id="video2",
+            video_processing_status=Lesson.VideoProcessingStatus.QUEUED,
+        )
+        Lesson.objects.create(module=self.module, title="Ready", video_id="video3",
+                              video_processing_status=Lesson.VideoProcessingStatus.READY)
+        statuses = {'video1': {'status': 'ready', 'length': 60}, 'video2': {'status': 'Failed'}}
+        mock_details.side_effect = statuses.get
+
+        self.assertEqual(reconcile_video_statuses(batch_size=1), 2)
+        self.assertEqual(sorted(call.args[0] for call in mock_details.call_args_list), ['video1', 'video2'])
+        self.lesson.refresh_from_db()
+        failed.refresh_from_db()
+        self.assertEqual(self.lesson.video_processing_status, Lesson.VideoProcessingStatus.READY)
+        self.assertEqual(failed.video_processing_status, Lesson.VideoProcessingStatus.FAILED)
+
+
+class OrderingKeysTest(APITestCase):
+    def setUp(self):
+        self.teacher_profile = create_teacher("order_teacher", "2000000092")
+        self.course = Course.objects.create(teacher=self.teacher_profile, title="Course", description="Course")
+        self.module = CourseModule.objects.create(course=self.course, title="Module")
+        self.lessons = [Lesson.objects.create(module=self.module, title=f"L{i}") for i in range(4)]
+
+    def _orders(self):
+        return list(Lesson.objects.filter(module=self.module).values_list('title', 'order'))
+
+    def test_insert_and_move_write_one_row(self):
+        self.assertEqual([order for _, order in self._orders()], [GAP, 2 * GAP, 3 * GAP, 4 * GAP])
+
+        lesson = Lesson.objects.create(module=self.module, title="New", order=2 * GAP)
+        self.assertEqual(lesson.order, GAP + GAP // 2)
+
+        moved = Lesson.objects.get(pk=self.lessons[0].pk)
+        moved.order = 4 * GAP
+        moved.save()
+        self.assertEqual(moved.order, 5 * GAP)
+
+        self.assertEqual(
+            self._orders(),
+            [("New", GAP + GAP // 2), ("L1", 2 * GAP), ("L2", 3 * GAP), ("L3", 4 * GAP), ("L0", 5 * GAP)],
+        )
+
+    def test_rebalances_when_neighbours_are_adjacent(self):
+        Lesson.objects.filter(pk=self.lessons[1].pk).update(order=GAP + 1)
+
+        lesson = Lesson.objects.create(module=self.module, title="New", order=GAP + 1)
+
+        self.assertEqual([title for title, _ in self._orders()], ["L0", "New", "L1", "L2", "L3"])
+        self.assertEqual([order for title, order in self._orders() if title != "New"], [GAP, 2 * GAP, 3 * GAP, 4 * GAP])
+        self.assertEqual(lesson.order, GAP + GAP // 2)
+
+    def test_update_moves_a_lesson_onto_a_taken_order(self):
+        self.client.force_authenticate(self.teacher_profile.user)
+        url = reverse('lesson-update', kwargs={'id': self.lessons[3].id})
+
+        response = self.client.patch(url, {'order': GAP}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual([title for title, _ in self._orders()], ["L3", "L0", "L1", "L2"])
+
+    def test_reorder_endpoint(self):
+        self.client.force_authenticate(self.teacher_profile.user)
+        url = reverse('lesson-reorder', kwargs={'module_id': self.module.id})
+        ids = [str(lesson.id) for lesson in reversed(self.lessons)]
+
+        response = self.client.post(url, {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([title for title, _ in self._orders()], ["L3", "L2", "L1", "L0"])
+
+        response = self.client.post(url, {'ids': ids[:2]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        other = create_teacher("order_other", "2000000093")
+        self.client.force_authenticate(other.user)
+        response = self.client.post(url, {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class StructureBulkEditTest(APITestCase):
+    def setUp(self):
+        self.teacher_profile = create_teacher("bulk_teacher", "2000000094")
+        self.student_profile = create_student("bulk_student", "2000000095")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course = Course.objects.create(teacher=self.teacher_profile, title="Course", description="Course")
+            self.modules = [CourseModule.objects.create(course=self.course, title=f"Module {i}") for i in range(3)]
+            self.module = self.modules[0]
+            self.lessons = [Lesson.objects.create(module=self.module, title=f"L{i}") for i in range(5)]
+            self.enrollment = CourseEnrollment.objects.create(
+                student=self.student_profile,
+                course=self.course,
+                access_type=CourseEnrollment.AccessType.FULL_ACCESS,
+            )
+        self.client.force_authenticate(self.teacher_profile.user)
+
+    def test_reorders_and_edits_lessons_in_one_pass(self):
+        url = reverse('lesson-bulk-update', kwargs={'module_id': self.module.id})
+        ids = [str(lesson.id) for lesson in reversed(self.lessons)]
+        patches = [
+            {'id': str(self.lessons[0].id), 'title': 'Intro'},
+            {'id': str(self.lessons[1].id), 'is_published': False},
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(url, {'ids': ids, 'lessons': patches}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], 4)  # the middle lesson keeps its key
+
+        lessons = list(self.module.lessons.all())
+        self.assertEqual([lesson.title for lesson in lessons], ['L4', 'L3', 'L2', 'L1', 'Intro'])
+        self.assertFalse(lessons[3].is_published)
+
+        # progress follows the unpublished lesson
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.total_lessons, 4)
+
+    def test_bulk_edit_is_all_or_nothing(self):
+        url = reverse('course-module-bulk-update', kwargs={'course_id': self.course.id})
+        other_course = Course.objects.create(teacher=self.teacher_profile, title="Other", description="Other")
+        stranger = CourseModule.objects.create(course=other_course, title="Elsewhere")
+
+        response = self.client.patch(url, {'modules': [
+            {'id': str(self.modules[0].id), 'title': 'Renamed'},
+            {'id': str(stranger.id), 'title': 'Stolen'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.module.refresh_from_db()
+        self.assertEqual(self.module.title, 'Module 0')
+
+        response = self.client.patch(url, {'ids': [str(module.id) for module in self.modules[1:]]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.patch(url, {'ids': [str(module.id) for module in reversed(self.modules)],
+                                           'modules': [{'id': str(self.modules[2].id), 'price': '10.00'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([module.title for module in self.course.modules.all()], ['Module 2', 'Module 1', 'Module 0'])
+        self.assertEqual(self.course.modules.first().price, Decimal('10.00'))
+
+
+class StructureTotalsTest(TestCase):
+    def setUp(self):
+        self.teacher_profile = create_teacher("totals_teacher", "2000000096")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course = Course.objects.create(teacher=self.teacher_profile, title="Course", description="Course")
+            self.module = CourseModule.objects.create(course=self.course, title="Module")
+            self.other_module = CourseModule.objects.create(course=self.course, title="Other")
+            self.lesson = Lesson.objects.create(module=self.module, title="Lesson", duration=30)
+            Lesson.objects.create(module=self.other_module, title="Lesson", duration=20)
+
+    def _totals(self):
+        self.module.refresh_from_db()
+        self.other_module.refresh_from_db()
+        self.course.refresh_from_db()
+        return (
+            (self.module.total_lessons, self.module.total_duration),
+            (self.other_module.total_lessons, self.other_module.total_duration),
+            (self.course.total_lessons, self.course.total_durations),
+        )
+
+    def test_lesson_changes_recompute_once_after_commit(self):
+        self.assertEqual(self._totals(), ((1, 30), (1, 20), (2, 50)))
+
+        with patch('course.totals.bump'), self.captureOnCommitCallbacks(execute=True) as callbacks:
+            for i in range(3):
+                Lesson.objects.create(module=self.module, title=f"New {i}", duration=10)
+        # one batch for the whole transaction, not one per lesson
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self._totals(), ((4, 60), (1, 20), (5, 80)))
+
+    def test_only_duration_and_membership_changes_count(self):
+        with patch('course.signals.schedule_totals') as mock_schedule:
+            self.lesson.title = "Renamed"
+            self.lesson.order = 5 * GAP
+            self.lesson.save()
+        mock_schedule.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lesson.module = self.other_module
+            self.lesson.save()
+        self.assertEqual(self._totals(), ((0, 0), (2, 50), (2, 50)))
+
+    def test_recompute_is_idempotent(self):
+        from .totals import recompute_totals
+
+        CourseModule.objects.filter(pk=self.module.pk).update(total_lessons=7)
+        recompute_totals([self.module.pk])
+        self.assertEqual(self._totals(), ((1, 30), (1, 20), (2, 50)))
+
+        # module and lesson aggregates, module and course rows; nothing to write
+        with self.assertNumQueries(4):
+            recompute_totals([self.module.pk])
+
+    def test_deleting_a_module_updates_its_course(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other_module.delete()
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.total_lessons, self.course.total_durations), (1, 30))
+
+
+class CatalogCacheTest(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher_profile = create_teacher("catalog_teacher", "2000000097")
+            self.course = Course.objects.create(teacher=self.teacher_profile, title="Course", description="Course")
+
+    def test_list_is_served_from_cache_until_a_write(self):
+        url = reverse('course-list')
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertIn('Last-Modified', first)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.title = "Renamed"
+            self.course.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response.data['results'][0]['title'], "Renamed")
+
+    def test_detail_follows_lesson_totals(self):
+        url = reverse('course-detail', kwargs={'course_id': self.course.id})
+        self.assertEqual(self.client.get(url).data['total_lessons'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            module = CourseModule.objects.create(course=self.course, title="Module")
+            Lesson.objects.create(module=module, title="Lesson", duration=10)
+
+        self.assertEqual(self.client.get(url).data['total_lessons'], 1)
+
+    def test_teacher_storefront_follows_new_courses(self):
+        url = reverse('teacher-profile-puplic-info', kwargs={'teacher_username': 'catalog_teacher'})
+        self.assertEqual(self.client.get(url).data['number_of_courses'], 1)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Course.objects.create(teacher=self.teacher_profile, title="Second", description="Second")
+
+        self.assertEqual(self.client.get(url).data['number_of_courses'], 2)
+
+
+class CourseSearchTest(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.url = reverse('course-search-filter')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher_profile = create_teacher("search_teacher", "2000000098")
+            self.teacher_profile.full_name = "Mona Hassan"
+            self.teacher_profile.save()
+            self.category = CourseCategory.objects.create(name="Programming")
+            self.title_match = Course.objects.create(teacher=self.teacher_profile, title="Python for beginners", description="Variables and loops")
+            self.body_match = Course.objects.create(teacher=self.teacher_profile, title="Data analysis", description="Spreadsheets, then some python")
+            self.other = Course.objects.create(teacher=self.teacher_profile, title="Algebra", description="Equations", category=self.category)
+
+    def _search(self, term):
+        response = self.client.get(self.url, {'search': term})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [course['title'] for course in response.data]
+
+    def test_ranks_title_matches_first(self):
+        self.assertEqual(self._search("python"), ["Python for beginners", "Data analysis"])
+        # words match as prefixes
+        self.assertEqual(self._search("pyth begin"), ["Python for beginners"])
+        self.assertEqual(self._search("programming"), ["Algebra"])
+        self.assertEqual(len(self._search("hassan")), 3)
+        # search syntax in the input is treated as text
+        self.assertEqual(self._search('python" OR *'), [])
+
+    def test_index_follows_edits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.title = "Python puzzles"
+            self.other.save()
+        self.assertIn("Python puzzles", self._search("python"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = "Mathematics"
+            self.category.save()
+        self.assertEqual(self._search("mathematics"), ["Python puzzles"])
+        self.assertEqual(self._search("programming"), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.title_match.delete()
+        self.assertEqual(self._search("beginners"), [])
+        self.assertEqual(CourseSearchIndex.objects.count(), 2)
+
+    def test_rebuild_matches_incremental_index(self):
+        from .search import rebuild_index
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CourseSearchIndex.objects.all().delete()
+        self.assertEqual(self._search("python"), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(rebuild_index(), 3)
+        self.assertEqual(self._search("python"), ["Python for beginners", "Data analysis"])
+
+
+class ListPaginationTest(APITestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher_profile = create_teacher("paging_teacher", "2000000099")
+        self.coupons = [Coupon.objects.create(teacher=self.teacher_profile) for _ in range(12)]
+        self.client.force_authenticate(user=self.teacher_profile.user)
+        self.url = reverse('coupon-list')
+
+    def test_page_numbers_stay_the_default(self):
+        from rest_framework.pagination import PageNumberPagination
+
+        # the coupon list never let clients pick the page size
+        response = self.client.get(self.url, {'page_size': 50})
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual(len(response.data['results']), 10)
+        # page sizes are per view, not patched onto DRF's class
+        self.assertIsNone(PageNumberPagination.page_size)
+
+    def test_cursor_walks_every_item_once(self):
+        response = self.client.get(self.url, {'pagination': 'cursor'})
+        self.assertNotIn('count', response.data)
+
+        seen = []
+        while True:
+            seen += [coupon['id'] for coupon in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        expected = Coupon.objects.filter(teacher=self.teacher_profile).order_by('-date', '-id').values_list('id', flat=True)
+        self.assertEqual(seen, [str(pk) for pk in expected])
+
+    def test_cursor_with_a_total(self):
+        response = self.client.get(self.url, {'pagination': 'cursor', 'count': 'approximate'})
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual(len(response.data['results']), 10)
+
+
+class AccessContextTest(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher_profile = create_teacher("access_teacher", "2000000100")
+            self.student_profile = create_student("access_student", "2000000101")
+            self.course = Course.objects.create(teacher=self.teacher_profile, title="Course", description="Course", price=100)
+            self.module = CourseModule.objects.create(course=self.course, title="Module", price=50)
+            self.lesson = Lesson.objects.create(module=self.module, title="Lesson")
+        self.url = reverse('lesson-detail', kwargs={'id': self.lesson.id})
+        self.client.force_authenticate(self.student_profile.user)
+
+    def _enroll(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return CourseEnrollment.objects.create(
+                student=self.student_profile, course=self.course,
+                access_type=CourseEnrollment.AccessType.FULL_ACCESS, status=CourseEnrollment.EnrollmentStatus.ACTIVE,
+            )
+
+    def _access_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        tables = ('"course_courseenrollment"', '"course_moduleenrollment"', '"course_entitlement"')
+        return response, sum(1 for query in queries if any(f'FROM {table}' in query['sql'] for table in tables))
+
+    def test_lesson_request_resolves_access_once(self):
+        self._enroll()
+
+        response, access_queries = self._access_queries()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # one entitlement lookup, shared by the permission and the view
+        self.assertEqual(access_queries, 1)
+
+        response, access_queries = self._access_queries()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(access_queries, 0)
+
+    def test_enrollment_changes_reach_the_cache(self):
+        from .expiry import expire_enrollments
+
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+        enrollment = self._enroll()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+        CourseEnrollment.objects.filter(pk=enrollment.pk).update(ended_date=timezone.now() - timedelta(days=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            expire_enrollments()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_teacher_and_unpublished_lessons(self):
+        self._enroll()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lesson.is_published = False
+            self.lesson.save()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(self.teacher_profile.user)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+
+class EntitlementTableTest(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher_profile = create_teacher("grant_teacher", "2000000102")
+            self.student_profile = create_student("grant_student", "2000000103")
+            self.relation = TeacherStudentProfile.objects.create(teacher=self.teacher_profile, student=self.student_profile)
+            self.course = Course.objects.create(teacher=self.teacher_profile, title="Course", description="Course", price=100)
+            self.module = CourseModule.objects.create(course=self.course, title="Module", price=50)
+
+    def _grants(self):
+        return set(Entitlement.objects.filter(student=self.student_profile).values_list('course_id', 'module_id'))
+
+    def test_grants_follow_enrollments_and_blocking(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enrollment = CourseEnrollment.objects.create(
+                student=self.student_profile, course=self.course, is_active=True,
+                access_type=CourseEnrollment.AccessType.FULL_ACCESS,
+            )
+            ModuleEnrollment.objects.create(
+                student=self.student_profile, module=self.module, status=ModuleEnrollment.EnrollmentStatus.ACTIVE,
+            )
+        self.assertEqual(self._grants(), {(self.course.id, None), (self.course.id, self.module.id)})
+        self.assertEqual(Entitlement.objects.get(module=None).expires_at, enrollment.ended_date)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.relation.is_active = False
+            self.relation.save(update_fields=['is_active'])
+        self.assertEqual(self._grants(), set())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.relation.is_active = True
+            self.relation.save(update_fields=['is_active'])
+            enrollment.delete()
+        self.assertEqual(self._grants(), {(self.course.id, self.module.id)})
+
+    def test_rebuild_regenerates_the_table(self):
+        from .entitlements import rebuild_entitlements
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CourseEnrollment.objects.create(
+                student=self.student_profile, course=self.course,
+                access_type=CourseEnrollment.AccessType.FULL_ACCESS,
+            )
+        Entitlement.objects.all().delete()
+        Entitlement.objects.create(student=self.student_profile, course=self.course, module=self.module)
+
+        self.assertEqual(rebuild_entitlements(), {'created': 1, 'updated': 0, 'deleted': 1})
+        self.assertEqual(self._grants(), {(self.course.id, None)})
+        self.assertEqual(rebuild_entitlements(), {'created': 0, 'updated': 0, 'deleted': 0})
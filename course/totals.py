@@ -0,0 +1,87 @@
+"""
+Module and course structure totals.
+
+``CourseModule.total_lessons`` / ``total_duration`` and
+``Course.total_lessons`` / ``total_durations`` are recomputed from the
+lessons instead of being adjusted in place, so running it twice is
+harmless. Lesson saves and deletes only mark their module dirty, and only
+when membership or duration changed. Every dirty module of a transaction
+and its course are then recomputed once, after commit, with one aggregate
+per level and one bulk UPDATE per level. A deleted module marks its course
+dirty directly, since its lessons can no longer lead to it.
+"""
+
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+from api.catalog_cache import bump
+from .deferred import defer
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def schedule_totals(module_id):
+    """Recompute the totals of ``module_id`` and its course once the transaction commits."""
+    if module_id is not None:
+        defer('structure-totals', module_id, flush=recompute_totals)
+
+
+def schedule_course_totals(course_id):
+    """Recompute the totals of ``course_id`` once the transaction commits."""
+    if course_id is not None:
+        defer('course-totals', course_id, flush=recompute_course_totals)
+
+
+def recompute_totals(module_ids):
+    """Brings the totals of the given modules and their courses in line with their lessons."""
+    from .models import Course, CourseModule, Lesson
+
+    module_ids = list(module_ids)
+    lessons = {
+        row['module_id']: row
+        for row in Lesson.objects.filter(module_id__in=module_ids)
+        .values('module_id')
+        .annotate(lessons=Count('id'), duration=Coalesce(Sum('duration'), 0))
+    }
+
+    changed = []
+    course_ids = set()
+    for module in CourseModule.objects.filter(pk__in=module_ids).only('id', 'course_id', 'total_lessons', 'total_duration'):
+        course_ids.add(module.course_id)
+        totals = lessons.get(module.id, {})
+        expected = (totals.get('lessons', 0), totals.get('duration', 0))
+        if (module.total_lessons, module.total_duration) != expected:
+            module.total_lessons, module.total_duration = expected
+            changed.append(module)
+    if changed:
+        CourseModule.objects.bulk_update(changed, ['total_lessons', 'total_duration'])
+    changed_courses = recompute_course_totals(course_ids)
+
+    logger.debug(f"Recomputed totals of {len(module_ids)} modules, {len(changed)} modules and {changed_courses} courses changed.")
+
+
+def recompute_course_totals(course_ids):
+    """Brings the totals of the given courses in line with their modules. Returns how many changed."""
+    from .models import Course, CourseModule
+
+    course_ids = set(course_ids)
+    if not course_ids:
+        return 0
+
+    modules = {
+        row['course_id']: row
+        for row in CourseModule.objects.filter(course_id__in=course_ids)
+        .values('course_id')
+        .annotate(lessons=Coalesce(Sum('total_lessons'), 0), duration=Coalesce(Sum('total_duration'), 0))
+    }
+    changed_courses = []
+    for course in Course.objects.filter(pk__in=course_ids).only('id', 'total_lessons', 'total_durations'):
+        totals = modules.get(course.id, {})
+        expected = (totals.get('lessons', 0), totals.get('duration', 0))
+        if (course.total_lessons, course.total_durations) != expected:
+            course.total_lessons, course.total_durations = expected
+            changed_courses.append(course)
+    if changed_courses:
+        Course.objects.bulk_update(changed_courses, ['total_lessons', 'total_durations'])
+        bump('courses', *(f'course:{course.id}' for course in changed_courses))
+    return len(changed_courses)
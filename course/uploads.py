@@ -0,0 +1,105 @@
+"""
+Resumable lesson video uploads.
+
+The client declares the total size up front and then PATCHes the file in
+any number of pieces, each starting at the offset the server has
+acknowledged (the tus protocol's core). Every piece is streamed from the
+request body into its final position in a single file, in
+``VIDEO_UPLOAD_CHUNK_SIZE`` reads. Memory use is bounded and nothing has to
+be assembled afterwards. Once the last byte arrives the file is handed to
+``upload_video_to_vdocipher_task``, which streams it on with a
+MultipartEncoder body. One PATCH at a time may write to an upload; a second
+one arriving meanwhile (a client retry racing a slow original) is turned
+away before it touches the file.
+"""
+
+from base64 import b64decode
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.utils.text import get_valid_filename
+import binascii
+import os
+import uuid
+
+TUS_VERSION = '1.0.0'
+ALLOWED_EXTENSIONS = ['.mp4', '.mov', '.avi', '.mkv', '.webm']
+
+
+class UploadError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def parse_metadata(header):
+    """``Upload-Metadata: filename <base64>,filetype <base64>`` -> dict."""
+    metadata = {}
+    for pair in filter(None, (item.strip() for item in (header or '').split(','))):
+        key, _, value = pair.partition(' ')
+        try:
+            metadata[key] = b64decode(value).decode() if value else ''
+        except (binascii.Error, UnicodeDecodeError):
+            raise UploadError(f'Invalid Upload-Metadata value for {key}.')
+    return metadata
+
+
+def validate_new_upload(upload_length, filename):
+    try:
+        upload_length = int(upload_length)
+    except (TypeError, ValueError):
+        raise UploadError('Upload-Length header is required.')
+    if upload_length <= 0:
+        raise UploadError('Upload-Length must be greater than 0.')
+    if upload_length > settings.VIDEO_UPLOAD_MAX_SIZE:
+        raise UploadError('Video file is too large.', status_code=413)
+
+    filename = get_valid_filename(os.path.basename(filename or ''))
+    if not filename:
+        raise UploadError('A filename is required in Upload-Metadata.')
+    if os.path.splitext(filename)[1].lower() not in ALLOWED_EXTENSIONS:
+        raise UploadError(f"Unsupported video file format. Allowed formats: {', '.join(ALLOWED_EXTENSIONS)}")
+    return upload_length, filename
+
+
+@contextmanager
+def upload_lock(upload):
+    """Holds ``upload`` for one PATCH; yields whether it was free."""
+    lock_key = f'video-upload-lock:{upload.pk}'
+    token = uuid.uuid4().hex
+    acquired = cache.add(lock_key, token, timeout=settings.VIDEO_UPLOAD_LOCK_TIMEOUT)
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def write_chunk(upload, stream, offset):
+    """
+    Streams ``stream`` into the upload file starting at ``offset`` and
+    returns the number of bytes written. Bytes past the declared length are
+    rejected.
+    """
+    path = default_storage.path(upload.temp_video_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    remaining = upload.upload_length - offset
+    chunk_size = settings.VIDEO_UPLOAD_CHUNK_SIZE
+    written = 0
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as destination:
+        destination.seek(offset)
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            if written + len(chunk) > remaining:
+                raise UploadError('Chunk exceeds the declared Upload-Length.', status_code=413)
+            destination.write(chunk)
+            written += len(chunk)
+
+        if offset + written == upload.upload_length:
+            # drop anything left over from an interrupted earlier attempt
+            destination.truncate(upload.upload_length)
+    return written
@@ -2,8 +2,9 @@ import random
 import string
 import requests
 from requests_toolbelt.multipart.encoder import MultipartEncoder
-from decouple import config
+from django.conf import settings
 from rest_framework import serializers
+from .vdocipher import get_client
 import logging
 
 def genrate_coupon_code(length=10):
@@ -14,20 +15,10 @@ def genrate_coupon_code(length=10):
 
 def genrate_otp(video_id):
     """
-    Generates an OTP for VdoCipher video playback.
+    Generates an OTP for VdoCipher video playback, valid for VDOCIPHER_OTP_TTL seconds.
     """
-    api_secret_key = config('SECRET_KEY_VED')
-    url = f"https://dev.vdocipher.com/api/videos/{video_id}/otp"
-    headers = {
-        'Authorization': f"Apisecret {api_secret_key}",
-        'Content-Type': "application/json",
-        'Accept': "application/json"
-    }
-    
     try:
-        response = requests.post(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
+        data = get_client().otp(video_id, ttl=settings.VDOCIPHER_OTP_TTL)
         return data.get('otp'), data.get('playbackInfo')
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to generate OTP for video_id {video_id}: {e}")
@@ -44,23 +35,15 @@ def upload_to_vdocipher(video_path, video_name, title):
     Initiates the upload process with VdoCipher and uploads the video file.
     Returns the video_id.
     """
-    api_secret_key = config('SECRET_KEY_VED')
-    url = "https://dev.vdocipher.com/api/videos"
-    headers = {
-        'Authorization': f"Apisecret {api_secret_key}"
-    }
-    querystring = {"title": title}
-    
+    client = get_client()
     try:
-        response = requests.put(url, headers=headers, params=querystring)
-        response.raise_for_status()
+        upload_info = client.create_upload(title)
     except requests.exceptions.RequestException as e:
         logger.error(f"VdoCipher API request failed: {e}")
         raise serializers.ValidationError(f'VdoCipher API request failed: {e}')
 
-    upload_info = response.json()
     client_payload = upload_info.get('clientPayload')
-    upload_link = client_payload.get('uploadLink')
+    upload_link = client_payload.get('uploadLink') if client_payload else None
     video_id = upload_info.get('videoId')
 
     if not all([client_payload, upload_link, video_id]):
@@ -81,8 +64,7 @@ def upload_to_vdocipher(video_path, video_name, title):
         ])
 
         try:
-            response = requests.post(upload_link, data=m, headers={'Content-Type': m.content_type})
-            response.raise_for_status()
+            client.upload_file(upload_link, m, m.content_type)
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to upload video to VdoCipher: {e}")
             raise serializers.ValidationError(f'Failed to upload video to VdoCipher: {e}')
@@ -93,17 +75,8 @@ def get_vdocipher_video_details(video_id):
     """
     Fetches video details from VdoCipher, including status and duration.
     """
-    api_secret_key = config('SECRET_KEY_VED')
-    url = f"https://dev.vdocipher.com/api/videos/{video_id}"
-    headers = {
-        'Authorization': f"Apisecret {api_secret_key}",
-        'Accept': "application/json"
-    }
-
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        return response.json()
+        return get_client().video_details(video_id)
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to get video details from VdoCipher for video_id {video_id}: {e}")
         return None
@@ -112,36 +85,24 @@ def delete_vdocipher_video(video_id):
     """
     Deletes a video from VdoCipher.
     """
-    api_secret_key = config('SECRET_KEY_VED')
-    url = "https://dev.vdocipher.com/api/videos"
-    headers = {
-        'Authorization': f"Apisecret {api_secret_key}"
-    }
-    querystring = {"videos": video_id}
-
     try:
-        response = requests.delete(url, headers=headers, params=querystring)
-        response.raise_for_status()
+        data = get_client().delete_videos(video_id)
         logger.info(f"Successfully initiated deletion for video_id {video_id} from VdoCipher.")
-        return response.json()
+        return data
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to delete video from VdoCipher for video_id {video_id}: {e}")
         return None
 
 
 def create_lesson_progress_for_access(student, course=None, module=None):
-    from .models import StudentLessonProgress, Lesson
+    from .progress import is_sparse_mode
+    from .provisioning import provision_student
 
-    lessons_qs = Lesson.objects.none()
+    if is_sparse_mode():
+        return
 
-    if course:
-        lessons_qs = Lesson.objects.filter(module__course=course)
-    
-    elif module:
-        lessons_qs = Lesson.objects.filter(module=module)
-
-    if lessons_qs.exists():
-        StudentLessonProgress.objects.bulk_create(
-            [StudentLessonProgress(student=student, lesson=lesson) for lesson in lessons_qs],
-            ignore_conflicts=True
-        )
+    provision_student(
+        student.id,
+        course_id=course.id if course else None,
+        module_id=module.id if module else None,
+    )
@@ -0,0 +1,202 @@
+"""
+Shared HTTP client for the VdoCipher API.
+
+One client keeps keep-alive connection pools for every video operation.
+Failed idempotent calls (connection errors, 429 and 5xx) are retried with
+exponential backoff, honouring ``Retry-After``. Creating a video is never
+retried once sent, as a replay could create a second one. When calls keep
+failing, a circuit breaker fails fast for a cool-down period instead of
+tying up request and worker threads on a dead upstream. Latency and error
+counts are kept per endpoint.
+"""
+
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import logging
+import requests
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+IDEMPOTENT_METHODS = frozenset({'GET', 'DELETE'})
+
+
+class VdoCipherError(requests.exceptions.RequestException):
+    pass
+
+
+class CircuitOpenError(VdoCipherError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after ``threshold`` consecutive failures. Once ``reset_timeout``
+    seconds have passed a single trial call is let through: success closes
+    the circuit, failure opens it again.
+    """
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_running:
+                raise CircuitOpenError('VdoCipher circuit is open, skipping the call')
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning(f"VdoCipher circuit opened after {self.failures} consecutive failures.")
+                self.opened_at = time.monotonic()
+
+
+class VdoCipherClient:
+    def __init__(self, api_secret, base_url='https://dev.vdocipher.com/api', timeout=(3.05, 15),
+                 max_retries=3, backoff_factor=0.5, pool_size=10,
+                 circuit_threshold=5, circuit_reset_timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(circuit_threshold, circuit_reset_timeout)
+        self._metrics = {}
+        self._metrics_lock = threading.Lock()
+
+        def api_session(methods):
+            retry = Retry(
+                total=max_retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=methods,
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            session = requests.Session()
+            session.headers.update({'Authorization': f'Apisecret {api_secret}', 'Accept': 'application/json'})
+            session.mount('http://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry))
+            session.mount('https://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry))
+            return session
+
+        # read timeouts and 5xx are only retried for idempotent methods, so
+        # creating a video (PUT) is sent once
+        self.session = api_session(IDEMPOTENT_METHODS)
+        # a replayed OTP request only issues another single-use OTP
+        self.otp_session = api_session(IDEMPOTENT_METHODS | {'POST'})
+
+        # uploads stream a file body that can't be replayed, so no retries
+        # here; the Celery task retries the whole upload instead
+        self.upload_session = requests.Session()
+        self.upload_session.mount('https://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+        self.upload_session.mount('http://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+
+    def _record(self, endpoint, elapsed, failed):
+        with self._metrics_lock:
+            stats = self._metrics.setdefault(endpoint, {'calls': 0, 'errors': 0, 'total_time': 0.0, 'max_time': 0.0})
+            stats['calls'] += 1
+            stats['errors'] += int(failed)
+            stats['total_time'] += elapsed
+            stats['max_time'] = max(stats['max_time'], elapsed)
+
+    def metrics(self):
+        """Per-endpoint ``calls``, ``errors``, ``avg_ms`` and ``max_ms``."""
+        with self._metrics_lock:
+            return {
+                endpoint: {
+                    'calls': stats['calls'],
+                    'errors': stats['errors'],
+                    'avg_ms': round(stats['total_time'] / stats['calls'] * 1000, 2),
+                    'max_ms': round(stats['max_time'] * 1000, 2),
+                }
+                for endpoint, stats in self._metrics.items()
+            }
+
+    def request(self, method, path, endpoint, session=None, **kwargs):
+        """
+        Calls ``path`` (relative to the API root, or an absolute URL) and
+        returns the response. Raises a ``requests`` exception on failure.
+        """
+        self.breaker.before_call()
+        url = path if path.startswith('http') else f'{self.base_url}/{path.lstrip("/")}'
+        kwargs.setdefault('timeout', self.timeout)
+
+        started = time.monotonic()
+        try:
+            response = (session or self.session).request(method, url, **kwargs)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            # client errors (bad video id, ...) say nothing about upstream health
+            response = getattr(e, 'response', None)
+            if response is None or response.status_code in RETRY_STATUSES:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            self._record(endpoint, time.monotonic() - started, failed=True)
+            raise
+
+        self.breaker.record_success()
+        self._record(endpoint, time.monotonic() - started, failed=False)
+        return response
+
+    def create_upload(self, title):
+        return self.request('PUT', 'videos', 'create_upload', params={'title': title}).json()
+
+    def upload_file(self, upload_link, data, content_type):
+        return self.request('POST', upload_link, 'upload_file', session=self.upload_session,
+                            data=data, headers={'Content-Type': content_type})
+
+    def video_details(self, video_id):
+        return self.request('GET', f'videos/{video_id}', 'video_details').json()
+
+    def delete_videos(self, *video_ids):
+        return self.request('DELETE', 'videos', 'delete_videos', params={'videos': ','.join(video_ids)}).json()
+
+    def otp(self, video_id, ttl=None):
+        payload = {'ttl': ttl} if ttl else {}
+        return self.request('POST', f'videos/{video_id}/otp', 'otp', session=self.otp_session, json=payload).json()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide client; the API secret is read once, on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from decouple import config
+
+                _client = VdoCipherClient(
+                    config('SECRET_KEY_VED'),
+                    base_url=settings.VDOCIPHER_API_URL,
+                    timeout=settings.VDOCIPHER_TIMEOUT,
+                    max_retries=settings.VDOCIPHER_MAX_RETRIES,
+                    pool_size=settings.VDOCIPHER_MAX_CONCURRENCY,
+                    circuit_threshold=settings.VDOCIPHER_CIRCUIT_THRESHOLD,
+                    circuit_reset_timeout=settings.VDOCIPHER_CIRCUIT_RESET_TIMEOUT,
+                )
+    return _client
@@ -0,0 +1,84 @@
+"""
+Lesson video processing status.
+
+VdoCipher reports status changes to ``VdoCipherWebhookView``. The
+``reconcile_video_statuses`` beat task catches any webhook that never
+arrived. Both go through ``apply_video_status``, so the status endpoint
+only has to read the lesson row.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from .models import Lesson
+from .utilis import get_vdocipher_video_details
+import logging
+
+logger = logging.getLogger(__name__)
+
+# VdoCipher status strings, compared lower-cased
+STATUS_MAP = {
+    'ready': Lesson.VideoProcessingStatus.READY,
+    'queued': Lesson.VideoProcessingStatus.QUEUED,
+    'processing': Lesson.VideoProcessingStatus.QUEUED,
+    'failed': Lesson.VideoProcessingStatus.FAILED,
+    'error': Lesson.VideoProcessingStatus.FAILED,
+}
+
+
+def apply_video_status(lesson, details):
+    """
+    Stores the status (and, once ready, the duration) from a VdoCipher video
+    payload. Returns True when the lesson changed.
+    """
+    new_status = STATUS_MAP.get(str(details.get('status', '')).lower())
+    if new_status is None:
+        return False
+
+    if new_status == Lesson.VideoProcessingStatus.READY:
+        duration = int(details.get('length') or 0)
+        if lesson.video_processing_status == new_status and lesson.duration == duration:
+            return False
+        lesson.duration = duration
+        lesson.video_processing_status = new_status
+        # saved through the model, not a queryset update, so the lesson
+        # signals bring module and course durations along
+        lesson.save(update_fields=['duration', 'video_processing_status'])
+        return True
+
+    if lesson.video_processing_status == new_status:
+        return False
+    lesson.video_processing_status = new_status
+    Lesson.objects.filter(pk=lesson.pk).update(video_processing_status=new_status)
+    return True
+
+
+def reconcile_video_statuses(batch_size=None):
+    """
+    Refreshes every lesson whose video is still processing. The lookups of a
+    batch run concurrently over the shared VdoCipher connection pool.
+    Returns the number of lessons updated.
+    """
+    batch_size = batch_size or settings.VIDEO_STATUS_RECONCILE_BATCH_SIZE
+    pending = (
+        Lesson.objects.filter(video_processing_status=Lesson.VideoProcessingStatus.QUEUED)
+        .exclude(video_id__isnull=True)
+        .exclude(video_id='')
+        .order_by('pk')
+    )
+
+    updated = 0
+    last_pk = None
+    with ThreadPoolExecutor(max_workers=settings.VDOCIPHER_MAX_CONCURRENCY) as executor:
+        while True:
+            batch = pending.filter(pk__gt=last_pk) if last_pk is not None else pending
+            lessons = list(batch[:batch_size])
+            if not lessons:
+                break
+            last_pk = lessons[-1].pk
+
+            for lesson, details in zip(lessons, executor.map(get_vdocipher_video_details, [l.video_id for l in lessons])):
+                if details:
+                    updated += apply_video_status(lesson, details)
+
+    logger.info(f"Reconciled video status, {updated} lessons updated.")
+    return updated
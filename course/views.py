@@ -1,4 +1,5 @@
 from django.shortcuts import get_object_or_404
+from django.http import Http404
 from numpy import generic
 from rest_framework import generics, permissions, viewsets
 from rest_framework.response import Response
@@ -6,7 +7,7 @@ from rest_framework import status
 from rest_framework.exceptions import PermissionDenied
 from .permissions import IsLessonAccessible,IsModuleAccessible,IsModuleOwner,IsCourseOwner,IsTeacher , IsStudent, CanRateCourse
 from userAuth.models import User, StudentProfile
-from .models import CourseCategory, Course, CourseEnrollment,Lesson,CourseModule , Coupon, ModuleEnrollment, Rating,CouponUsage,StudentLessonProgress
+from .models import CourseCategory, Course, CourseEnrollment,Lesson,CourseModule , Coupon, ModuleEnrollment, Rating,CouponUsage,StudentLessonProgress,VideoUpload
 from .serializer import (CourseCategorySerializer,CourseCategoryCreateSerializer, CourseSerializer,
  CourseCreateSerializer,CouponCreateSerializer,CourseModuleListSerializer,LessonDetailSerializer,
 LessonCreateUpdateSerializer,CourseModuleDetailSerializer,CourseModuleCreateSerializer,CourseEnrollmentDetailSerializer,
@@ -14,16 +15,35 @@ CourseModuleUpdateSerializer,
 CouponSerializer,StudentEnrolledCourseSerializer,
 CourseEnrollmentCreateSerializer,CouesEnrollmentSerializer, ModuleEnrollmentSerializer, ModuleEnrollmentCreateSerializer ,
  CourseRatingCreateSerializer,RatingListSerializer,EarningSerializer,CouponUsageSerialzier,
- CourseSerializerForTeacher,StudentLessonProgressSerilaizer
+ CourseSerializerForTeacher,StudentLessonProgressSerilaizer,
+ CourseModuleBulkUpdateSerializer,LessonBulkUpdateSerializer
 )
 from rest_framework.exceptions import ValidationError
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter , OrderingFilter
-from rest_framework.pagination import PageNumberPagination
-from .utilis import get_vdocipher_video_details
+from rest_framework.filters import OrderingFilter
+from api.pagination import ListPagination
+from .video_status import apply_video_status
+from .progress import is_sparse_mode
+from .uploads import TUS_VERSION, UploadError, parse_metadata, upload_lock, validate_new_upload, write_chunk
+from .tasks import upload_video_to_vdocipher_task
+from .structure import BulkEditError, bulk_edit_lessons, bulk_edit_modules
+from .search import CourseSearchFilter
+from .access import get_access
+from api.views import ReorderAPIView
+from api.catalog_cache import CachedResponseMixin
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from django.conf import settings
 from django.db import models
 from userAuth.serializer import StudentProfileSerializer , userSerializer
 from django.db import connection
+import hmac
+import io
+import logging
+
+logger = logging.getLogger(__name__)
+
 # Create your views here.
 
 class CourseCategoryCreateAPIView(generics.CreateAPIView):
@@ -65,15 +85,22 @@ class CourseCreateAPIView(generics.CreateAPIView):
     queryset = Course.objects.all()
 
 
-class CourseListAPIView(generics.ListAPIView):
+class CoursePagination(ListPagination):
+    page_size = 5
+
+
+class CouponPagination(ListPagination):
+    page_size = 10
+
+
+class CourseListAPIView(CachedResponseMixin, generics.ListAPIView):
     serializer_class = CourseSerializer
     permission_classes = [permissions.AllowAny]
-    pagination_class = PageNumberPagination
-    PageNumberPagination.page_size = 5
-    
+    pagination_class = CoursePagination
+    cursor_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
-        return Course.objects.filter(is_published=True).select_related('teacher', 'category').order_by('-created_at')
+        return Course.objects.filter(is_published=True).select_related('teacher', 'category').order_by('-created_at', '-id')
 
 class courselistteacher(generics.RetrieveAPIView):
     serializer_class = CourseSerializerForTeacher
@@ -89,7 +116,7 @@ class courselistteacher(generics.RetrieveAPIView):
         
 
 
-class CourseListForTeacherAPIView(generics.ListAPIView):
+class CourseListForTeacherAPIView(CachedResponseMixin, generics.ListAPIView):
     serializer_class = CourseSerializer
     permission_classes = [permissions.AllowAny]
 
@@ -111,9 +138,12 @@ class CourseSpacificToTeacherApiView(generics.ListAPIView):
         return Course.objects.none()
 
 
-class CourseDetailAPIView(generics.RetrieveAPIView):
+class CourseDetailAPIView(CachedResponseMixin, generics.RetrieveAPIView):
     serializer_class = CourseSerializer
     permission_classes = [permissions.AllowAny]
+
+    def get_cache_scopes(self):
+        return (f"course:{self.kwargs.get('course_id')}", 'categories')
     
     def get_object(self):
         course_id = self.kwargs.get('course_id')
@@ -179,13 +209,13 @@ class CouponCreateAPIView(generics.CreateAPIView):
 class CouponListAPIView(generics.ListAPIView):
     serializer_class =  CouponSerializer
     permission_classes = [IsTeacher]
-    pagination_class = PageNumberPagination
-    PageNumberPagination.page_size = 10
+    pagination_class = CouponPagination
+    cursor_ordering = ('-date', '-id')
     
     def get_queryset(self):
         user = self.request.user
         try:
-            return Coupon.objects.filter(teacher=user.teacher_profile).select_related('teacher').order_by('-date')
+            return Coupon.objects.filter(teacher=user.teacher_profile).select_related('teacher').order_by('-date', '-id')
         except Coupon.DoesNotExist:
             return Coupon.objects.none()
 
@@ -194,13 +224,13 @@ class CouponListAPIView(generics.ListAPIView):
 class UsedCopunListAPIView(generics.ListAPIView):
     serializer_class =  CouponUsageSerialzier
     permission_classes = [IsTeacher]
-    pagination_class = PageNumberPagination
-    PageNumberPagination.page_size = 10
+    pagination_class = CouponPagination
+    cursor_ordering = ('-used_at', '-id')
     
     def get_queryset(self):
         user = self.request.user
         try:
-            return CouponUsage.objects.filter(coupon__teacher=user.teacher_profile).select_related('coupon').order_by('-used_at')
+            return CouponUsage.objects.filter(coupon__teacher=user.teacher_profile).select_related('coupon').order_by('-used_at', '-id')
         except Coupon.DoesNotExist:
             return Coupon.objects.none()
 
@@ -266,8 +296,7 @@ class CourseEnrollmentListAPIView(generics.ListAPIView):
     
     serializer_class = CourseSerializer
     permission_classes = [IsStudent]
-    pagination_class = PageNumberPagination
-    PageNumberPagination.page_size = 5
+    pagination_class = CoursePagination
     
     def get_queryset(self):
         user = self.request.user
@@ -322,7 +351,7 @@ class CourseEnrollmentDetailView(generics.RetrieveAPIView):
     lookup_field = "id" 
 
 
-class CourseEnrollmentsPagination(PageNumberPagination):
+class CourseEnrollmentsPagination(ListPagination):
     page_size = 5
     page_size_query_param = 'page_size'
     max_page_size = 100
@@ -331,7 +360,7 @@ class TeacherCourseEnrollmentsView(generics.ListAPIView):
     serializer_class = CourseEnrollmentDetailSerializer
     permission_classes = [permissions.IsAuthenticated,IsTeacher,IsCourseOwner]
     pagination_class = CourseEnrollmentsPagination  
-    PageNumberPagination.page_size = 5
+    cursor_ordering = ('-enrollment_date', '-id')
     
     
     def get_permissions(self):
@@ -361,16 +390,15 @@ class TeacherCourseEnrollmentsView(generics.ListAPIView):
             student = get_object_or_404(User, id=student_id)
             enrollments = enrollments.filter(student=student.student_profile)
             
-        return enrollments
+        return enrollments.order_by('-enrollment_date', '-id')
     
 
-class CoursesFilterSerachAPIView(generics.ListAPIView):
+class CoursesFilterSerachAPIView(CachedResponseMixin, generics.ListAPIView):
     serializer_class = CourseSerializer
     queryset = Course.objects.filter(is_published=True).select_related('teacher', 'category').order_by('-created_at')
     permission_classes = [permissions.AllowAny]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, CourseSearchFilter, OrderingFilter]
     filterset_fields = ['category__name', 'teacher__full_name', 'is_published']
-    search_fields = ['title', 'description']
     ordering_fields = ['created_at', 'price', 'total_enrollments']
     
     
@@ -421,9 +449,10 @@ class CourseModuleDetailView(generics.RetrieveAPIView):
     permission_classes=[permissions.IsAuthenticated,IsModuleAccessible]
     
     def get_object(self):
-        module_id=self.kwargs.get('module_id')
-        module=get_object_or_404(CourseModule,id=module_id)
-        
+        # loaded by IsModuleAccessible already
+        module = get_access(self.request).module(self.kwargs.get('module_id'))
+        if module is None:
+            raise Http404
         return module
         
     def get_serializer_context(self):
@@ -466,6 +495,30 @@ class CourseModuleUpdateView(generics.UpdateAPIView):
         context['module'] = get_object_or_404(CourseModule, id=module_id)
         return context
     
+# course module reorder view
+class CourseModuleReorderView(ReorderAPIView):
+    permission_classes=[IsCourseOwner]
+    queryset = CourseModule.objects.all()
+    parent_lookup = 'course_id'
+
+# course module bulk update view
+class CourseModuleBulkUpdateView(generics.GenericAPIView):
+    """
+    PATCH: new order and/or field changes for many modules of a course at once
+    """
+    serializer_class=CourseModuleBulkUpdateSerializer
+    permission_classes=[IsCourseOwner]
+
+    def patch(self, request, *args, **kwargs):
+        course=get_object_or_404(Course,id=self.kwargs.get('course_id'))
+        serializer=self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            updated=bulk_edit_modules(course, serializer.validated_data.get('modules', []), serializer.validated_data.get('ids'))
+        except BulkEditError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'updated': updated}, status=status.HTTP_200_OK)
+
 # course module delete view
 class CourseModuleDeleteView(generics.DestroyAPIView):
     permission_classes=[IsModuleOwner]
@@ -494,8 +547,9 @@ class LessonListView(generics.ListAPIView):
     permission_classes = [IsModuleAccessible]
     
     def get_queryset(self):
-        module_id = self.kwargs.get('module_id')
-        module = get_object_or_404(CourseModule, id=module_id)       
+        module = get_access(self.request).module(self.kwargs.get('module_id'))
+        if module is None:
+            raise Http404
         user = self.request.user
 
         
@@ -518,51 +572,14 @@ class LessonDetailView(generics.RetrieveAPIView):
     lookup_field = 'id'
     
     def get_object(self):
-        # module_id = self.kwargs.get('module_id')
-        lesson_id = self.kwargs.get('id')
-        lesson = get_object_or_404(Lesson, id=lesson_id)
-        
-        module_id = lesson.module.id
-        module = get_object_or_404(CourseModule, id=module_id)
-        course = module.course
-        user = self.request.user
-        
-        # if teacher of course return the lesson
-        if (user.user_type == User.userType.TEACHER and 
-            hasattr(user, 'teacher_profile') and
-            course.teacher == user.teacher_profile):
+        # IsLessonAccessible has loaded the lesson and the student's entitlements
+        access = get_access(self.request)
+        lesson = access.lesson(self.kwargs.get('id'))
+        if lesson is None:
+            raise Http404
+        if access.can_view_lesson(lesson):
             return lesson
         
-        # if student is enrolled
-        elif (user.user_type == User.userType.STUDENT and 
-              hasattr(user, 'student_profile')):
-            
-            if ((course.is_free or course.price == 0) and 
-                course.is_published and lesson.is_published):
-                return lesson
-            
-            if ((module.is_free or module.price == 0) and 
-                module.is_published and lesson.is_published):
-                return lesson
-            
-            enrollment = CourseEnrollment.objects.filter(
-                student=user.student_profile,
-                course=course,
-                is_active=True,
-                access_type=CourseEnrollment.AccessType.FULL_ACCESS,
-            ).first()
-            
-            module_enrollment = ModuleEnrollment.objects.filter(
-                student=user.student_profile,
-                module=module,
-                is_active=True,
-                status=ModuleEnrollment.EnrollmentStatus.ACTIVE,
-            ).first()
-            
-            if ((enrollment and enrollment.access_type == CourseEnrollment.AccessType.FULL_ACCESS) or 
-                module_enrollment) and lesson.is_published:
-                return lesson
-        
         raise PermissionDenied("You don't have permission to access this lesson.")
     
 
@@ -608,6 +625,33 @@ class LessonUpdateView(generics.UpdateAPIView):
         
         return lesson
 
+# lesson reorder view
+class LessonReorderView(ReorderAPIView):
+    """
+    reorder all lessons of a module only for teacher
+    """
+    permission_classes = [IsModuleOwner]
+    queryset = Lesson.objects.all()
+    parent_lookup = 'module_id'
+
+# lesson bulk update view
+class LessonBulkUpdateView(generics.GenericAPIView):
+    """
+    new order and/or field changes for many lessons of a module at once, only for teacher
+    """
+    serializer_class = LessonBulkUpdateSerializer
+    permission_classes = [IsModuleOwner]
+
+    def patch(self, request, *args, **kwargs):
+        module = get_object_or_404(CourseModule, id=self.kwargs.get('module_id'))
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            updated = bulk_edit_lessons(module, serializer.validated_data.get('lessons', []), serializer.validated_data.get('ids'))
+        except BulkEditError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'updated': updated}, status=status.HTTP_200_OK)
+
 # lesson delete view 
     
 class LessonDeleteView(generics.DestroyAPIView):
@@ -634,12 +678,106 @@ class ModuleEnrollmentAPIView(generics.CreateAPIView):
     serializer_class = ModuleEnrollmentCreateSerializer
     permission_classes = [IsStudent]
 
+class VideoUploadCreateView(generics.GenericAPIView):
+    """
+    starts a resumable video upload for a lesson (tus-style creation)
+    """
+    permission_classes = [IsModuleOwner]
+
+    def post(self, request, *args, **kwargs):
+        lesson = get_object_or_404(Lesson, id=self.kwargs.get('id'))
+        try:
+            metadata = parse_metadata(request.headers.get('Upload-Metadata'))
+            upload_length, filename = validate_new_upload(request.headers.get('Upload-Length'), metadata.get('filename'))
+        except UploadError as e:
+            return Response({"message": str(e)}, status=e.status_code)
+
+        upload = VideoUpload.objects.create(lesson=lesson, filename=filename, upload_length=upload_length)
+        location = request.build_absolute_uri(
+            reverse('lesson-video-upload', kwargs={'id': lesson.id, 'upload_id': upload.id})
+        )
+        return Response(
+            {'upload_id': upload.id, 'offset': 0, 'upload_length': upload_length},
+            status=status.HTTP_201_CREATED,
+            headers={'Location': location, 'Upload-Offset': '0', 'Tus-Resumable': TUS_VERSION},
+        )
+
+
+class VideoUploadView(generics.GenericAPIView):
+    """
+    HEAD reports the stored offset, PATCH appends the next piece at that offset
+    """
+    permission_classes = [IsModuleOwner]
+
+    def get_upload(self):
+        return get_object_or_404(VideoUpload, id=self.kwargs.get('upload_id'), lesson_id=self.kwargs.get('id'))
+
+    def _headers(self, upload):
+        return {
+            'Upload-Offset': str(upload.offset),
+            'Upload-Length': str(upload.upload_length),
+            'Tus-Resumable': TUS_VERSION,
+            'Cache-Control': 'no-store',
+        }
+
+    def head(self, request, *args, **kwargs):
+        upload = self.get_upload()
+        return Response(status=status.HTTP_200_OK, headers=self._headers(upload))
+
+    def patch(self, request, *args, **kwargs):
+        upload = self.get_upload()
+        if request.content_type != 'application/offset+octet-stream':
+            return Response({"message": "Content-Type must be application/offset+octet-stream."}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        if upload.is_complete:
+            return Response({"message": "Upload already completed."}, status=status.HTTP_409_CONFLICT, headers=self._headers(upload))
+
+        try:
+            offset = int(request.headers.get('Upload-Offset'))
+        except (TypeError, ValueError):
+            return Response({"message": "Upload-Offset header is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        with upload_lock(upload) as locked:
+            if not locked:
+                return Response({"message": "Another request is writing to this upload."}, status=status.HTTP_409_CONFLICT, headers=self._headers(upload))
+            # the offset may have moved while the previous writer held the upload
+            upload.refresh_from_db(fields=['offset'])
+            if offset != upload.offset:
+                return Response({"message": "Upload-Offset does not match the stored offset."}, status=status.HTTP_409_CONFLICT, headers=self._headers(upload))
+
+            # read the raw body, never request.data, so nothing is buffered in memory
+            try:
+                written = write_chunk(upload, request.stream or io.BytesIO(), offset)
+            except UploadError as e:
+                return Response({"message": str(e)}, status=e.status_code, headers=self._headers(upload))
+
+            VideoUpload.objects.filter(id=upload.id).update(offset=offset + written)
+            upload.offset = offset + written
+
+        if upload.is_complete:
+            self.complete(upload)
+        return Response(status=status.HTTP_204_NO_CONTENT, headers=self._headers(upload))
+
+    def complete(self, upload):
+        upload.completed_at = timezone.now()
+        upload.save(update_fields=['completed_at'])
+        Lesson.objects.filter(id=upload.lesson_id).update(
+            video_id=None,
+            video_processing_status=Lesson.VideoProcessingStatus.PRE_UPLOAD,
+        )
+        transaction.on_commit(lambda: upload_video_to_vdocipher_task.delay(
+            upload.lesson_id, upload.temp_video_path, upload.filename, upload.temp_dir_path
+        ))
+
+
 class CheckVideoStatusAPIView(generics.GenericAPIView):
+    """
+    answers from the lesson row; the webhook and the reconciler keep it current
+    """
     permission_classes = [IsTeacher]
 
     def get(self, request, *args, **kwargs):
         lesson_id = self.kwargs.get('lesson_id')
-        lesson = get_object_or_404(Lesson, id=lesson_id)
+        lesson = get_object_or_404(Lesson.objects.only('id', 'video_id', 'video_processing_status'), id=lesson_id)
 
         if lesson.video_processing_status == Lesson.VideoProcessingStatus.FAILED:
             return Response({"message": "Video processing failed. Please try uploading again."}, status=status.HTTP_400_BAD_REQUEST)
@@ -650,28 +788,41 @@ class CheckVideoStatusAPIView(generics.GenericAPIView):
         if not lesson.video_id:
             return Response({"message": "video is uploading"}, status=status.HTTP_200_OK)
 
-        video_details = get_vdocipher_video_details(lesson.video_id)
+        return Response({"message": "the video is processed"}, status=status.HTTP_200_OK)
 
-        if not video_details:
-            return Response({"message": "Could not retrieve video status."}, status=status.HTTP_400_BAD_REQUEST)
 
-        video_status = video_details.get('status')
-
-        if video_status == 'ready':
-            lesson.duration = video_details.get('length', 0)
-            lesson.video_processing_status = Lesson.VideoProcessingStatus.READY
-            lesson.save(update_fields=['duration', 'video_processing_status'])
-            return Response({"message": "video is ready"}, status=status.HTTP_200_OK)
-        
-        elif video_status == 'Queued':
-            lesson.video_processing_status = Lesson.VideoProcessingStatus.QUEUED
-            lesson.save(update_fields=['video_processing_status'])
-            return Response({"message": "the video is processed"}, status=status.HTTP_200_OK)
-
-        elif video_status == 'pre-upload':
-            return Response({"message": "video is uploading"}, status=status.HTTP_200_OK)
+class VdoCipherWebhookView(generics.GenericAPIView):
+    """
+    receives VdoCipher video events (video:ready, video:failed, ...)
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+
+    def post(self, request, *args, **kwargs):
+        secret = settings.VDOCIPHER_WEBHOOK_SECRET
+        token = request.query_params.get('token') or request.headers.get('X-Webhook-Token') or ''
+        # compared as bytes, which also accepts non-ASCII tokens
+        if not secret or not hmac.compare_digest(token.encode(), secret.encode()):
+            return Response({"message": "Invalid webhook token."}, status=status.HTTP_403_FORBIDDEN)
+
+        data = request.data
+        payload = (data.get('payload') or {}) if isinstance(data, dict) else None
+        if not isinstance(payload, dict):
+            return Response({"message": "Malformed payload."}, status=status.HTTP_400_BAD_REQUEST)
+        video_id = payload.get('id') or payload.get('videoId')
+        if not video_id:
+            return Response({"message": "Missing video id."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            int(payload.get('length') or 0)
+        except (TypeError, ValueError):
+            return Response({"message": "Invalid video length."}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({"message": f"Video status: {video_status}"}, status=status.HTTP_200_OK)
+        updated = 0
+        for lesson in Lesson.objects.filter(video_id=video_id):
+            updated += apply_video_status(lesson, payload)
+        logger.info(f"VdoCipher webhook {data.get('event')} for video {video_id}, {updated} lessons updated.")
+        # always acknowledge so VdoCipher does not keep retrying unknown videos
+        return Response({"updated": updated}, status=status.HTTP_200_OK)
 
 # student lesson progress
 class UpdateLessonProgressView(generics.RetrieveUpdateAPIView):
@@ -680,8 +831,24 @@ class UpdateLessonProgressView(generics.RetrieveUpdateAPIView):
 
     def get_object(self):
         lesson_id = self.kwargs.get('id')
-        return get_object_or_404(
-            StudentLessonProgress,
-            student=self.request.user.student_profile,
-            lesson_id=lesson_id
-        )
+        student = self.request.user.student_profile
+        if not is_sparse_mode():
+            return get_object_or_404(
+                StudentLessonProgress,
+                student=student,
+                lesson_id=lesson_id
+            )
+        # sparse mode only stores completions, a missing row means not completed
+        progress = StudentLessonProgress.objects.filter(student=student, lesson_id=lesson_id).first()
+        if progress is None:
+            progress = StudentLessonProgress(student=student, lesson_id=lesson_id, is_completed=False)
+        return progress
+
+    def perform_update(self, serializer):
+        progress = serializer.instance
+        if is_sparse_mode() and not serializer.validated_data.get('is_completed', progress.is_completed):
+            if not progress._state.adding:
+                progress.delete()
+            progress.is_completed = False
+            return
+        serializer.save()
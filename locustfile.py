@@ -0,0 +1,105 @@
+"""
+Load test of a timed exam opening: every student logs in, starts the exam
+as soon as it opens and submits it.
+
+Seed the data first (prints the exam id and opening time):
+
+    python manage.py seed_exam_load --students 500 --opens-in 120
+
+then run locust (``pip install locust``, it is not a runtime dependency):
+
+    EXAM_ID=<id> EXAM_OPENS_AT=<iso time> locust --headless -u 500 -r 100 \
+        --host http://localhost:8000 --run-time 5m
+
+Settings come from the environment:
+
+    EXAM_ID             the assessment to start (required)
+    EXAM_OPENS_AT       ISO time the exam opens; students wait for it
+    EXAM_TEACHER        teacher username (default loadteacher)
+    EXAM_STUDENTS       number of seeded students (default 500)
+    EXAM_PASSWORD       student password (default password123)
+    MAX_FAILURE_RATIO   failed request ratio that fails the run (default 0.01)
+    MAX_P95_MS          95th percentile latency in ms that fails the run (default 2000)
+
+The run exits with status 1 when either bound is exceeded, so it can gate CI.
+"""
+
+import itertools
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+from locust import HttpUser, between, events, task
+
+EXAM_ID = os.environ.get('EXAM_ID')
+EXAM_OPENS_AT = os.environ.get('EXAM_OPENS_AT')
+TEACHER = os.environ.get('EXAM_TEACHER', 'loadteacher')
+STUDENTS = int(os.environ.get('EXAM_STUDENTS', 500))
+PASSWORD = os.environ.get('EXAM_PASSWORD', 'password123')
+MAX_FAILURE_RATIO = float(os.environ.get('MAX_FAILURE_RATIO', 0.01))
+MAX_P95_MS = float(os.environ.get('MAX_P95_MS', 2000))
+
+_students = itertools.count()
+_lock = threading.Lock()
+
+
+def _next_student():
+    with _lock:
+        return next(_students) % STUDENTS
+
+
+class ExamStudent(HttpUser):
+    wait_time = between(1, 3)
+
+    def on_start(self):
+        self.student = _next_student()
+        self.finished = False
+        self.client.post(
+            f'/api/v1/student/login/{TEACHER}/',
+            json={'email': f'{TEACHER}_student{self.student}@example.com', 'password': PASSWORD},
+            name='/api/v1/student/login/[teacher]/',
+        )
+        if EXAM_OPENS_AT:
+            # everyone starts at the same moment, as in a real exam
+            delay = datetime.fromisoformat(EXAM_OPENS_AT).timestamp() - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+    @task
+    def take_exam(self):
+        if self.finished:
+            return
+        with self.client.post(
+            f'/api/v1/student/assessments/{EXAM_ID}/{TEACHER}/start/',
+            name='/api/v1/student/assessments/[id]/[teacher]/start/',
+            catch_response=True,
+        ) as response:
+            if response.status_code != 201:
+                response.failure(f'start returned {response.status_code}: {response.text[:200]}')
+                return
+            started = response.json()
+
+        answers = [
+            {'question_id': question['id'], 'selected_option': random.choice(question['options'])['id']}
+            for question in started['assessment']['questions']
+            if question['options']
+        ]
+        self.client.patch(
+            f'/api/v1/students/attempts/{started["attempt_id"]}/submit/',
+            json={'answers': answers},
+            name='/api/v1/students/attempts/[id]/submit/',
+        )
+        self.finished = True
+
+
+@events.quitting.add_listener
+def check_bounds(environment, **kwargs):
+    total = environment.stats.total
+    if total.num_requests and total.fail_ratio > MAX_FAILURE_RATIO:
+        print(f'Failure ratio {total.fail_ratio:.2%} is above {MAX_FAILURE_RATIO:.2%}')
+        environment.process_exit_code = 1
+    elif total.get_response_time_percentile(0.95) > MAX_P95_MS:
+        print(f'95th percentile {total.get_response_time_percentile(0.95)} ms is above {MAX_P95_MS} ms')
+        environment.process_exit_code = 1
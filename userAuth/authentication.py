@@ -1,6 +1,68 @@
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import DEFAULT_DB_ALIAS
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import StudentProfile, TeacherProfile, User
+import uuid
 
+# user_type -> (profile accessor, profile model, accessor of the other type)
+PROFILES = {
+    User.userType.TEACHER: ('teacher_profile', TeacherProfile, 'student_profile'),
+    User.userType.STUDENT: ('student_profile', StudentProfile, 'teacher_profile'),
+}
+
+
+def token_for_user(user):
+    """
+    A refresh token for ``user`` whose access tokens also carry the user
+    type, username, slug and profile id, so requests can be authenticated
+    without loading the user (see ``user_from_claims``).
+    """
+    refresh = RefreshToken.for_user(user)
+    refresh['user_type'] = user.user_type
+    refresh['username'] = user.username
+    refresh['slug'] = user.slug
+    accessor = PROFILES.get(user.user_type, (None,))[0]
+    try:
+        profile = getattr(user, accessor) if accessor else None
+    except ObjectDoesNotExist:
+        profile = None
+    if profile is not None:
+        refresh['profile_id'] = str(profile.pk)
+    return refresh
+
+
+def _partial(model, **values):
+    # an instance holding only ``values``; the first read of any other
+    # field loads them all (see DeferredTogetherMixin)
+    names = [field.attname for field in model._meta.concrete_fields if field.attname in values]
+    return model.from_db(DEFAULT_DB_ALIAS, names, [values[name] for name in names])
+
+
+def user_from_claims(token):
+    """
+    The request user built from the token claims, with its profile attached,
+    without a query. Returns None for tokens issued without the claims.
+    """
+    try:
+        user_id = uuid.UUID(str(token[api_settings.USER_ID_CLAIM]))
+        user_type = token['user_type']
+    except (KeyError, ValueError):
+        return None
+
+    user = _partial(User, id=user_id, user_type=user_type, username=token.get('username'), slug=token.get('slug'))
+    profile_id = token.get('profile_id')
+    if user_type in PROFILES and profile_id:
+        accessor, model, other = PROFILES[user_type]
+        profile = _partial(model, id=uuid.UUID(profile_id), user_id=user_id)
+        model.user.field.set_cached_value(profile, user)
+        getattr(User, accessor).related.set_cached_value(user, profile)
+        # a user only ever has the profile of their own type
+        getattr(User, other).related.set_cached_value(user, None)
+    return user
 
 
 class CookieJWTAuthentication(JWTAuthentication):
@@ -13,6 +75,10 @@ class CookieJWTAuthentication(JWTAuthentication):
 
         try:
             validated_token = self.get_validated_token(raw_token)
+            if settings.JWT_STATELESS_AUTH:
+                user = user_from_claims(validated_token)
+                if user is not None:
+                    return user, validated_token
             return self.get_user(validated_token), validated_token
         except InvalidToken:
             return None
@@ -8,7 +8,20 @@ from django.db.models import Avg
 
 # Create your models here.
 
-class User(AbstractUser):
+class DeferredTogetherMixin:
+    """
+    Reading one deferred field loads every deferred field in a single query,
+    rather than one query per field. The users and profiles built from token
+    claims only hold a few fields (see authentication.py).
+    """
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = list(deferred)
+        return super().refresh_from_db(using=using, fields=fields, **kwargs)
+
+
+class User(DeferredTogetherMixin, AbstractUser):
     class userType(models.TextChoices):
         STUDENT = 'student', 'Student'
         TEACHER = 'teacher', 'Teacher'
@@ -57,7 +70,7 @@ class User(AbstractUser):
 
 
 
-class StudentProfile(models.Model):
+class StudentProfile(DeferredTogetherMixin, models.Model):
     user  = models.OneToOneField(User, on_delete=models.CASCADE, related_name='student_profile')
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False,unique=True)
     full_name = models.CharField(max_length=100, blank=True, null=True)
@@ -87,7 +100,7 @@ class StudentProfile(models.Model):
         return self.teacher_relations.all()
  
            
-class TeacherProfile(models.Model):
+class TeacherProfile(DeferredTogetherMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='teacher_profile')
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False,unique=True)
     full_name = models.CharField(max_length=100, blank=True, null=True)
@@ -156,6 +169,7 @@ class TeacherStudentProfile(models.Model):
         ordering = ['-enrollment_date']
         indexes = [
             models.Index(fields=['is_active']),
+            models.Index(fields=['teacher', '-id']),
         ]
     
     def __str__(self):
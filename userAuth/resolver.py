@@ -0,0 +1,91 @@
+"""
+Teacher resolution for the student login and refresh endpoints.
+
+Both endpoints take the teacher's username from the URL. It used to be
+resolved to the teacher's user and then to their profile on every call,
+before the teacher-student relation was read. The profile id of each
+username is now cached for ``TEACHER_RESOLVER_TTL`` seconds. The relation,
+its ``is_active`` flag, the student fields the endpoints check and, for a
+refresh, whether the refresh token is blacklisted are then read together in
+one query on the (student, teacher) unique index, so a refresh from an open
+tab costs a single query.
+
+A teacher's cached entry is dropped after commit when they are renamed or
+deleted. Callers also drop it with ``forget_teacher`` whenever a cached id
+matches no relation, so a stale entry is never trusted twice.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from course.deferred import defer
+from .models import TeacherProfile, TeacherStudentProfile, User
+
+# the student fields the login and refresh endpoints check
+RELATION_FIELDS = (
+    'is_active',
+    'student__user__is_active',
+    'student__user__user_type',
+    'student__user__refresh_token',
+)
+
+
+def _cache_key(username):
+    return f'teacher-resolver:{username}'
+
+
+def teacher_profile_id(username):
+    """The profile id of the teacher ``username``, or None; cached."""
+    key = _cache_key(username)
+    profile_id = cache.get(key)
+    if profile_id is None:
+        profile_id = TeacherProfile.objects.filter(
+            user__username=username,
+            user__user_type=User.userType.TEACHER,
+        ).values_list('id', flat=True).first()
+        if profile_id is not None:
+            cache.set(key, profile_id, timeout=settings.TEACHER_RESOLVER_TTL)
+    return profile_id
+
+
+def _forget(usernames):
+    cache.delete_many([_cache_key(username) for username in usernames])
+
+
+def forget_teacher(username):
+    """Drop the cached profile id of ``username`` once the transaction commits."""
+    defer('teacher-resolver', username, flush=_forget)
+
+
+def _blacklisted(jti):
+    return BlacklistedToken.objects.filter(token__jti=jti)
+
+
+def is_blacklisted(jti):
+    return _blacklisted(jti).exists()
+
+
+class StudentRefreshToken(RefreshToken):
+    """A refresh token whose blacklist check is left to ``student_relation``."""
+
+    def check_blacklist(self):
+        pass
+
+
+def student_relation(student_user_id, teacher_id, jti=None):
+    """
+    The relation of the student ``student_user_id`` with the teacher profile
+    ``teacher_id`` as a dict of ``RELATION_FIELDS``, or None. Given a
+    refresh token's ``jti`` it also says whether the token is blacklisted.
+    """
+    relations = TeacherStudentProfile.objects.filter(
+        student__user_id=student_user_id,
+        teacher_id=teacher_id,
+    ).order_by()
+    fields = list(RELATION_FIELDS)
+    if jti is not None:
+        relations = relations.annotate(blacklisted=Exists(_blacklisted(jti)))
+        fields.append('blacklisted')
+    return relations.values(*fields).first()
@@ -6,6 +6,7 @@ from course.models import Course
 from .utilis import generate_otp, send_otp_email
 from datetime import timedelta
 from django.utils import timezone
+from api.serializers import RenditionsField, RenditionsListSerializer
 
 class RegisterSerializer(serializers.ModelSerializer):
     password1 = serializers.CharField(write_only=True,required=True,validators=[validate_password])
@@ -138,10 +139,14 @@ class UserInfoSerializer(serializers.ModelSerializer):
  
 
 class userSerializer(serializers.ModelSerializer):
+    avatar_renditions = RenditionsField('avatar')
+    logo_renditions = RenditionsField('logo')
+
     class Meta:
         model = User
-        fields = ['id','first_name', 'last_name', 'email','username' ,'slug', 'phone', 'parent_phone' ,'user_type', 'avatar', 'logo', 'is_active', 'created_at', 'last_login']
+        fields = ['id','first_name', 'last_name', 'email','username' ,'slug', 'phone', 'parent_phone' ,'user_type', 'avatar', 'avatar_renditions', 'logo', 'logo_renditions', 'is_active', 'created_at', 'last_login']
         read_only_fields =  fields
+        list_serializer_class = RenditionsListSerializer
 
 
 class StudentProfileSerializer(serializers.ModelSerializer):
@@ -152,6 +157,7 @@ class StudentProfileSerializer(serializers.ModelSerializer):
         model = StudentProfile
         fields = ['user', 'id', 'full_name', 'bio', 'profile_picture',  'date_of_birth', 'address', 'country', 'city', 'gender']
         read_only_fields = ['user', 'id', ]
+        list_serializer_class = RenditionsListSerializer
 
             
         
@@ -185,6 +191,7 @@ class GetStudentRelatedToTeacherSerializer(serializers.ModelSerializer):
     class Meta:
         model = TeacherStudentProfile
         fields = "__all__"
+        list_serializer_class = RenditionsListSerializer
 
 
 class LoginSerializer(serializers.Serializer):
@@ -230,6 +237,7 @@ class TeacherStudentProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = TeacherStudentProfile
         fields = ['id', 'student' ,'enrollment_date', 'notes', 'is_active',  'completed_lessons', 'last_activity', 'number_of_completed_courses','number_of_enrollment_courses']
+        list_serializer_class = RenditionsListSerializer
 
     def get_number_of_enrollment_courses(self, obj):
         # Check if the value was annotated by the view
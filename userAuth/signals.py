@@ -1,6 +1,7 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
 from .models import User, StudentProfile, TeacherProfile
+from .resolver import forget_teacher
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -9,5 +10,24 @@ def create_user_profile(sender, instance, created, **kwargs):
             StudentProfile.objects.create(user=instance)
         elif instance.user_type == User.userType.TEACHER:
             TeacherProfile.objects.create(user=instance)
-            
-            
+
+
+@receiver(post_init, sender=User)
+def remember_username(sender, instance, **kwargs):
+    # read from __dict__ so a deferred username is not loaded
+    instance._loaded_username = instance.__dict__.get('username')
+
+
+@receiver(post_save, sender=User)
+def forget_renamed_teacher(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    previous = getattr(instance, '_loaded_username', None)
+    if previous and previous != instance.username:
+        forget_teacher(previous)
+    instance._loaded_username = instance.username
+
+
+@receiver(post_delete, sender=User)
+def forget_deleted_teacher(sender, instance, **kwargs):
+    forget_teacher(instance.username)
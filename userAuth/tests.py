@@ -1,7 +1,10 @@
+from django.core.cache import cache
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APITestCase
-from .models import User
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import CookieJWTAuthentication, token_for_user
+from .models import TeacherStudentProfile, User
 
 
 class RegisterAPIViewTestCase(APITestCase):
@@ -586,3 +589,140 @@ class RemoveStudentAPIViewTestCase(APITestCase):
         url = reverse('teacher-student-remove', kwargs={'student_id': self.student_user.id})
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class StatelessJWTAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        self.teacher_user = User.objects.create_user(
+            email='teacher@example.com',
+            username='teacheruser',
+            password='teacherpassword',
+            user_type='teacher',
+            phone='1000000000'
+        )
+        self.factory = APIRequestFactory()
+
+    def _request(self, token):
+        request = self.factory.get('/')
+        request.COOKIES['access_token'] = str(token)
+        return request
+
+    def test_authenticates_from_claims_without_queries(self):
+        """
+        Ensure the user and their profile come from the token claims.
+        """
+        token = token_for_user(self.teacher_user).access_token
+        with self.assertNumQueries(0):
+            user, _ = CookieJWTAuthentication().authenticate(self._request(token))
+            self.assertEqual(user.pk, self.teacher_user.pk)
+            self.assertEqual(user.user_type, User.userType.TEACHER)
+            self.assertEqual(user.slug, self.teacher_user.slug)
+            self.assertEqual(user.teacher_profile.pk, self.teacher_user.teacher_profile.pk)
+            self.assertIs(user.teacher_profile.user, user)
+            self.assertFalse(hasattr(user, 'student_profile'))
+
+    def test_other_fields_load_in_one_query(self):
+        """
+        Ensure reading a field missing from the claims loads the rest with it.
+        """
+        token = token_for_user(self.teacher_user).access_token
+        user, _ = CookieJWTAuthentication().authenticate(self._request(token))
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, self.teacher_user.email)
+            self.assertEqual(user.phone, self.teacher_user.phone)
+            self.assertTrue(user.is_active)
+
+    def test_token_without_claims_loads_user(self):
+        """
+        Ensure tokens issued before the claims were added still authenticate.
+        """
+        token = RefreshToken.for_user(self.teacher_user).access_token
+        with self.assertNumQueries(1):
+            user, _ = CookieJWTAuthentication().authenticate(self._request(token))
+        self.assertEqual(user.email, self.teacher_user.email)
+
+    def test_cookie_request_end_to_end(self):
+        """
+        Ensure views work with the claims user.
+        """
+        self.client.cookies['access_token'] = str(token_for_user(self.teacher_user).access_token)
+        response = self.client.get(reverse('teacher-profile'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['user']['username'], self.teacher_user.username)
+
+
+class StudentRefreshQueryTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher_user = User.objects.create_user(
+                email='teacher@example.com',
+                username='teacheruser',
+                password='teacherpassword',
+                user_type='teacher',
+                phone='1000000000'
+            )
+            self.students = []
+            for i in range(5):
+                student = User.objects.create_user(
+                    email=f'student{i}@example.com',
+                    username=f'studentuser{i}',
+                    password='studentpassword',
+                    user_type='student',
+                    phone=f'100000001{i}'
+                )
+                TeacherStudentProfile.objects.create(
+                    teacher=self.teacher_user.teacher_profile,
+                    student=student.student_profile,
+                )
+                student.refresh_token = str(token_for_user(student))
+                student.save(update_fields=['refresh_token'])
+                self.students.append(student)
+        self.url = reverse('student-refresh', kwargs={'teacher_username': self.teacher_user.username})
+
+    def _refresh(self, student):
+        self.client.cookies['refresh_token'] = student.refresh_token
+        return self.client.post(self.url)
+
+    def test_each_refresh_runs_one_query(self):
+        """
+        Ensure a refresh costs one query once the teacher is resolved.
+        """
+        self.assertEqual(self._refresh(self.students[0]).status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(len(self.students)):
+            for student in self.students:
+                response = self._refresh(student)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertIn('access_token', response.cookies)
+
+    def test_blocked_student_is_refused(self):
+        """
+        Ensure the relation's is_active flag is still checked.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            TeacherStudentProfile.objects.filter(student=self.students[0].student_profile).update(is_active=False)
+        response = self._refresh(self.students[0])
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_renamed_teacher_is_resolved_again(self):
+        """
+        Ensure the old username stops resolving once the teacher is renamed.
+        """
+        self.assertEqual(self._refresh(self.students[0]).status_code, status.HTTP_200_OK)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher_user.username = 'renamedteacher'
+            self.teacher_user.save()
+        self.assertEqual(self._refresh(self.students[0]).status_code, status.HTTP_404_NOT_FOUND)
+        url = reverse('student-refresh', kwargs={'teacher_username': 'renamedteacher'})
+        self.client.cookies['refresh_token'] = self.students[0].refresh_token
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_200_OK)
+
+    def test_blacklisted_token_is_refused(self):
+        """
+        Ensure a logged-out refresh token is refused within the same query.
+        """
+        RefreshToken(self.students[0].refresh_token).blacklist()
+        self._refresh(self.students[1])
+        with self.assertNumQueries(1):
+            response = self._refresh(self.students[0])
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
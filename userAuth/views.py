@@ -11,14 +11,17 @@ LoginSerializer,UserInfoSerializer,ChangePasswordSerializer,RequestPasswordReset
 
 )
 from .models import User , StudentProfile , TeacherProfile, TeacherStudentProfile
+from .authentication import token_for_user
+from .resolver import StudentRefreshToken, forget_teacher, is_blacklisted, student_relation, teacher_profile_id
 from course.permissions import IsStudent , IsTeacher
+from api.catalog_cache import CachedResponseMixin
 from django.db.models import Count, Q
 from rest_framework.views import APIView
-from rest_framework.pagination import PageNumberPagination
+from api.pagination import ListPagination
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from rest_framework_simplejwt.exceptions import TokenError
 from django.contrib.auth import authenticate
-from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter , OrderingFilter
 from django.conf import settings # Import settings
@@ -158,7 +161,7 @@ class GetStudentProfileAPIView(generics.RetrieveAPIView):
         self.check_object_permissions(self.request, obj)
         return obj
 
-class BasePagination(PageNumberPagination):
+class BasePagination(ListPagination):
     page_size = 5
 
 
@@ -166,6 +169,7 @@ class GetSudentRelatedToTeacherAPIView(generics.ListAPIView):
     serializer_class = GetStudentRelatedToTeacherSerializer
     permission_classes = [IsTeacher]
     pagination_class = BasePagination
+    cursor_ordering = ('-id',)
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['is_active',]
     ordering_fields = ['enrollment_date ', 'student__full_name']
@@ -234,10 +238,11 @@ class GetTeacherProfileAPIView(generics.RetrieveAPIView):
         return obj
 
 
-class PublicTeacherInfo(generics.RetrieveAPIView):
+class PublicTeacherInfo(CachedResponseMixin, generics.RetrieveAPIView):
     serializer_class = TeacherProfileSerializer
     permission_classes = [AllowAny]
     queryset = TeacherProfile.objects.all()
+    cache_scopes = ('teachers',)
 
     def get_object(self):
         
@@ -344,7 +349,7 @@ class LoginView(APIView):
             user=authenticate(username=email,password=password)
             
             if user is not None and user.user_type != User.userType.STUDENT:
-                refresh=RefreshToken.for_user(user)
+                refresh=token_for_user(user)
                 access_token=str(refresh.access_token)
                 refresh_token=str(refresh)
                 
@@ -396,12 +401,8 @@ class LoginStudentAPIView(APIView):
         password = validated_data.get('password')
 
         # Validate teacher exists first
-        try:
-            teacher_user = User.objects.select_related('teacher_profile').get(
-                username=teacher_username, 
-                user_type=User.userType.TEACHER
-            )
-        except User.DoesNotExist:
+        teacher_id = teacher_profile_id(teacher_username)
+        if teacher_id is None:
             return Response(
                 {"error": "Teacher not found."}, 
                 status=status.HTTP_404_NOT_FOUND
@@ -422,34 +423,30 @@ class LoginStudentAPIView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # Check if student profile exists
-        if not hasattr(user, 'student_profile') or user.student_profile is None:
-            return Response(
-                {"error": "Student profile not found."}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
         # Check teacher-student relationship
-        try:
-            relation = TeacherStudentProfile.objects.select_related('student', 'teacher').get(
-                student=user.student_profile,
-                teacher=teacher_user.teacher_profile
-            )
-        except TeacherStudentProfile.DoesNotExist:
+        relation = student_relation(user.pk, teacher_id)
+        if relation is None:
+            forget_teacher(teacher_username)
+            # Check if student profile exists
+            if not StudentProfile.objects.filter(user=user).exists():
+                return Response(
+                    {"error": "Student profile not found."}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             return Response(
                 {"error": f"You are not registered as a student for {teacher_username}."}, 
                 status=status.HTTP_403_FORBIDDEN
             )
 
         # Check if student is active (not blocked)
-        if not relation.is_active:
+        if not relation['is_active']:
             return Response(
                 {"error": "You are blocked by the teacher."}, 
                 status=status.HTTP_403_FORBIDDEN
             )
 
         # Generate tokens
-        refresh = RefreshToken.for_user(user)
+        refresh = token_for_user(user)
         access_token = str(refresh.access_token)
         refresh_token = str(refresh)
 
@@ -527,6 +524,8 @@ class CookieTokenRefreshView(APIView):
             if user_id:
                 try:
                     user = User.objects.get(id=user_id)
+                    if not user.is_active:
+                        return Response({'error': 'User is inactive'}, status=status.HTTP_401_UNAUTHORIZED)
                     if user.user_type == User.userType.STUDENT:
                         return Response({'error': 'Students must use the student refresh endpoint.'}, 
                                       status=status.HTTP_403_FORBIDDEN)
@@ -557,14 +556,12 @@ class StudentRefreshView(APIView):
             return Response({'error': 'Refresh token not found'}, status=status.HTTP_401_UNAUTHORIZED)
         
         # Validate teacher_username first
-        try:
-            teacher = get_object_or_404(User, username=teacher_username, user_type=User.userType.TEACHER)
-            teacher_profile = get_object_or_404(TeacherProfile, user=teacher)
-        except (User.DoesNotExist, TeacherProfile.DoesNotExist):
+        teacher_id = teacher_profile_id(teacher_username)
+        if teacher_id is None:
             return Response({'error': 'Invalid teacher specified.'}, status=status.HTTP_404_NOT_FOUND)
         
         try:
-            refresh = RefreshToken(refresh_token)
+            refresh = StudentRefreshToken(refresh_token)
             access_token = str(refresh.access_token)
             
             # Get user from refresh token
@@ -572,38 +569,45 @@ class StudentRefreshView(APIView):
             if not user_id:
                 return Response({'error': 'Invalid refresh token'}, status=status.HTTP_401_UNAUTHORIZED)
             
-            try:
-                user = User.objects.get(id=user_id)
-            except User.DoesNotExist:
-                return Response({'error': 'Invalid refresh token'}, status=status.HTTP_401_UNAUTHORIZED)
+            # the relation, the student's user and the blacklist in one query
+            jti = refresh[jwt_settings.JTI_CLAIM]
+            relation = student_relation(user_id, teacher_id, jti=jti)
+            blacklisted = is_blacklisted(jti) if relation is None else relation['blacklisted']
+            if blacklisted:
+                return Response({'error': 'Invalid or expired refresh token'}, status=status.HTTP_401_UNAUTHORIZED)
+
+            if relation is None:
+                forget_teacher(teacher_username)
+                user = User.objects.filter(id=user_id).values('is_active', 'user_type', 'refresh_token').first()
+                if user is None:
+                    return Response({'error': 'Invalid refresh token'}, status=status.HTTP_401_UNAUTHORIZED)
+            else:
+                user = {field: relation[f'student__user__{field}'] for field in ('is_active', 'user_type', 'refresh_token')}
             
+            if not user['is_active']:
+                return Response({'error': 'User is inactive'}, status=status.HTTP_401_UNAUTHORIZED)
+
             # Verify user is a student
-            if user.user_type != User.userType.STUDENT:
+            if user['user_type'] != User.userType.STUDENT:
                 return Response({'error': 'This endpoint is only for students.'}, status=status.HTTP_403_FORBIDDEN)
             
             # Verify refresh token matches user's stored token
-            if hasattr(user, 'refresh_token') and refresh_token != user.refresh_token:
+            if refresh_token != user['refresh_token']:
                 res = Response({'error': 'Invalid session. Please log in again.'}, status=status.HTTP_401_UNAUTHORIZED)
                 res.delete_cookie('access_token')
                 res.delete_cookie('refresh_token')
                 return res
             
             # Check student-teacher relationship
-            if hasattr(user, 'student_profile'):
-                student_profile = user.student_profile
-                relation = TeacherStudentProfile.objects.select_related('student', 'teacher').filter(
-                    student=student_profile, teacher=teacher_profile
-                ).first()
-                
-                if not relation:
-                    return Response({'error': 'You are not registered as a student for this teacher.'}, 
-                                  status=status.HTTP_403_FORBIDDEN)
-                
-                if not relation.is_active:
-                    return Response({'error': 'You are blocked by the teacher.'}, 
-                                  status=status.HTTP_403_FORBIDDEN)
-            else:
-                return Response({'error': 'Student profile not found.'}, status=status.HTTP_404_NOT_FOUND)
+            if relation is None:
+                if not StudentProfile.objects.filter(user_id=user_id).exists():
+                    return Response({'error': 'Student profile not found.'}, status=status.HTTP_404_NOT_FOUND)
+                return Response({'error': 'You are not registered as a student for this teacher.'}, 
+                              status=status.HTTP_403_FORBIDDEN)
+            
+            if not relation['is_active']:
+                return Response({'error': 'You are blocked by the teacher.'}, 
+                              status=status.HTTP_403_FORBIDDEN)
                 
         except TokenError:
             return Response({'error': 'Invalid or expired refresh token'}, status=status.HTTP_401_UNAUTHORIZED)